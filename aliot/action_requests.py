@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import heapq
+from concurrent.futures import Future
+from threading import BoundedSemaphore, Condition, Thread
+from time import monotonic
+from typing import Any, Optional
+from uuid import uuid4
+
+
+class ActionTimeoutError(TimeoutError):
+    pass
+
+
+class ActionRequests:
+    """
+    Actions sent with `send_action` that wait for their result, correlated by request id.
+
+    Each request gets a future, resolved when the `receive_action_done` event with its request id arrives,
+    or failed with an ActionTimeoutError after its timeout. At most `max_in_flight` requests wait for their
+    result at once (`0` for no limit): `open` blocks until one of them is done. The timeouts of every request
+    are handled by a single thread.
+    """
+
+    def __init__(self, max_in_flight: int = 100, timeout: Optional[float] = 30.0):
+        self.__window = BoundedSemaphore(max_in_flight) if max_in_flight > 0 else None
+        self.__timeout = timeout
+        self.__pending: dict[str, Future] = {}
+        self.__deadlines: list[tuple[float, str]] = []
+        self.__cond = Condition()
+        self.__sweeper: Optional[Thread] = None
+
+    # ################################# Properties ################################# #
+
+    @property
+    def in_flight(self) -> int:
+        return len(self.__pending)
+
+    # ################################# Public methods ################################# #
+
+    def open(self, timeout: Optional[float] = None) -> tuple[str, Future]:
+        """
+        Returns a new request id and the future of its result. When the window is full, waits up to `timeout`
+        seconds for a slot, then returns an already failed future.
+
+        :param timeout: seconds to wait for the result (the default timeout if None)
+        """
+        timeout = self.__timeout if timeout is None else timeout
+        request_id = uuid4().hex
+        future = Future()
+        if self.__window is not None and not self.__window.acquire(timeout=timeout):
+            future.set_exception(ActionTimeoutError("Too many actions waiting for their result"))
+            return request_id, future
+        future.set_running_or_notify_cancel()
+
+        with self.__cond:
+            self.__pending[request_id] = future
+            if timeout is not None:
+                heapq.heappush(self.__deadlines, (monotonic() + timeout, request_id))
+                if self.__sweeper is None:
+                    self.__sweeper = Thread(target=self.__sweep, name="aliot-action-timeouts", daemon=True)
+                    self.__sweeper.start()
+                self.__cond.notify()
+        return request_id, future
+
+    def resolve(self, request_id: str, value: Any) -> bool:
+        """Sets the result of a request. Returns False if the request is unknown or already done"""
+        future = self.__pop(request_id)
+        if future is None:
+            return False
+        future.set_result(value)
+        return True
+
+    def fail(self, request_id: str, exception: BaseException) -> bool:
+        future = self.__pop(request_id)
+        if future is None:
+            return False
+        future.set_exception(exception)
+        return True
+
+    def fail_all(self, exception: BaseException):
+        """Fails every pending request (when the connection is lost, their results will never arrive)"""
+        with self.__cond:
+            request_ids = list(self.__pending)
+        for request_id in request_ids:
+            self.fail(request_id, exception)
+
+    # ################################# Private methods ################################# #
+
+    def __pop(self, request_id: str) -> Optional[Future]:
+        with self.__cond:
+            future = self.__pending.pop(request_id, None)
+        if future is not None and self.__window is not None:
+            self.__window.release()
+        return future
+
+    def __sweep(self):
+        while True:
+            with self.__cond:
+                # Deadlines of the requests already done are skipped lazily
+                while self.__deadlines and self.__deadlines[0][1] not in self.__pending:
+                    heapq.heappop(self.__deadlines)
+                if not self.__deadlines:
+                    self.__cond.wait()
+                    continue
+                deadline, request_id = self.__deadlines[0]
+                remaining = deadline - monotonic()
+                if remaining > 0:
+                    self.__cond.wait(remaining)
+                    continue
+                heapq.heappop(self.__deadlines)
+            self.fail(request_id, ActionTimeoutError(f"No result received for the request {request_id!r}"))
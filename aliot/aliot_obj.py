@@ -1,148 +1,138 @@
 from __future__ import annotations
 
-import json
+import logging
 import warnings
+from configparser import ConfigParser
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
 from functools import wraps
-from threading import Thread
-from typing import TYPE_CHECKING
-from time import ctime, sleep
-
-import requests
+from threading import Event, Lock, Thread, Timer
+from time import ctime
 
 from aliot.exceptions.should_not_call_error import ShouldNotCallError
 
-if TYPE_CHECKING:
-    from encoder import Encoder
-    from decoder import Decoder
-
-from typing import Optional, Callable
+from typing import Optional, Callable, Any, Iterable
 
-from websocket import WebSocketApp
+from websocket import WebSocketApp, ABNF
 import websocket
 
-from aliot.core._cli.utils import (
-    print_success,
-    print_err,
-    print_warning,
-    print_info,
-    print_log,
-    print_fail,
-)
-from aliot.core._config.config import get_config
+from aliot.action_requests import ActionRequests
+from aliot.base_obj import BaseAliotObj, MISSING_AUTH_TOKEN
 from aliot.constants import ALIVE_IOT_EVENT
-from aliot.decoder import DefaultDecoder
-from aliot.encoder import DefaultEncoder
+from aliot.logger import (
+    actions_logger,
+    frames_logger,
+    log_err,
+    log_fail,
+    log_info,
+    log_success,
+    log_warning,
+)
+from aliot.metrics import ObjMetrics
+from aliot.doc_batcher import DocBatcher
+from aliot.handler_pool import HandlerPool
+from aliot.image_upload import ImageBody, ImageUploader
+from aliot.state import AliotObjState
+from aliot.send_queue import SendQueue, BackPressurePolicy, SendQueueMetrics, event_priority
 
 _no_value = object()
 
 
-class AliotObj:
-    def __init__(self, name: str):
-        self.__name = name
+class AliotObj(BaseAliotObj):
+    # * Test hook: the class creating the websocket, the tests replace it with a fake that takes the same arguments #
+    _websocket_app = WebSocketApp
+
+    def __init__(self, name: str, *, config: Optional[ConfigParser] = None):
+        """
+        :param config: the configuration to read the options of the object from (the config.ini if None)
+        """
+        super().__init__(name, config)
         self.__ws: Optional[WebSocketApp] = None
-        self.__encoder = DefaultEncoder()
-        self.__decoder = DefaultDecoder()
-        self.__config = get_config()
-        self.__protocols = {}
-        self.__listeners = []
-        self.__broadcast_listener: Optional[Callable[[dict], None]] = None
-        self.__connected_to_alivecode = False
-        self.__connected = False
-        self.__stopped = False
-        self.__on_start: Optional[tuple[Callable, tuple, dict]] = None
-        self.__on_end: Optional[tuple[Callable, tuple, dict]] = None
+        self.__on_start_thread: Optional[Thread] = None
+        # * Set by stop(), ends the wait between two connection attempts #
+        self.__stop_event = Event()
         self.__repeats = 0
-        self.__last_freeze = 0
-        self.__listeners_set = 0
-        self.__api_url: str = self.__get_config_value("api_url")
-        self.__ws_url: str = self.__get_config_value("ws_url")
-        self.__log = False
+        self.__subscription_lock = Lock()
+        self.__subscription_timer: Optional[Timer] = None
+        # * Held to check that the replay of the offline events is done and to append to the outbox meanwhile #
+        self.__outbox_lock = Lock()
+        self.__handler_pool: Optional[HandlerPool] = self.__make_handler_pool()
+        # * action id -> (log_reception, cpu_bound) #
+        self.__action_options: dict[str, tuple[bool, bool]] = {}
+        self._action_requests = ActionRequests(self._max_actions_in_flight, self._action_timeout)
+        self.__send_queue: Optional[SendQueue] = self.__make_send_queue()
+        self.__doc_batcher: Optional[DocBatcher] = self.__make_doc_batcher()
+        self.__image_uploader = ImageUploader(
+            self.upload_image, self._get_config_value("image_upload_queue_size", 2, int)
+        )
+        self._metrics = self._make_metrics()
 
     # ################################# Properties ################################# #
 
     @property
-    def name(self):
-        return self.__name
-
-    @property
-    def encoder(self) -> Encoder:
-        return self.__encoder
-
-    @encoder.setter
-    def encoder(self, encoder: Encoder):
-        self.__encoder = encoder
-
-    @property
-    def decoder(self) -> Decoder:
-        return self.__decoder
-
-    @decoder.setter
-    def decoder(self, decoder: Decoder):
-        self.__decoder = decoder
-
-    @property
-    def object_id(self):
-        return self.__get_config_value("obj_id")
-
-    @property
-    def auth_token(self):
-        return self.__get_config_value("auth_token")
-
-    @property
-    def protocols(self):
-        """Returns a copy of the protocols dict"""
-        return self.__protocols.copy()
-
-    @property
-    def listeners(self):
-        """Returns a copy of the listeners list"""
-        return self.__listeners.copy()
-
-    @property
-    def broadcast_listener(self):
-        return self.__broadcast_listener
+    def send_queue_metrics(self) -> Optional[SendQueueMetrics]:
+        """Returns the metrics of the outbound queue, or None if the queue is disabled"""
+        return self.__send_queue.metrics if self.__send_queue is not None else None
 
     @property
     def connected_to_alivecode(self):
-        return self.__connected_to_alivecode
+        return self._connected_to_alivecode
 
     @connected_to_alivecode.setter
     def connected_to_alivecode(self, value: bool):
-        self.__connected_to_alivecode = value
-        if not value and self.__connected:
+        self._connected_to_alivecode = value
+        if not value and self._connected:
             self.__ws.close()
 
     # ################################# Public methods ################################# #
 
     def run(self, *, enable_trace: bool = False, log: bool = False, retry = True, retry_time = None):
-        self.__log = log
+        self._log = log
+        if log:
+            frames_logger.setLevel(logging.DEBUG)
         self.__setup_ws(enable_trace)
-        
+
         first_retry = True
-        self.retry_connection_amount = 0
 
         # Retry connection in a loop
-        while retry and not self.__stopped:
-            waitTime = retry_time or (5 * 2 ** self.retry_connection_amount)
-            
-            print_info(f"Retrying connection in {waitTime} seconds. Current time : {ctime()}")
-            
+        while retry and not self._stopped:
+            if retry_time:
+                waitTime = retry_time
+            elif self._server_restarted:
+                # The server closed cleanly (a redeploy), it is already back or about to be
+                waitTime = self._backoff.restart()
+            else:
+                waitTime = self._backoff.next()
+
+            log_info("Retrying connection in %.1f seconds. Current time : %s", waitTime, ctime())
+
             if first_retry:
                 first_retry = False
-                print_info("Please note that you can disable connect retry with retry=False when calling run(). You can also change the retry time to a fix amount by passing retry_time=<SECONDS> .")
-            
-            sleep(waitTime)
+                log_info("Please note that you can disable connect retry with retry=False when calling run(). You can also change the retry time to a fix amount by passing retry_time=<SECONDS> .")
+
+            if self.__stop_event.wait(waitTime):
+                break
+            if self._metrics is not None:
+                self._metrics.reconnected()
             self.__setup_ws(enable_trace)
-            
-            # Constraint retry amount for exponential wait time
-            self.retry_connection_amount += 1
-            if self.retry_connection_amount > 7:
-                self.retry_connection_amount = 7
 
     def stop(self):
-        if self.__connected and self.__ws:
-            self.__stopped = True
+        self._stopped = True
+        self.__stop_event.set()
+        if self.__doc_batcher is not None:
+            self.__doc_batcher.flush()
+        if self.__send_queue is not None and self._connected:
+            # The last events (the batch just flushed among them) are written before the socket closes
+            if not self.__send_queue.join(self._stop_timeout):
+                log_warning("%d event(s) were not sent before the object stopped", self.__send_queue.depth)
+        if self._connected and self.__ws:
             self.__ws.close()
+        if self.__send_queue is not None:
+            self.__send_queue.stop()
+        if self.__handler_pool is not None:
+            self.__handler_pool.shutdown(wait=False)
+        self.__image_uploader.stop()
+        self._http.close()
 
     def update_component(self, id: str, value):
         self.__send_event(ALIVE_IOT_EVENT.UPDATE_COMPONENT, {"id": id, "value": value})
@@ -151,67 +141,61 @@ class AliotObj:
         self.__send_event(ALIVE_IOT_EVENT.SEND_BROADCAST, {"data": data})
 
     def update_doc(self, fields: dict):
-        self.__send_event(
-            ALIVE_IOT_EVENT.UPDATE_DOC,
-            {
-                "fields": fields,
-            },
-        )
-
-    def get_doc(self, field: Optional[str] = None):
+        if self.__doc_batcher is not None:
+            self.__doc_batcher.add(fields)
+            return
+        self.__send_update_doc(fields)
 
-        if field:
-            res = requests.post(
-                f"{self.__api_url}/iot/aliot/{ALIVE_IOT_EVENT.GET_FIELD.value}",
-                {"id": self.object_id, "field": field},
-            )
-            status = res.status_code
-            if status == 201:
-                return json.loads(res.text) if res.text else None
-            elif status == 403:
-                print_err(
-                    f"While getting the field {field}, "
-                    f"request was Forbidden due to permission errors or project missing."
-                )
-            elif status == 500:
-                print_err(
-                    f"While getting the field {field}, "
-                    f"something went wrong with the ALIVEcode's servers, please try again."
-                )
-            else:
-                print_err(
-                    f"While getting the field {field}, please try again. {res.json()!r}"
-                )
-        else:
-            res = requests.post(
-                f"{self.__api_url}/iot/aliot/{ALIVE_IOT_EVENT.GET_DOC.value}",
-                {"id": self.object_id},
-            )
-            status = res.status_code
-            if status == 201:
-                return json.loads(res.text) if res.text else None
-            elif status == 403:
-                print_err(
-                    f"While getting the document, request was Forbidden due "
-                    f"to permission errors or project missing."
-                )
-            elif status == 500:
-                print_err(
-                    f"While getting the document, something went wrong with the ALIVEcode's servers, "
-                    f"please try again."
-                )
-            else:
-                print_err(f"While getting the document, please try again. {res.json()}")
+    def sync_state(self, state: AliotObjState, document_name: str = "document"):
+        """Sends the fields of `state` that changed since the last sync"""
+        fields = state.as_doc_changes(document_name)
+        if fields:
+            self.update_doc(fields)
 
+    def flush_doc(self):
+        """Sends the document fields waiting in the current batch right away (no-op when batching is disabled)"""
+        if self.__doc_batcher is not None:
+            self.__doc_batcher.flush()
 
-    def upload_image(self, buffer):
-        files = {'file': ('image.jpg', buffer, 'image/jpeg')}
-        data = {"id": self.object_id}
-        requests.post(
-            f"{self.__api_url}/iot/aliot/{ALIVE_IOT_EVENT.UPLOAD_IMAGE.value}", 
-            files=files,
-            data=data
-        )
+    def get_doc(self, field: Optional[str] = None):
+        return self._get_doc(field)
+
+    def get_fields(self, fields: Iterable[str]) -> Optional[dict]:
+        """
+        Gets several fields of the document with a single request and returns them keyed by path.
+        If the server has no endpoint for it, the whole document is fetched once and the fields are read from it.
+        """
+        return self._get_fields(fields)
+
+    def get_fields_concurrently(self, fields: Iterable[str], max_workers: Optional[int] = None) -> dict:
+        """
+        Gets several fields of the document with one `get_doc` request per field, sent in parallel.
+        Each field is fetched by its own thread, up to `max_workers` (the size of the HTTP pool by default).
+        """
+        values, missing = self._get_cached_fields(fields)
+        if not missing:
+            return values
+        max_workers = min(len(missing), max_workers or self._http.pool_size)
+        with ThreadPoolExecutor(max_workers, thread_name_prefix="aliot-get-fields") as executor:
+            values.update(zip(missing, executor.map(self.get_doc, missing)))
+        return values
+
+    def upload_image(self, buffer: ImageBody, filename: str = "image.jpg", content_type: str = "image/jpeg"):
+        """
+        Uploads an image and returns the response. The buffer can be bytes-like (bytes, memoryview, numpy array, ...)
+        or a file opened in binary mode, it is streamed without being copied.
+        """
+        return self._upload_image(buffer, filename, content_type)
+
+    def upload_image_async(
+        self, buffer: ImageBody, filename: str = "image.jpg", content_type: str = "image/jpeg"
+    ) -> Future:
+        """
+        Uploads an image in the background and returns a future resolved with the response.
+        When images are queued faster than they are uploaded, the stale ones are dropped (their future is cancelled).
+        The buffer must not be modified until the future is done.
+        """
+        return self.__image_uploader.submit(buffer, filename, content_type)
 
 
     def send_route(self, route_path: str, data: dict):
@@ -219,13 +203,37 @@ class AliotObj:
             ALIVE_IOT_EVENT.SEND_ROUTE, {"routePath": route_path, "data": data}
         )
 
-    def send_action(self, target_id: str, action_id: str, data: dict | None = None):
+    def send_action(
+        self,
+        target_id: str,
+        action_id: str,
+        data: dict | None = None,
+        *,
+        expect_result: bool = False,
+        timeout: Optional[float] = None,
+    ) -> Optional[Future]:
+        """
+        :param expect_result: return a future resolved with the value returned by the action of the target.
+            At most `max_actions_in_flight` actions wait for their result at once, the next ones wait for a slot
+        :param timeout: seconds to wait for the result (`action_timeout` of the config by default), the future
+            fails with an ActionTimeoutError after it
+        """
         if data == None:
             data = {}
-        self.__send_event(
-            ALIVE_IOT_EVENT.SEND_ACTION,
-            {"targetId": target_id, "actionId": action_id, "value": data},
-        )
+        payload = {"targetId": target_id, "actionId": action_id, "value": data}
+        if not expect_result:
+            self.__send_event(ALIVE_IOT_EVENT.SEND_ACTION, payload)
+            return None
+
+        request_id, future = self._action_requests.open(timeout)
+        if future.done():
+            return future
+        if not self._connected:
+            self._action_requests.fail(request_id, ConnectionError("The object is not connected"))
+            return future
+        payload["requestId"] = request_id
+        self.__send_event(ALIVE_IOT_EVENT.SEND_ACTION, payload)
+        return future
 
     # ################################# Decorators methods ################################# #
 
@@ -238,20 +246,21 @@ class AliotObj:
             args = ()
 
         def inner(f):
-            if self.__on_start is not None:
+            if self._on_start is not None:
                 raise ValueError(
-                    f"A function is already assigned to that role: {self.__on_start[0].__name__}"
+                    f"A function is already assigned to that role: {self._on_start[0].__name__}"
                 )
 
-            self.__on_start = (f, args, kwargs)
+            self._on_start = (f, args, kwargs)
 
             @wraps(f)
             def innest():
-                print_err(
-                    f"You should not call the function {f.__name__!r} yourself. "
-                    f"Aliot will take care of it and will "
-                    f"automatically call {f.__name__!r} when your object is connected to the website.",
-                    ShouldNotCallError.__name__,
+                log_err(
+                    "You should not call the function %r yourself. Aliot will take care of it and will "
+                    "automatically call %r when your object is connected to the website.",
+                    f.__name__,
+                    f.__name__,
+                    title=ShouldNotCallError.__name__,
                 )
                 exit(-1)
 
@@ -271,19 +280,20 @@ class AliotObj:
             args = ()
 
         def inner(f):
-            if self.__on_end is not None:
+            if self._on_end is not None:
                 raise ValueError(
-                    f"A function is already assigned to that role: {self.__on_end[0].__name__}"
+                    f"A function is already assigned to that role: {self._on_end[0].__name__}"
                 )
-            self.__on_end = (f, args, kwargs)
+            self._on_end = (f, args, kwargs)
 
             @wraps(f)
             def innest():
-                print_err(
-                    f"You should not call the function {f.__name__!r} yourself. "
-                    f"Aliot will take care of it and will "
-                    f"automatically call {f.__name__!r} when your object is disconnected to the website.",
-                    ShouldNotCallError.__name__,
+                log_err(
+                    "You should not call the function %r yourself. Aliot will take care of it and will "
+                    "automatically call %r when your object is disconnected to the website.",
+                    f.__name__,
+                    f.__name__,
+                    title=ShouldNotCallError.__name__,
                 )
                 exit(-1)
 
@@ -298,21 +308,7 @@ class AliotObj:
 
     def on_recv(self, action_id: str, callback=None, log_reception: bool = True):
         def inner(func):
-            @wraps(func)
-            def wrapper(*args, **kwargs):
-                if log_reception:
-                    print(
-                        f"The protocol: {action_id!r} was called with the arguments: "
-                        f"{args}"
-                    )
-                res = func(*args, **kwargs)
-                self.__send_event(
-                    ALIVE_IOT_EVENT.SEND_ACTION_DONE,
-                    {"actionId": action_id, "value": res},
-                )
-
-            self.__protocols[action_id] = wrapper
-            return wrapper
+            return self.__register_action(action_id, func, log_reception)
 
         if callback is not None:
             return inner(callback)
@@ -320,24 +316,24 @@ class AliotObj:
         return inner
 
     def on_action_recv(
-        self, action_id: str, callback=None, log_reception: bool = True
+        self,
+        action_id: str,
+        callback=None,
+        log_reception: bool = True,
+        *,
+        concurrency: int = 1,
+        cpu_bound: bool = False,
     ):
-        def inner(func):
-            @wraps(func)
-            def wrapper(*args, **kwargs):
-                if log_reception:
-                    print(
-                        f"The protocol: {action_id!r} was called with the arguments: "
-                        f"{args}"
-                    )
-                res = func(*args, **kwargs)
-                self.__send_event(
-                    ALIVE_IOT_EVENT.SEND_ACTION_DONE,
-                    {"actionId": action_id, "value": res},
-                )
+        """
+        :param concurrency: when handlers run in the worker pool (see `handler_workers` in the config),
+            how many calls of this action may run at the same time. With 1, the calls run one after the other,
+            in the order they were received
+        :param cpu_bound: run the action in a process of the worker pool (see `handler_process_workers`).
+            The function must be picklable: register it with `callback=` and define it at the module level
+        """
 
-            self.__protocols[action_id] = wrapper
-            return wrapper
+        def inner(func):
+            return self.__register_action(action_id, func, log_reception, concurrency, cpu_bound)
 
         if callback is not None:
             return inner(callback)
@@ -347,46 +343,7 @@ class AliotObj:
     """ DEPRECATED METHOD """
 
     def listen(self, fields: list[str], callback=None):
-        def inner(func):
-            @wraps(func)
-            def wrapper(fields: dict):
-                result = func(fields)
-
-            self.__listeners.append({"func": wrapper, "fields": fields})
-            return wrapper
-
-        if callback is not None:
-            return inner(callback)
-
-        return inner
-
-    def listen_doc(self, fields: list[str], callback=None):
-        def inner(func):
-            @wraps(func)
-            def wrapper(fields: dict):
-                result = func(fields)
-
-            self.__listeners.append({"func": wrapper, "fields": fields})
-            return wrapper
-
-        if callback is not None:
-            return inner(callback)
-
-        return inner
-
-    def listen_broadcast(self, callback=None):
-        def inner(func):
-            @wraps(func)
-            def wrapper(fields: dict):
-                result = func(fields)
-
-            self.__broadcast_listener = wrapper
-            return wrapper
-
-        if callback is not None:
-            return inner(callback)
-
-        return inner
+        return self.listen_doc(fields, callback)
 
     def main_loop(self, repetitions=None, *, callback=None):
         warnings.warn(
@@ -394,7 +351,7 @@ class AliotObj:
             "You should use on_start() instead",
             DeprecationWarning,
         )
-        print_warning(
+        log_warning(
             "main_loop() is deprecated and will be removed in a later version. "
             "You should use on_start() instead"
         )
@@ -413,7 +370,7 @@ class AliotObj:
                     while self.connected_to_alivecode:
                         main_loop_func()
 
-            self.__on_start = wrapper
+            self._on_start = (wrapper, (), {})
             return wrapper
 
         if callback is not None:
@@ -423,181 +380,382 @@ class AliotObj:
 
     # ################################# Private methods ################################# #
 
-    def __log_info(self, info):
-        if self.__log:
-            print_log(info, color="grey70")
+    def _check_ping_config(self):
+        super()._check_ping_config()
+        # websocket-client only sends pings if ping_interval is set, and refuses to connect unless ping_interval is
+        # greater than ping_timeout
+        if self._ping_interval and self._ping_timeout and self._ping_timeout >= self._ping_interval:
+            raise ValueError(
+                f"The ping_timeout of {self.name!r} ({self._ping_timeout:g}s) must be smaller than its "
+                f"ping_interval ({self._ping_interval:g}s)"
+            )
 
-    def __get_config_value(self, key):
-        return self.__config.get(
-            self.__name, key, fallback=None
-        ) or self.__config.defaults().get(key)
+    def _make_metrics(self) -> Optional[ObjMetrics]:
+        metrics = super()._make_metrics()
+        if metrics is None:
+            return None
+        if self.__send_queue is not None:
+            metrics.gauge(
+                "aliot_send_queue_depth", "Messages waiting in the outbound queue", lambda: self.__send_queue.depth
+            )
+        if self.__handler_pool is not None:
+            metrics.gauge(
+                "aliot_handlers_pending", "Handlers waiting for a worker", lambda: self.__handler_pool.pending
+            )
+        return metrics
+
+    def __make_send_queue(self) -> Optional[SendQueue]:
+        maxsize = self._get_config_value("send_queue_size", 0, int)
+        if maxsize <= 0:
+            if self._rate_limits:
+                # Waiting for a token would block the thread receiving the messages
+                raise ValueError(f"The rate_limits of {self.name!r} require a send queue, set its send_queue_size")
+            return None
+        return SendQueue(
+            maxsize,
+            self._get_config_value("send_queue_policy", BackPressurePolicy.BLOCK, BackPressurePolicy),
+            self._get_config_value("send_queue_block_timeout", None, float),
+            self._rate_limits,
+        )
+
+    def __make_doc_batcher(self) -> Optional[DocBatcher]:
+        window = self._get_config_value("update_doc_batch_window", 0, float)
+        if window <= 0:
+            return None
+        return DocBatcher(
+            self.__send_update_doc,
+            window,
+            self._get_config_value("update_doc_batch_size", 0, int),
+        )
+
+    def __send_update_doc(self, fields: dict):
+        if self._doc_cache is not None:
+            self._doc_cache.invalidate(*fields)
+        self.__send_event(
+            ALIVE_IOT_EVENT.UPDATE_DOC,
+            {
+                "fields": fields,
+            },
+        )
 
-    def __send_event(self, event: ALIVE_IOT_EVENT, data: Optional[dict]):
-        if self.__connected:
-            data_sent = {"event": event.value, "data": data}
-            data_encoded = self.encoder.encode(data_sent)
-            self.__log_info(f"[Encoding] {data_sent!r}")
-            self.__log_info(f"[Sending] {data_encoded!r}")
-            self.__ws.send(data_encoded)
-            self.__repeats += 1
+    def __send_event(self, event: ALIVE_IOT_EVENT, data: Optional[dict], *, replaying: bool = False) -> bool:
+        """
+        Returns False if the event was not handed to the connection (kept in the outbox, not connected or dropped
+        by the send queue)
+        """
+        if self._keeps_offline(event, replaying):
+            with self.__outbox_lock:
+                # The replay may have ended meanwhile
+                if self._keeps_offline(event, replaying):
+                    if not replaying:
+                        self._offline_outbox.append(event.value, data)
+                    return False
+        if not self._connected:
+            return False
+        encoder = self._encoder
+        # Text frames are sent as utf-8 bytes, which saves a round trip through str with the fast json backends
+        data_encoded = self._encode_event(event, data, as_bytes=True)
+        # The opcode is chosen when encoding, the encoder may change before a queued frame is written
+        opcode = ABNF.OPCODE_BINARY if encoder.binary else ABNF.OPCODE_TEXT
+        if self.__send_queue is not None:
+            self._log_info("[Queuing] %r", data_encoded)
+            # The data is kept to put the event back in the offline outbox if the connection closes before it is sent
+            queued = self.__send_queue.put(
+                (data_encoded, opcode, event.value, data),
+                event_priority(event.value),
+                event.value,
+                # The replayed events were already removed from the outbox, they wait for room instead of being dropped
+                policy=BackPressurePolicy.BLOCK if replaying else None,
+            )
+            if not queued:
+                return False
+        else:
+            self._log_info("[Sending] %r", data_encoded)
+            self.__ws.send(data_encoded, opcode)
+            self._count_sent(event.value, data_encoded)
+        self.__repeats += 1
+        return True
+
+    def __write(self, frame: tuple):
+        # Only called from the writer thread of the send queue
+        data_encoded, opcode, event, _ = frame
+        self.__ws.send(data_encoded, opcode)
+        self._count_sent(event, data_encoded)
 
     def __execute_listen(self, fields: dict):
-        for listener in self.listeners:
-            fields_to_return = {
-                field: value
-                for field, value in fields.items()
-                if field in listener["fields"]
-            }
-            if len(fields_to_return) > 0:
-                listener["func"](fields_to_return)
+        for listener, fields_to_return in self._match_listeners(fields):
+            if self.__handler_pool is None:
+                self.__timed("listener", listener["func"], fields_to_return)
+            else:
+                self.__submit_handler(
+                    ("listener", id(listener)), self.__timed, "listener", listener["func"], fields_to_return
+                )
 
     def __execute_broadcast(self, data: dict):
-        if self.broadcast_listener:
-            self.broadcast_listener(data)
+        if self._broadcast_listener is None:
+            return
+        if self.__handler_pool is None:
+            self.__timed("broadcast", self._broadcast_listener, data)
+        else:
+            self.__submit_handler(("broadcast",), self.__timed, "broadcast", self._broadcast_listener, data)
+
+    def __timed(self, handler: str, func: Callable, *args):
+        with self.__handler_timer(handler):
+            return func(*args)
+
+    def __handler_timer(self, handler: str):
+        return nullcontext() if self._metrics is None else self._metrics.handler(handler).time()
 
     def __execute_protocol(self, msg: dict | list):
         if isinstance(msg, list):
             for m in msg:
                 self.__execute_protocol(m)
-        print(msg)
+            return
         must_have_keys = "id", "value"
         if not all(key in msg for key in must_have_keys):
-            print("the message received does not have a valid structure")
+            log_warning("The message received does not have a valid structure: %r", msg)
             return
 
         msg_id = msg["id"]
-        protocol = self.protocols.get(msg_id)
+        protocol = self._protocols.get(msg_id)
+        # Sent back with the result, so the object that sent the action can match it with its request
+        request_id = msg.get("requestId")
 
         if protocol is None:
-            print_err(f"The protocol with the id {msg_id!r} is not implemented")
+            log_err("The protocol with the id %r is not implemented", msg_id)
+        elif self.__handler_pool is None:
+            self.__run_action(msg_id, protocol, msg["value"], request_id)
+        elif self.__action_options[msg_id][1]:
+            self.__submit_cpu_bound_action(msg_id, protocol, msg["value"], request_id)
         else:
-            protocol(msg["value"])
-
-    def __connect_success(self):
-        if len(self.__listeners) == 0:
-            print_success(f"Object {self.name!r}", success_name="Connected")
-            self.connected_to_alivecode = True
-
-            self.__on_start and Thread(
-                target=self.__on_start[0],
-                args=self.__on_start[1],
-                kwargs=self.__on_start[2],
-                daemon=True,
-            ).start()
+            self.__submit_handler(("action", msg_id), self.__run_action, msg_id, protocol, msg["value"], request_id)
+
+    def __run_action(self, action_id: str, protocol: Callable, value, request_id: Optional[str] = None):
+        self.__log_action_call(action_id, (value,))
+        with self.__handler_timer(f"action:{action_id}"):
+            result = protocol.__wrapped__(value)
+        self.__send_action_done(action_id, result, request_id)
+
+    def __log_action_call(self, action_id: str, args: tuple):
+        if self.__action_options.get(action_id, (False,))[0]:
+            actions_logger.info("The protocol: %r was called with the arguments: %r", action_id, args)
+
+    def __send_action_done(self, action_id: str, value, request_id: Optional[str] = None):
+        data = {"actionId": action_id, "value": value}
+        if request_id is not None:
+            data["requestId"] = request_id
+        self.__send_event(ALIVE_IOT_EVENT.SEND_ACTION_DONE, data)
+
+    def __connect_success(self, data=None):
+        self._accept_codec(data)
+        resumed = self._session.accept(data)
+        if resumed or len(self._listeners) == 0:
+            log_success("Object %r", self.name, title="Resumed" if resumed else "Connected")
+            self.__set_connected_to_alivecode()
+            # Only the listeners changed while disconnected are sent
+            self.__sync_subscriptions()
 
         else:
             # Register listeners on ALIVEcode
-            fields = sorted(
-                set([field for l in self.listeners for field in l["fields"]])
-            )
-            self.__send_event(ALIVE_IOT_EVENT.SUBSCRIBE_LISTENER, {"fields": fields})
+            self.__sync_subscriptions()
 
     def __subscribe_listener_success(self):
-        print_success(success_name="Connected")
+        if self._connected_to_alivecode:
+            # The success of an incremental subscription
+            return
+        log_success(title="Connected")
+        self.__set_connected_to_alivecode()
+
+    def _schedule_subscription_sync(self):
+        if self._subscribe_window <= 0:
+            self.__sync_subscriptions()
+            return
+        with self.__subscription_lock:
+            if self.__subscription_timer is None:
+                self.__subscription_timer = Timer(self._subscribe_window, self.__flush_subscriptions)
+                self.__subscription_timer.daemon = True
+                self.__subscription_timer.start()
+
+    def __flush_subscriptions(self):
+        with self.__subscription_lock:
+            self.__subscription_timer = None
+        if self._connected_to_alivecode:
+            self.__sync_subscriptions()
+
+    def __sync_subscriptions(self):
+        with self.__subscription_lock:
+            added, removed = self._subscription_changes()
+            if removed:
+                self.__send_event(ALIVE_IOT_EVENT.UNSUBSCRIBE_LISTENER, {"fields": removed})
+            if added:
+                self.__send_event(ALIVE_IOT_EVENT.SUBSCRIBE_LISTENER, {"fields": added})
+
+    def __set_connected_to_alivecode(self):
         self.connected_to_alivecode = True
-        self.__on_start and Thread(
-            target=self.__on_start[0],
-            args=self.__on_start[1],
-            kwargs=self.__on_start[2],
-            daemon=True,
-        ).start()
+        self._backoff.reset()
+        self.__replay_offline_events()
+        running = self.__on_start_thread is not None and self.__on_start_thread.is_alive()
+        if self._on_start and self._session.should_run_on_start(running):
+            self.__on_start_thread = Thread(
+                target=self._on_start[0],
+                args=self._on_start[1],
+                kwargs=self._on_start[2],
+                daemon=True,
+            )
+            self.__on_start_thread.start()
+
+    def __replay_offline_events(self):
+        if self._offline_outbox is None:
+            return
+        while True:
+            with self.__outbox_lock:
+                events = self._offline_outbox.drain()
+                if not events:
+                    # The next events are sent right away
+                    self._outbox_flushed = True
+                    return
+            log_info("Sending %d event(s) kept while offline", len(events))
+            for i, (event, data) in enumerate(events):
+                try:
+                    sent = self.__send_event(ALIVE_IOT_EVENT(event), data, replaying=True)
+                except websocket.WebSocketConnectionClosedException:
+                    sent = False
+                if not sent:
+                    # The connection dropped again (or the send queue stayed full), the events go back to the outbox
+                    # before the ones kept since
+                    self._offline_outbox.restore(events[i:])
+                    return
+
+    def __make_handler_pool(self) -> Optional[HandlerPool]:
+        max_workers = self._get_config_value("handler_workers", 0, int)
+        if max_workers <= 0:
+            return None
+        return HandlerPool(max_workers, self._get_config_value("handler_process_workers", 0, int))
+
+    def __register_action(
+        self, action_id: str, func, log_reception: bool, concurrency: int = 1, cpu_bound: bool = False
+    ):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            self.__log_action_call(action_id, args)
+            self.__send_action_done(action_id, func(*args, **kwargs))
+
+        self._protocols[action_id] = wrapper
+        self.__action_options[action_id] = (log_reception, cpu_bound)
+        if self.__handler_pool is not None:
+            self.__handler_pool.set_limit(("action", action_id), concurrency)
+        return wrapper
+
+    def __submit_handler(self, key: tuple, handler: Callable, *args):
+        self.__handler_pool.submit(key, handler, *args).add_done_callback(self.__report_handler_error)
+
+    def __submit_cpu_bound_action(self, action_id: str, protocol: Callable, value, request_id: Optional[str]):
+        self.__log_action_call(action_id, (value,))
+        # The wrapper is a closure and cannot be pickled: only the function it wraps is sent to the process
+        future = self.__handler_pool.submit(("action", action_id), protocol.__wrapped__, value, cpu_bound=True)
+        future.add_done_callback(lambda f: self.__send_action_result(action_id, f, request_id))
+
+    def __send_action_result(self, action_id: str, future: Future, request_id: Optional[str]):
+        if future.exception() is not None:
+            self.__report_handler_error(future)
+            return
+        self.__send_action_done(action_id, future.result(), request_id)
+
+    @staticmethod
+    def __report_handler_error(future: Future):
+        if not future.cancelled() and future.exception() is not None:
+            log_err("In a handler: %r", future.exception())
+
+    def _make_event_handlers(self) -> dict[str, Callable[[Any], None]]:
+        return {
+            ALIVE_IOT_EVENT.CONNECT_SUCCESS.value: self.__connect_success,
+            ALIVE_IOT_EVENT.RECEIVE_ACTION.value: self.__execute_protocol,
+            ALIVE_IOT_EVENT.RECEIVE_ACTION_DONE.value: self._receive_action_done,
+            ALIVE_IOT_EVENT.RECEIVE_LISTEN.value: lambda data: self.__execute_listen(data["fields"]),
+            ALIVE_IOT_EVENT.RECEIVE_BROADCAST.value: lambda data: self.__execute_broadcast(data["data"]),
+            ALIVE_IOT_EVENT.SUBSCRIBE_LISTENER_SUCCESS.value: lambda data: self.__subscribe_listener_success(),
+            ALIVE_IOT_EVENT.ERROR.value: self.__on_error_event,
+            ALIVE_IOT_EVENT.PING.value: lambda data: self.__send_event(ALIVE_IOT_EVENT.PONG, None),
+        }
+
+    def __on_error_event(self, data):
+        self.__handle_error(data, self._is_fatal_error(data))
 
     def __handle_error(self, data, terminate: bool = False):
-        print_err(data)
+        log_err("%s", data)
         if terminate:
             self.connected_to_alivecode = False
-            print_fail(failure_name="Connection closed due to an error")
+            log_fail(title="Connection closed due to an error")
 
     # ################################# Websocket methods ################################# #
 
     def __on_message(self, ws, message):
-        msg = self.decoder.decode(message)
-
-        event: str = msg["event"]
-        data = msg["data"]
-
-        if event == ALIVE_IOT_EVENT.CONNECT_SUCCESS.value:
-            self.__connect_success()
-
-        elif event == ALIVE_IOT_EVENT.RECEIVE_ACTION.value:
-            self.__execute_protocol(data)
-
-        elif event == ALIVE_IOT_EVENT.RECEIVE_LISTEN.value:
-            self.__execute_listen(data["fields"])
-
-        elif event == ALIVE_IOT_EVENT.RECEIVE_BROADCAST.value:
-            self.__execute_broadcast(data["data"])
-
-        elif event == ALIVE_IOT_EVENT.SUBSCRIBE_LISTENER_SUCCESS.value:
-            self.__subscribe_listener_success()
-
-        elif event == ALIVE_IOT_EVENT.ERROR.value:
-            if data == "Forbidden. Invalid credentials.":
-                self.__handle_error(data, True)
-            elif "is not registered" in data:
-                self.__handle_error(data, True)
-            else:
-                self.__handle_error(data)
+        if self._metrics is None:
+            msg = self._decoder.decode(message)
+        else:
+            with self._metrics.decode.time():
+                msg = self._decoder.decode(message)
+            self._metrics.received(msg["event"], len(message))
 
-        elif event == ALIVE_IOT_EVENT.PING.value:
-            self.__send_event(ALIVE_IOT_EVENT.PONG, None)
+        handler = self._event_handlers.get(msg["event"])
+        if handler is not None:
+            handler(msg["data"])
 
     def __on_error(self, ws: WebSocketApp, error):
-        print_err(f"{error!r}")
-        
+        log_err("%r", error)
+
         if isinstance(error, KeyboardInterrupt):
-            self.__stopped = True
-        
+            self._stopped = True
+
         if isinstance(error, ConnectionResetError):
-            print_warning(
+            log_warning(
                 "If you didn't see the 'Connected', "
                 "message verify that you are using the right key"
             )
 
     def __on_close(self, ws: WebSocketApp, status_code, msg):
-        self.__connected = False
-        self.__connected_to_alivecode = False
-        self.__on_end and self.__on_end[0](*self.__on_end[1], **self.__on_end[2])
+        self._reset_connection(status_code)
+        if self.__send_queue is not None:
+            # Messages meant for the closed socket must not leak into the next connection
+            pending = self.__send_queue.clear()
+            if self._offline_outbox is not None:
+                # The events that would have been kept offline are replayed on the next connection instead
+                self._offline_outbox.restore(
+                    [(event, item[3]) for event, item in pending if self._offline_outbox.accepts(event)]
+                )
+        self._on_end and self._on_end[0](*self._on_end[1], **self._on_end[2])
 
         if status_code is not None or msg is not None:
             if status_code is not None:
-                print_fail(failure_name="Status code : %s" % status_code)
+                log_fail(title="Status code : %s" % status_code)
             if msg is not None:
-                print_fail(failure_name="Message : %s" % msg)
-            print_fail(failure_name="Connection closed")
-        
+                log_fail(title="Message : %s" % msg)
+            log_fail(title="Connection closed")
+
         else:
-            print_info(info_name="Connection closed")
+            log_info(title="Connection closed")
 
 
     def __on_open(self, ws):
         # Register IoTObject on ALIVEcode
-        self.__connected = True
-        self.retry_connection_amount = 0
-        token = self.auth_token
-        if token is None:
-            self.__handle_error(
-                "IoTObjects now require an AuthToken to securely connect to ALIVEiot. Please make sure to register an AuthToken on your IoTObject on ALIVEcode from your IoT Dashboard and add in your config.ini: auth_token = <your_auth_token>",
-                terminate=True,
-            )
+        self._connected = True
+        if self.__send_queue is not None:
+            self.__send_queue.start(self.__write)
+        if self.auth_token is None:
+            self.__handle_error(MISSING_AUTH_TOKEN, terminate=True)
         else:
-            self.__send_event(
-                ALIVE_IOT_EVENT.CONNECT_OBJECT,
-                {"id": self.object_id, "token": self.auth_token},
-            )
-        # if self.__main_loop is None:
-        #     self.__ws.close()
-        #     raise NotImplementedError("You must define a main loop")
-        # Thread(target=self.__main_loop, daemon=True).start()
+            self.__send_event(ALIVE_IOT_EVENT.CONNECT_OBJECT, self._connect_data())
 
     def __setup_ws(self, enable_trace: bool = False):
-        print_info("...", info_name="Connecting")
+        log_info("...", title="Connecting")
         websocket.enableTrace(enable_trace)
-        self.__ws = WebSocketApp(
-            self.__ws_url,
+        self.__ws = self._websocket_app(
+            self._ws_url,
             on_open=self.__on_open,
             on_message=self.__on_message,
             on_error=self.__on_error,
             on_close=self.__on_close,
         )
-        self.__ws.run_forever()
+        # The pings detect half-open connections: without a pong after ping_timeout, the connection is closed
+        # and run() reconnects
+        self.__ws.run_forever(ping_interval=self._ping_interval, ping_timeout=self._ping_timeout)
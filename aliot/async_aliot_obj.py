@@ -0,0 +1,504 @@
+from __future__ import annotations
+
+import asyncio
+import inspect
+import logging
+from configparser import ConfigParser
+from contextlib import nullcontext
+from typing import Any, Awaitable, Callable, Iterable, Optional, Union
+
+from aliot.action_requests import ActionRequests, ActionTimeoutError
+from aliot.base_obj import BaseAliotObj, MISSING_AUTH_TOKEN
+from aliot.constants import ALIVE_IOT_EVENT
+from aliot.image_upload import ImageBody
+from aliot.logger import actions_logger, frames_logger, log_err, log_fail, log_info, log_success, log_warning
+from aliot.metrics import ObjMetrics
+from aliot.session import OnStartPolicy
+from aliot.state import AliotObjState
+
+try:
+    import websockets
+except ImportError:  # pragma: no cover - depends on the installed extras
+    websockets = None
+
+Handler = Callable[..., Union[Awaitable[Any], Any]]
+
+
+async def _call(func: Handler, *args, **kwargs):
+    """Calls a handler that may or may not be a coroutine function"""
+    result = func(*args, **kwargs)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+class AsyncAliotObj(BaseAliotObj):
+    """
+    Asyncio implementation of the AliotObj. The connection, the dispatch of the received events,
+    the heartbeats and the retry loop all run on the event loop, so a single process (and a single thread)
+    can drive many objects at once.
+
+    Handlers can either be `async def` functions or regular functions.
+    """
+
+    _default_ping_timeout = 20.0
+
+    def __init__(self, name: str, *, config: Optional[ConfigParser] = None):
+        """
+        :param config: the configuration to read the options of the object from (the config.ini if None)
+        """
+        if websockets is None:
+            raise ImportError(
+                "AsyncAliotObj requires the 'websockets' package. Install it with `pip install aliot-py[async]`"
+            )
+        super().__init__(name, config)
+        self.__ws = None
+        self.__on_start_task: Optional[asyncio.Task] = None
+        self.__tasks: set[asyncio.Task] = set()
+        # * One future per event being sent (or waiting for its rate limit), resolved once it is written #
+        self.__sending: set[asyncio.Future] = set()
+        # The window of in-flight actions is an asyncio semaphore (created on the loop running the object),
+        # so waiting for a slot never blocks the loop
+        self.__action_window: Optional[asyncio.Semaphore] = None
+        self._action_requests = ActionRequests(0, self._action_timeout)
+        self.__subscription_sync: Optional[asyncio.TimerHandle] = None
+        # * Set by stop(), ends the wait between two connection attempts (created on the loop running the object) #
+        self.__stop_event: Optional[asyncio.Event] = None
+        self._metrics = self._make_metrics()
+
+    # ################################# Public methods ################################# #
+
+    def run(self, *, log: bool = False, retry=True, retry_time=None):
+        """Blocking entry point, runs `arun()` in a new event loop"""
+        try:
+            asyncio.run(self.arun(log=log, retry=retry, retry_time=retry_time))
+        except KeyboardInterrupt:
+            pass
+
+    async def arun(self, *, log: bool = False, retry=True, retry_time=None):
+        self._log = log
+        if log:
+            frames_logger.setLevel(logging.DEBUG)
+        # A stop() called before the task started is kept, the loop below is skipped
+        self.__stop_event = asyncio.Event()
+        self._backoff.reset()
+
+        try:
+            while not self._stopped:
+                await self.__connect()
+                if not retry or self._stopped:
+                    break
+
+                if retry_time:
+                    wait_time = retry_time
+                elif self._server_restarted:
+                    wait_time = self._backoff.restart()
+                else:
+                    wait_time = self._backoff.next()
+                log_info("Retrying connection of %r in %.1f seconds.", self.name, wait_time)
+                try:
+                    await asyncio.wait_for(self.__stop_event.wait(), wait_time)
+                    break
+                except asyncio.TimeoutError:
+                    pass
+                if self._metrics is not None:
+                    self._metrics.reconnected()
+        finally:
+            self.__cancel_on_start()
+
+    async def stop(self):
+        self._stopped = True
+        if self.__stop_event is not None:
+            self.__stop_event.set()
+        if self.__sending:
+            # The last events are written before the socket closes
+            _, pending = await asyncio.wait(set(self.__sending), timeout=self._stop_timeout)
+            if pending:
+                log_warning("%d event(s) of %r were not sent before it stopped", len(pending), self.name)
+        if self.__ws is not None:
+            await self.__ws.close()
+
+    async def update_component(self, id: str, value):
+        await self.__send_event(ALIVE_IOT_EVENT.UPDATE_COMPONENT, {"id": id, "value": value})
+
+    async def send_broadcast(self, data: dict):
+        await self.__send_event(ALIVE_IOT_EVENT.SEND_BROADCAST, {"data": data})
+
+    async def update_doc(self, fields: dict):
+        if self._doc_cache is not None:
+            self._doc_cache.invalidate(*fields)
+        await self.__send_event(ALIVE_IOT_EVENT.UPDATE_DOC, {"fields": fields})
+
+    async def sync_state(self, state: AliotObjState, document_name: str = "document"):
+        """Sends the fields of `state` that changed since the last sync"""
+        fields = state.as_doc_changes(document_name)
+        if fields:
+            await self.update_doc(fields)
+
+    async def send_route(self, route_path: str, data: dict):
+        await self.__send_event(ALIVE_IOT_EVENT.SEND_ROUTE, {"routePath": route_path, "data": data})
+
+    async def send_action(
+        self,
+        target_id: str,
+        action_id: str,
+        data: dict | None = None,
+        *,
+        expect_result: bool = False,
+        timeout: Optional[float] = None,
+    ) -> Optional[asyncio.Future]:
+        """
+        :param expect_result: return a future resolved with the value returned by the action of the target,
+            once the action is sent. At most `max_actions_in_flight` actions wait for their result at once,
+            the next ones wait for a slot before being sent
+        :param timeout: seconds to wait for the result (`action_timeout` of the config by default), the future
+            fails with an ActionTimeoutError after it
+        """
+        if data is None:
+            data = {}
+        payload = {"targetId": target_id, "actionId": action_id, "value": data}
+        if not expect_result:
+            await self.__send_event(ALIVE_IOT_EVENT.SEND_ACTION, payload)
+            return None
+
+        loop = asyncio.get_running_loop()
+        if self.__action_window is None and self._max_actions_in_flight > 0:
+            self.__action_window = asyncio.Semaphore(self._max_actions_in_flight)
+        if self.__action_window is not None:
+            try:
+                await asyncio.wait_for(self.__action_window.acquire(), timeout)
+            except asyncio.TimeoutError:
+                future = loop.create_future()
+                future.set_exception(ActionTimeoutError("Too many actions waiting for their result"))
+                return future
+        request_id, result = self._action_requests.open(timeout)
+        if self.__action_window is not None:
+            # The result may be set by the timeout thread
+            window = self.__action_window
+            result.add_done_callback(lambda _: loop.call_soon_threadsafe(window.release))
+        if not self._connected:
+            self._action_requests.fail(request_id, ConnectionError("The object is not connected"))
+        else:
+            payload["requestId"] = request_id
+            await self.__send_event(ALIVE_IOT_EVENT.SEND_ACTION, payload)
+        return asyncio.wrap_future(result)
+
+    async def get_doc(self, field: Optional[str] = None):
+        """Gets the document (or one of its fields) without blocking the event loop"""
+        if field:
+            values, missing = self._get_cached_fields([field])
+            if not missing:
+                return values[field]
+        return await self.__in_executor(self._get_doc, field)
+
+    async def get_fields(self, fields: Iterable[str]) -> Optional[dict]:
+        """
+        Gets several fields of the document with a single request and returns them keyed by path.
+        If the server has no endpoint for it, the whole document is fetched once and the fields are read from it.
+        """
+        return await self.__in_executor(self._get_fields, fields)
+
+    async def get_fields_concurrently(self, fields: Iterable[str]) -> dict:
+        """Gets several fields of the document with one `get_doc` request per field, sent in parallel"""
+        values, missing = self._get_cached_fields(fields)
+        if missing:
+            values.update(zip(missing, await asyncio.gather(*(self.get_doc(field) for field in missing))))
+        return values
+
+    async def upload_image(
+        self, buffer: ImageBody, filename: str = "image.jpg", content_type: str = "image/jpeg"
+    ):
+        """
+        Uploads an image without blocking the event loop and returns the response. The buffer can be bytes-like
+        or a file opened in binary mode, it is streamed without being copied and must not be modified meanwhile.
+        """
+        return await self.__in_executor(self._upload_image, buffer, filename, content_type)
+
+    # ################################# Decorators methods ################################# #
+
+    def on_start(self, callback=None, *, args: tuple = (), kwargs: Optional[dict] = None):
+        def inner(f):
+            if self._on_start is not None:
+                raise ValueError(
+                    f"A function is already assigned to that role: {self._on_start[0].__name__}"
+                )
+            self._on_start = (f, tuple(args), kwargs or {})
+            return f
+
+        if callback is not None:
+            return inner(callback)
+
+        return inner
+
+    def on_end(self, callback=None, *, args: tuple = (), kwargs: Optional[dict] = None):
+        def inner(f):
+            if self._on_end is not None:
+                raise ValueError(
+                    f"A function is already assigned to that role: {self._on_end[0].__name__}"
+                )
+            self._on_end = (f, tuple(args), kwargs or {})
+            return f
+
+        if callback is not None:
+            return inner(callback)
+
+        return inner
+
+    def on_action_recv(self, action_id: str, callback=None, log_reception: bool = True):
+        def inner(func):
+            async def handler(value, request_id: Optional[str] = None):
+                if log_reception:
+                    actions_logger.info("The protocol: %r was called with the arguments: %r", action_id, (value,))
+                res = await _call(func, value)
+                data = {"actionId": action_id, "value": res}
+                if request_id is not None:
+                    # Sent back with the result, so the object that sent the action can match it with its request
+                    data["requestId"] = request_id
+                await self.__send_event(ALIVE_IOT_EVENT.SEND_ACTION_DONE, data)
+
+            self._protocols[action_id] = handler
+            return func
+
+        if callback is not None:
+            return inner(callback)
+
+        return inner
+
+    # ################################# Private methods ################################# #
+
+    def _make_metrics(self) -> Optional[ObjMetrics]:
+        metrics = super()._make_metrics()
+        if metrics is not None:
+            metrics.gauge("aliot_handler_tasks", "Handler tasks running on the loop", lambda: len(self.__tasks))
+        return metrics
+
+    def __spawn(self, coro) -> asyncio.Task:
+        # Keeps a reference to the task so it is not garbage collected and can be cancelled on close
+        task = asyncio.get_running_loop().create_task(coro)
+        self.__tasks.add(task)
+        task.add_done_callback(self.__task_done)
+        return task
+
+    def __task_done(self, task: asyncio.Task):
+        self.__tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            log_err("In a handler of %r: %r", self.name, task.exception())
+
+    async def __send_event(self, event: ALIVE_IOT_EVENT, data: Optional[dict], *, replaying: bool = False) -> bool:
+        """Returns False if the event was not handed to the connection (kept in the outbox or not connected)"""
+        if self._keeps_offline(event, replaying):
+            if not replaying:
+                self._offline_outbox.append(event.value, data)
+            return False
+        if not self._connected:
+            return False
+        sending = asyncio.get_running_loop().create_future()
+        self.__sending.add(sending)
+        try:
+            bucket = self._rate_limits.get(event.value)
+            if bucket is not None:
+                # Only the limited coroutine waits for its token, the pongs and action results are sent meanwhile
+                await asyncio.sleep(bucket.reserve())
+            data_encoded = self._encode_event(event, data)
+            self._log_info("[Sending] %r", data_encoded)
+            await self.__ws.send(data_encoded)
+            self._count_sent(event.value, data_encoded)
+        finally:
+            self.__sending.discard(sending)
+            sending.set_result(None)
+        return True
+
+    async def __in_executor(self, func: Callable, *args):
+        # requests is blocking, the REST calls run in the default executor of the loop
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    def __receive_listen(self, fields: dict):
+        self.__spawn(self.__execute_listen(self._match_listeners(fields)))
+
+    async def __execute_listen(self, matches: list[tuple[dict, dict]]):
+        for listener, fields_to_return in matches:
+            await self.__timed("listener", listener["func"], fields_to_return)
+
+    async def __execute_broadcast(self, data: dict):
+        if self._broadcast_listener:
+            await self.__timed("broadcast", self._broadcast_listener, data)
+
+    async def __timed(self, handler: str, func: Handler, *args):
+        with nullcontext() if self._metrics is None else self._metrics.handler(handler).time():
+            return await _call(func, *args)
+
+    async def __execute_protocol(self, msg: dict | list):
+        if isinstance(msg, list):
+            for m in msg:
+                await self.__execute_protocol(m)
+            return
+        must_have_keys = "id", "value"
+        if not all(key in msg for key in must_have_keys):
+            log_warning("The message received by %r does not have a valid structure: %r", self.name, msg)
+            return
+
+        msg_id = msg["id"]
+        protocol = self._protocols.get(msg_id)
+
+        if protocol is None:
+            log_err("The protocol with the id %r is not implemented", msg_id)
+        else:
+            await self.__timed(f"action:{msg_id}", protocol, msg["value"], msg.get("requestId"))
+
+    async def __connect_success(self, data=None):
+        self._accept_codec(data)
+        resumed = self._session.accept(data)
+        if resumed or len(self._listeners) == 0:
+            self.__set_connected_to_alivecode(resumed)
+        # Registers the listeners on ALIVEcode, or only the ones changed while disconnected if the session resumed
+        await self.__sync_subscriptions()
+
+    def __cancel_on_start(self):
+        if self.__on_start_task is not None and not self.__on_start_task.done():
+            self.__on_start_task.cancel()
+
+    def _schedule_subscription_sync(self):
+        if self._subscribe_window <= 0:
+            self.__spawn(self.__sync_subscriptions())
+        elif self.__subscription_sync is None:
+            self.__subscription_sync = asyncio.get_running_loop().call_later(
+                self._subscribe_window, self.__flush_subscriptions
+            )
+
+    def __flush_subscriptions(self):
+        self.__subscription_sync = None
+        if self._connected_to_alivecode:
+            self.__spawn(self.__sync_subscriptions())
+
+    async def __sync_subscriptions(self):
+        added, removed = self._subscription_changes()
+        if removed:
+            await self.__send_event(ALIVE_IOT_EVENT.UNSUBSCRIBE_LISTENER, {"fields": removed})
+        if added:
+            await self.__send_event(ALIVE_IOT_EVENT.SUBSCRIBE_LISTENER, {"fields": added})
+
+    def __set_connected_to_alivecode(self, resumed: bool = False):
+        if self._connected_to_alivecode:
+            # The success of an incremental subscription
+            return
+        log_success("Object %r", self.name, title="Resumed" if resumed else "Connected")
+        self._connected_to_alivecode = True
+        self._backoff.reset()
+        self.__spawn(self.__start())
+
+    async def __start(self):
+        await self.__replay_offline_events()
+        running = self.__on_start_task is not None and not self.__on_start_task.done()
+        if self._on_start is not None and self._session.should_run_on_start(running):
+            # Not tracked with the handlers: unless on_start_on_reconnect is "always", it survives the reconnections
+            self.__on_start_task = asyncio.get_running_loop().create_task(
+                _call(self._on_start[0], *self._on_start[1], **self._on_start[2])
+            )
+            self.__on_start_task.add_done_callback(self.__task_done)
+
+    async def __replay_offline_events(self):
+        if self._offline_outbox is None:
+            return
+        while True:
+            # The events sent during the replay go to the outbox and are replayed by the next round
+            events = self._offline_outbox.drain()
+            if not events:
+                self._outbox_flushed = True
+                return
+            log_info("Sending %d event(s) of %r kept while offline", len(events), self.name)
+            for i, (event, data) in enumerate(events):
+                try:
+                    sent = await self.__send_event(ALIVE_IOT_EVENT(event), data, replaying=True)
+                except asyncio.CancelledError:
+                    # The task is cancelled when the connection closes
+                    self._offline_outbox.restore(events[i:])
+                    raise
+                except websockets.exceptions.ConnectionClosed:
+                    sent = False
+                if not sent:
+                    # The connection dropped again, the events go back to the outbox before the ones kept since
+                    self._offline_outbox.restore(events[i:])
+                    return
+
+    async def __handle_error(self, data, terminate: bool = False):
+        log_err("%s", data)
+        if terminate:
+            self._connected_to_alivecode = False
+            log_fail(title="Connection closed due to an error")
+            await self.__ws.close()
+
+    def _make_event_handlers(self) -> dict[str, Handler]:
+        # Handlers return either None, a task they spawned or a coroutine to await inline
+        return {
+            ALIVE_IOT_EVENT.CONNECT_SUCCESS.value: self.__connect_success,
+            ALIVE_IOT_EVENT.RECEIVE_ACTION.value: lambda data: self.__spawn(self.__execute_protocol(data)),
+            ALIVE_IOT_EVENT.RECEIVE_ACTION_DONE.value: self._receive_action_done,
+            ALIVE_IOT_EVENT.RECEIVE_LISTEN.value: lambda data: self.__receive_listen(data["fields"]),
+            ALIVE_IOT_EVENT.RECEIVE_BROADCAST.value: lambda data: self.__spawn(
+                self.__execute_broadcast(data["data"])
+            ),
+            ALIVE_IOT_EVENT.SUBSCRIBE_LISTENER_SUCCESS.value: lambda data: self.__set_connected_to_alivecode(),
+            ALIVE_IOT_EVENT.ERROR.value: lambda data: self.__handle_error(data, self._is_fatal_error(data)),
+            ALIVE_IOT_EVENT.PING.value: lambda data: self.__send_event(ALIVE_IOT_EVENT.PONG, None),
+        }
+
+    async def __on_message(self, message):
+        if self._metrics is None:
+            msg = self._decoder.decode(message)
+        else:
+            with self._metrics.decode.time():
+                msg = self._decoder.decode(message)
+            self._metrics.received(msg["event"], len(message))
+
+        handler = self._event_handlers.get(msg["event"])
+        if handler is not None:
+            result = handler(msg["data"])
+            if inspect.iscoroutine(result):
+                await result
+
+    async def __connect(self) -> bool:
+        """Runs one connection until it is closed. Returns True if the connection was opened"""
+        log_info("%r...", self.name, title="Connecting")
+        try:
+            self.__ws = await websockets.connect(
+                self._ws_url,
+                # None disables the pings
+                ping_interval=self._ping_interval or None,
+                ping_timeout=self._ping_timeout,
+            )
+        except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException) as e:
+            log_err("%r", e)
+            return False
+
+        self._connected = True
+        try:
+            if self.auth_token is None:
+                await self.__handle_error(MISSING_AUTH_TOKEN, terminate=True)
+            else:
+                await self.__send_event(ALIVE_IOT_EVENT.CONNECT_OBJECT, self._connect_data())
+            async for message in self.__ws:
+                await self.__on_message(message)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        except Exception as e:
+            log_err("%r", e)
+            await self.__ws.close()
+        finally:
+            await self.__on_close(self.__ws.close_code, self.__ws.close_reason or None)
+        return True
+
+    async def __on_close(self, status_code, msg):
+        self._reset_connection(status_code)
+        for task in list(self.__tasks):
+            task.cancel()
+        if self._session.on_start_policy is OnStartPolicy.ALWAYS:
+            self.__cancel_on_start()
+        self._on_end and await _call(self._on_end[0], *self._on_end[1], **self._on_end[2])
+
+        if status_code is not None and status_code != 1000:
+            log_fail(title="Status code : %s" % status_code)
+            if msg is not None:
+                log_fail(title="Message : %s" % msg)
+            log_fail(title="Connection closed")
+        else:
+            log_info(title="Connection closed")
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import random
+from typing import Callable
+
+# * Close codes sent by a server shutting down cleanly (normal closure, going away) #
+CLEAN_CLOSE_CODES = frozenset({1000, 1001})
+
+
+class Backoff:
+    """
+    Exponential backoff between reconnection attempts, with jitter.
+
+    The n-th delay is drawn between half and all of `min(cap, base * 2 ** n)`, so a fleet of objects
+    disconnected at the same moment doesn't reconnect at the same moment.
+    """
+
+    def __init__(self, base: float = 1.0, cap: float = 60.0, rand: Callable[[], float] = random.random):
+        if base <= 0 or cap < base:
+            raise ValueError("The base of a Backoff must be greater than 0 and smaller than its cap")
+        self.__base = base
+        self.__cap = cap
+        self.__rand = rand
+        self.__attempts = 0
+
+    # ################################# Properties ################################# #
+
+    @property
+    def base(self) -> float:
+        return self.__base
+
+    @property
+    def cap(self) -> float:
+        return self.__cap
+
+    @property
+    def attempts(self) -> int:
+        return self.__attempts
+
+    # ################################# Public methods ################################# #
+
+    def next(self) -> float:
+        """Returns the delay before the next attempt"""
+        # The exponent is bounded, the delay reaches the cap long before the float overflows
+        delay = min(self.__cap, self.__base * 2 ** min(self.__attempts, 64))
+        self.__attempts += 1
+        return delay / 2 + self.__rand() * delay / 2
+
+    def restart(self) -> float:
+        """
+        Returns the delay before reconnecting to a server that closed cleanly (a redeploy): less than `base`,
+        only spread enough to avoid every object reconnecting at once
+        """
+        self.__attempts = 0
+        return self.__rand() * self.__base
+
+    def reset(self):
+        self.__attempts = 0
@@ -0,0 +1,514 @@
+from __future__ import annotations
+
+import json
+from configparser import ConfigParser
+from typing import TYPE_CHECKING, Callable, Iterable, Optional
+
+from aliot.backoff import Backoff, CLEAN_CLOSE_CODES
+from aliot.codecs import get_codec, parse_codecs
+from aliot.constants import ALIVE_IOT_EVENT
+from aliot.core._config.config import get_config, get_obj_config_value, to_bool
+from aliot.decoder import DefaultDecoder
+from aliot.doc_cache import DocCache, MISSING
+from aliot.doc_path import project
+from aliot.encoder import DefaultEncoder
+from aliot.http_session import HttpSession
+from aliot.image_upload import ImageBody, MultipartStream
+from aliot.listener_index import ListenerIndex, Subscription
+from aliot.logger import frames_logger, log_err, log_warning
+from aliot.metrics import ObjMetrics, start_http_server
+from aliot.offline_outbox import OfflineOutbox
+from aliot.rate_limit import TokenBucket, parse_rate_limits
+from aliot.session import OnStartPolicy, Session
+
+if TYPE_CHECKING:
+    from aliot.encoder import Encoder
+    from aliot.decoder import Decoder
+
+MISSING_AUTH_TOKEN = (
+    "IoTObjects now require an AuthToken to securely connect to ALIVEiot. Please make sure to register an AuthToken "
+    "on your IoTObject on ALIVEcode from your IoT Dashboard and add in your config.ini: auth_token = <your_auth_token>"
+)
+
+
+class BaseAliotObj:
+    """
+    State and logic shared by `AliotObj` and `AsyncAliotObj`: the configuration, the codecs, the listeners and
+    their subscriptions, the document cache, the offline outbox, the REST calls and the metrics.
+
+    The subclasses only do the I/O: writing the events to the websocket, running the handlers and the connection loop.
+    They must implement `_make_event_handlers` and `_schedule_subscription_sync`, set `_action_requests` and set
+    `_metrics` (with `_make_metrics`) once their own members exist.
+    """
+
+    # * Default of the ping_timeout config value #
+    _default_ping_timeout = 10.0
+
+    def __init__(self, name: str, config: Optional[ConfigParser] = None):
+        self._name = name
+        self._config = get_config() if config is None else config
+        self._json_backend: Optional[str] = self._get_config_value("json_backend")
+        self._encoder = DefaultEncoder(self._json_backend)
+        self._decoder = DefaultDecoder(self._json_backend)
+        self._protocols: dict[str, Callable] = {}
+        self._listeners = ListenerIndex()
+        self._broadcast_listener: Optional[Callable] = None
+        self._connected_to_alivecode = False
+        self._connected = False
+        self._stopped = False
+        self._on_start: Optional[tuple[Callable, tuple, dict]] = None
+        self._on_end: Optional[tuple[Callable, tuple, dict]] = None
+        self._log = False
+        self._api_url: str = self._get_config_value("api_url")
+        self._ws_url: str = self._get_config_value("ws_url")
+        self._ping_interval: float = self._get_config_value("ping_interval", 20.0, float)
+        self._ping_timeout: Optional[float] = (
+            self._get_config_value("ping_timeout", self._default_ping_timeout, float) or None
+        )
+        self._check_ping_config()
+        self._backoff = Backoff(
+            self._get_config_value("reconnect_delay", 1.0, float),
+            self._get_config_value("reconnect_max_delay", 60.0, float),
+        )
+        # * True when the last connection was closed cleanly by the server (a restart of the gateway) #
+        self._server_restarted = False
+        self._session = Session(
+            self._get_config_value("on_start_on_reconnect", OnStartPolicy.IF_STOPPED, OnStartPolicy)
+        )
+        self._subscribe_window: float = self._get_config_value("subscribe_batch_window", 0.05, float)
+        self._codecs: list[str] = self._get_config_value("codecs", [], parse_codecs)
+        # * event -> bucket limiting how often the event is sent #
+        self._rate_limits: dict[str, TokenBucket] = self._get_config_value("rate_limits", {}, parse_rate_limits)
+        self._max_actions_in_flight: int = self._get_config_value("max_actions_in_flight", 100, int)
+        self._action_timeout: Optional[float] = self._get_config_value("action_timeout", 30.0, float) or None
+        # * Seconds stop() waits for the pending events to be written before closing the connection #
+        self._stop_timeout: float = self._get_config_value("stop_timeout", 5.0, float)
+        self._http = HttpSession(
+            self._get_config_value("http_pool_size", 10, int),
+            self._get_config_value("http_timeout", 10.0, float),
+            self._get_config_value("http_retries", 3, int),
+            self._get_config_value("http_backoff", 0.5, float),
+        )
+        self._event_handlers = self._make_event_handlers()
+        self._offline_outbox: Optional[OfflineOutbox] = self._make_offline_outbox()
+        # * True once the events kept offline were replayed on the current connection #
+        self._outbox_flushed = False
+        self._doc_cache: Optional[DocCache] = self._make_doc_cache()
+        # * Set to False once the server answered that it has no get_fields endpoint #
+        self._get_fields_supported = True
+        self._metrics: Optional[ObjMetrics] = None
+
+    # ################################# Properties ################################# #
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def encoder(self) -> Encoder:
+        return self._encoder
+
+    @encoder.setter
+    def encoder(self, encoder: Encoder):
+        self._encoder = encoder
+
+    @property
+    def decoder(self) -> Decoder:
+        return self._decoder
+
+    @decoder.setter
+    def decoder(self, decoder: Decoder):
+        self._decoder = decoder
+
+    @property
+    def ws_url(self) -> str:
+        return self._ws_url
+
+    @ws_url.setter
+    def ws_url(self, value: str):
+        self._ws_url = value
+
+    @property
+    def api_url(self) -> str:
+        return self._api_url
+
+    @api_url.setter
+    def api_url(self, value: str):
+        self._api_url = value
+
+    @property
+    def http_session(self) -> HttpSession:
+        """The session used for the REST calls to ALIVEcode"""
+        return self._http
+
+    @property
+    def object_id(self):
+        return self._get_config_value("obj_id")
+
+    @property
+    def auth_token(self):
+        return self._get_config_value("auth_token")
+
+    @property
+    def protocols(self):
+        """Returns a copy of the protocols dict"""
+        return self._protocols.copy()
+
+    @property
+    def listeners(self):
+        """Returns a copy of the listeners list"""
+        return self._listeners.listeners
+
+    @property
+    def broadcast_listener(self):
+        return self._broadcast_listener
+
+    @property
+    def event_handlers(self):
+        """Returns a copy of the dict mapping every handled event to its handler"""
+        return self._event_handlers.copy()
+
+    @property
+    def doc_cache(self) -> Optional[DocCache]:
+        """Returns the cache of the fields read with `get_doc`, or None if the cache is disabled"""
+        return self._doc_cache
+
+    @property
+    def connected(self):
+        return self._connected
+
+    @property
+    def connected_to_alivecode(self):
+        return self._connected_to_alivecode
+
+    # ################################# Public methods ################################# #
+
+    def subscribe(self, fields: list[str], callback: Callable) -> Subscription:
+        """
+        Listens to document fields, like `listen_doc`, and returns a handle to stop listening to them.
+        While connected, the changes of the subscriptions made within `subscribe_batch_window` seconds
+        are sent to the server together.
+        """
+        return Subscription(self._add_listener(fields, callback), self.unsubscribe)
+
+    def unsubscribe(self, subscription: Subscription) -> bool:
+        """Stops a listener returned by `subscribe`. Returns False if it was already stopped"""
+        if not self._listeners.remove(subscription.listener):
+            return False
+        if self._connected_to_alivecode:
+            self._schedule_subscription_sync()
+        return True
+
+    # ################################# Decorators methods ################################# #
+
+    def listen_doc(self, fields: list[str], callback=None):
+        def inner(func):
+            self._add_listener(fields, func)
+            return func
+
+        if callback is not None:
+            return inner(callback)
+
+        return inner
+
+    def listen_broadcast(self, callback=None):
+        def inner(func):
+            self._broadcast_listener = func
+            return func
+
+        if callback is not None:
+            return inner(callback)
+
+        return inner
+
+    def on_event(self, event: str | ALIVE_IOT_EVENT, callback=None):
+        """
+        Registers a handler for an event that aliot doesn't handle itself.
+        The handler receives the data of the event.
+        """
+        if isinstance(event, ALIVE_IOT_EVENT):
+            event = event.value
+
+        def inner(func):
+            if event in self._event_handlers:
+                raise ValueError(f"The event {event!r} already has a handler")
+            self._event_handlers[event] = func
+            return func
+
+        if callback is not None:
+            return inner(callback)
+
+        return inner
+
+    # ################################# Subclass methods ################################# #
+
+    def _make_event_handlers(self) -> dict[str, Callable]:
+        raise NotImplementedError
+
+    def _schedule_subscription_sync(self):
+        """Sends the changes of the subscriptions, once the subscribe window elapsed"""
+        raise NotImplementedError
+
+    # ################################# Shared methods ################################# #
+
+    def _log_info(self, msg: str, *args):
+        # The arguments are only formatted if the record is emitted
+        if self._log:
+            frames_logger.debug(msg, *args)
+
+    def _get_config_value(self, key, fallback=None, cast=None):
+        return get_obj_config_value(self._config, self._name, key, fallback, cast)
+
+    def _encode_event(self, event: ALIVE_IOT_EVENT, data: Optional[dict], *, as_bytes: bool = False):
+        data_sent = {"event": event.value, "data": data}
+        encode = self._encoder.encode_bytes if as_bytes else self._encoder.encode
+        if self._metrics is None:
+            data_encoded = encode(data_sent)
+        else:
+            with self._metrics.encode.time():
+                data_encoded = encode(data_sent)
+        self._log_info("[Encoding] %r", data_sent)
+        return data_encoded
+
+    def _count_sent(self, event: str, data_encoded):
+        """Counts a message once it was written to the connection (the dropped or waiting ones are not)"""
+        if self._metrics is not None:
+            self._metrics.sent(event, len(data_encoded))
+
+    def _check_ping_config(self):
+        """Raises a ValueError if the heartbeat options are invalid, before the first connection"""
+        if self._ping_interval < 0 or (self._ping_timeout or 0) < 0:
+            raise ValueError(f"The ping_interval and ping_timeout of {self.name!r} must not be negative")
+
+    def _connect_data(self) -> dict:
+        """Returns the data of the CONNECT_OBJECT event starting every connection"""
+        connect_data = {"id": self.object_id, "token": self.auth_token}
+        resume = self._session.resume_hint()
+        if resume is not None:
+            connect_data["resume"] = resume
+        if self._codecs:
+            # Every connection starts in json, until the server accepts one of the codecs
+            self._encoder = DefaultEncoder(self._json_backend)
+            self._decoder = DefaultDecoder(self._json_backend)
+            connect_data["codecs"] = self._codecs
+        return connect_data
+
+    def _accept_codec(self, data):
+        # The server picks one of the codecs offered in CONNECT_OBJECT, or none if it doesn't support the negotiation
+        codec = data.get("codec") if isinstance(data, dict) else None
+        if not self._codecs or codec is None or codec == self._encoder.name:
+            return
+        if codec not in self._codecs:
+            log_warning("The server chose the codec %r, which was not offered. Keeping %r", codec, self._encoder.name)
+            return
+        self._encoder, self._decoder = get_codec(codec)
+
+    def _reset_connection(self, status_code):
+        """Resets the state of the object once its connection closed"""
+        # Only a server that accepted the object is restarting, an object closed for an error must wait
+        self._server_restarted = self._connected_to_alivecode and status_code in CLEAN_CLOSE_CODES
+        self._connected = False
+        self._connected_to_alivecode = False
+        self._outbox_flushed = False
+        if self._doc_cache is not None:
+            # Changes made while disconnected are never pushed, nothing in the cache can be trusted anymore
+            self._doc_cache.clear()
+        self._action_requests.fail_all(ConnectionError("The connection closed before the result of the action"))
+
+    @staticmethod
+    def _is_fatal_error(data) -> bool:
+        return data == "Forbidden. Invalid credentials." or "is not registered" in data
+
+    def _receive_action_done(self, data):
+        # Results of the actions sent without expecting a result (or already timed out) are ignored
+        if isinstance(data, dict) and data.get("requestId") is not None:
+            self._action_requests.resolve(data["requestId"], data.get("value"))
+
+    # ---------- Listeners and subscriptions ----------#
+
+    def _add_listener(self, fields: list[str], func: Callable) -> dict:
+        listener = self._listeners.add(fields, func)
+        if self._connected_to_alivecode:
+            # A listener added at runtime: only its new fields are sent
+            self._schedule_subscription_sync()
+        return listener
+
+    def _subscription_changes(self) -> tuple[list[str], list[str]]:
+        """
+        Returns the fields to subscribe and to unsubscribe: only the difference with the fields the server already
+        pushes is sent, a field subscribed and unsubscribed within the same window is never sent
+        """
+        added, removed = self._session.update_subscriptions(self._listeners.fields)
+        if removed and self._doc_cache is not None:
+            # The server stops pushing them, their cached values would go stale
+            self._doc_cache.invalidate_pushed(self._listeners.subscribes)
+        return added, removed
+
+    def _match_listeners(self, fields: dict) -> list[tuple[dict, dict]]:
+        """Returns the listeners of the fields pushed by the server, with the fields each of them receives"""
+        # The cache is updated before the listeners run, so they read the new values with get_doc
+        if self._doc_cache is not None:
+            self._doc_cache.update(fields)
+        return list(self._listeners.match(fields))
+
+    # ---------- Document cache and REST calls ----------#
+
+    def _make_doc_cache(self) -> Optional[DocCache]:
+        ttl = self._get_config_value("doc_cache_ttl", 0, float)
+        if ttl <= 0:
+            return None
+        return DocCache(ttl)
+
+    def _cache_version(self) -> Optional[int]:
+        """Version of the cache to read before fetching fields, see `_cache_field`"""
+        return None if self._doc_cache is None else self._doc_cache.version
+
+    def _cache_field(self, field: str, value, version: Optional[int]):
+        if self._doc_cache is None:
+            return
+        # Once the subscription is confirmed, the server pushes every change of the field: it never goes stale
+        pushed = self._connected_to_alivecode and self._listeners.subscribes(field)
+        # Ignored if the field was pushed or updated while the request was in flight
+        self._doc_cache.put(field, value, expires=not pushed, version=version)
+
+    def _get_cached_fields(self, fields: Iterable[str]) -> tuple[dict, list[str]]:
+        """Returns the cached fields and the list of the fields that must be fetched"""
+        fields = list(dict.fromkeys(fields))
+        if self._doc_cache is None:
+            return {}, fields
+        values, missing = {}, []
+        for field in fields:
+            value = self._doc_cache.get(field)
+            if value is MISSING:
+                missing.append(field)
+            else:
+                values[field] = value
+        return values, missing
+
+    def _merge_fetched_fields(self, values: dict, fetched: dict, version: Optional[int]) -> dict:
+        for field, value in fetched.items():
+            self._cache_field(field, value, version)
+        values.update(fetched)
+        return values
+
+    def _post(self, event: ALIVE_IOT_EVENT, **kwargs):
+        return self._http.post(f"{self._api_url}/iot/aliot/{event.value}", **kwargs)
+
+    def _read(self, event: ALIVE_IOT_EVENT, **kwargs):
+        """POST to a route that only reads the document, retried like an idempotent request"""
+        return self._post(event, idempotent=True, **kwargs)
+
+    @staticmethod
+    def _report_http_error(res, target: str):
+        status = res.status_code
+        if status == 403:
+            log_err("While getting %s, request was Forbidden due to permission errors or project missing.", target)
+        elif status == 500:
+            log_err("While getting %s, something went wrong with the ALIVEcode's servers, please try again.", target)
+        else:
+            log_err("While getting %s, please try again. %r", target, res.text)
+
+    def _get_doc(self, field: Optional[str] = None):
+        # Blocking, AsyncAliotObj runs it in the default executor of its loop
+        if field:
+            if self._doc_cache is not None:
+                value = self._doc_cache.get(field)
+                if value is not MISSING:
+                    return value
+            version = self._cache_version()
+            res = self._read(ALIVE_IOT_EVENT.GET_FIELD, data={"id": self.object_id, "field": field})
+            if res.status_code == 201:
+                value = json.loads(res.text) if res.text else None
+                self._cache_field(field, value, version)
+                return value
+            self._report_http_error(res, f"the field {field}")
+        else:
+            res = self._read(ALIVE_IOT_EVENT.GET_DOC, data={"id": self.object_id})
+            if res.status_code == 201:
+                return json.loads(res.text) if res.text else None
+            self._report_http_error(res, "the document")
+
+    def _get_fields(self, fields: Iterable[str]) -> Optional[dict]:
+        values, missing = self._get_cached_fields(fields)
+        if not missing:
+            return values
+
+        version = self._cache_version()
+        if self._get_fields_supported:
+            res = self._read(ALIVE_IOT_EVENT.GET_FIELDS, json={"id": self.object_id, "fields": missing})
+            if res.status_code == 201:
+                fetched = json.loads(res.text) if res.text else {}
+                return self._merge_fetched_fields(values, {field: fetched.get(field) for field in missing}, version)
+            if res.status_code != 404:
+                self._report_http_error(res, f"the fields {', '.join(missing)}")
+                return None
+            self._get_fields_supported = False
+
+        res = self._read(ALIVE_IOT_EVENT.GET_DOC, data={"id": self.object_id})
+        if res.status_code != 201:
+            self._report_http_error(res, "the document")
+            return None
+        document = json.loads(res.text) if res.text else None
+        return self._merge_fetched_fields(values, project(document, missing), version)
+
+    def _upload_image(self, buffer: ImageBody, filename: str, content_type: str):
+        stream = MultipartStream({"id": self.object_id}, "file", filename, content_type, buffer)
+        res = self._post(ALIVE_IOT_EVENT.UPLOAD_IMAGE, data=stream, headers={"Content-Type": stream.content_type})
+        if not res.ok:
+            log_err("While uploading the image %s, please try again. %r", filename, res.text)
+        return res
+
+    # ---------- Offline outbox ----------#
+
+    def _make_offline_outbox(self) -> Optional[OfflineOutbox]:
+        path = self._get_config_value("offline_outbox")
+        if path is None:
+            return None
+        return OfflineOutbox(
+            path,
+            self._get_config_value("offline_outbox_max_events", 10_000, int),
+            self._get_config_value("offline_outbox_retention", None, float),
+        )
+
+    def _keeps_offline(self, event: ALIVE_IOT_EVENT, replaying: bool = False) -> bool:
+        """
+        Returns True if the event must go to the offline outbox: while disconnected, and while connected until the
+        events kept offline were replayed, so the older values of the replay never overwrite a newer one.
+        The events of the replay itself are sent as soon as the object is connected.
+        """
+        if self._offline_outbox is None or not self._offline_outbox.accepts(event.value):
+            return False
+        return not self._connected or not (replaying or self._outbox_flushed)
+
+    # ---------- Metrics ----------#
+
+    def _make_metrics(self) -> Optional[ObjMetrics]:
+        """Creates the metrics of the object, the subclasses add the gauges of their own members"""
+        port = self._get_config_value("metrics_port", None, int)
+        if not self._get_config_value("metrics", port is not None, to_bool):
+            return None
+        metrics = ObjMetrics(self._name)
+        metrics.gauge(
+            "aliot_connected",
+            "1 while the object is connected to ALIVEcode",
+            lambda: int(self._connected_to_alivecode),
+        )
+        metrics.gauge(
+            "aliot_actions_in_flight",
+            "Actions sent waiting for their result",
+            lambda: self._action_requests.in_flight,
+        )
+        if self._offline_outbox is not None:
+            metrics.gauge(
+                "aliot_offline_outbox_events",
+                "Events kept in the offline outbox",
+                lambda: len(self._offline_outbox),
+            )
+        self._http.hooks["response"].append(
+            lambda res, *args, **kwargs: metrics.http_response(
+                res.url.rsplit("/", 1)[-1], res.elapsed.total_seconds(), res.status_code
+            )
+        )
+        if port is not None:
+            start_http_server(port)
+        return metrics
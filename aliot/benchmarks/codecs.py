@@ -0,0 +1,75 @@
+"""
+Compares the size and the encode/decode time of the codecs on realistic `update_doc` payloads.
+
+Run with `python -m aliot.benchmarks.codecs`
+"""
+from __future__ import annotations
+
+import random
+from timeit import Timer
+from typing import Callable
+
+from aliot.codecs import available_codecs, get_codec
+from aliot.constants import ALIVE_IOT_EVENT
+
+
+def make_update_doc_payloads(count: int = 100, fields: int = 8, seed: int = 0) -> list[dict]:
+    """Builds `update_doc` events like the ones sent by a device reading a few sensors"""
+    rng = random.Random(seed)
+    payloads = []
+    for i in range(count):
+        doc_fields = {
+            "/doc/temperature": round(rng.uniform(-20, 40), 2),
+            "/doc/humidity": rng.randint(0, 100),
+            "/doc/light": rng.random() > 0.5,
+            "/doc/status": rng.choice(["ok", "warning", "error"]),
+            "/doc/accelerometer": [round(rng.gauss(0, 1), 4) for _ in range(3)],
+            "/doc/timestamp": 1_700_000_000 + i,
+        }
+        for j in range(max(0, fields - len(doc_fields))):
+            doc_fields[f"/doc/sensors/sensor_{j}"] = round(rng.uniform(0, 1024), 3)
+        payloads.append({"event": ALIVE_IOT_EVENT.UPDATE_DOC.value, "data": {"fields": doc_fields}})
+    return payloads
+
+
+def _best_time(func: Callable[[], object], repeat: int, number: int) -> float:
+    return min(Timer(func).repeat(repeat=repeat, number=number)) / number
+
+
+def bench_codecs(
+    payloads: list[dict], codecs: list[str] = ("json", "msgpack", "cbor"), repeat: int = 5, number: int = 20
+) -> dict[str, dict]:
+    """
+    Returns, for every installed codec, the mean size of an encoded payload (in bytes) and the
+    time taken to encode and to decode one payload (in microseconds)
+    """
+    results = {}
+    for name in available_codecs(list(codecs)):
+        encoder, decoder = get_codec(name)
+        encoded = [encoder.encode(payload) for payload in payloads]
+        sizes = [len(e.encode() if isinstance(e, str) else e) for e in encoded]
+
+        encode_time = _best_time(lambda: [encoder.encode(payload) for payload in payloads], repeat, number)
+        decode_time = _best_time(lambda: [decoder.decode(e) for e in encoded], repeat, number)
+        results[name] = {
+            "size": sum(sizes) / len(sizes),
+            "encode_us": encode_time / len(payloads) * 1e6,
+            "decode_us": decode_time / len(payloads) * 1e6,
+        }
+    return results
+
+
+def main():
+    payloads = make_update_doc_payloads()
+    results = bench_codecs(payloads)
+    reference = results["json"]
+    print(f"{'codec':<10}{'size (B)':>12}{'encode (us)':>14}{'decode (us)':>14}{'size vs json':>14}")
+    for name, result in results.items():
+        print(
+            f"{name:<10}{result['size']:>12.1f}{result['encode_us']:>14.2f}{result['decode_us']:>14.2f}"
+            f"{result['size'] / reference['size']:>14.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
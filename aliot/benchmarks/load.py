@@ -0,0 +1,195 @@
+"""
+Load test of the objects: many simulated `AsyncAliotObj` on one event loop, each sending document updates at a
+fixed rate and listening to its own field. The latency is the time between an `update_doc` and the
+`receive_listen` pushed back by the server.
+
+Run with `python -m aliot.benchmarks.load --objects 1000 --rate 5 --duration 10`. Without `--ws-url`, the objects
+connect to a `MockAliveServer` started in the same process.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+from configparser import ConfigParser
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Optional
+
+from aliot.hub import AliotHub
+
+
+@dataclass
+class LoadResult:
+    objects: int
+    connected: int
+    duration: float
+    sent: int
+    received: int
+    # * Seconds until every object was connected #
+    connect_seconds: float
+    latencies: list[float] = field(default_factory=list, repr=False)
+
+    @property
+    def throughput(self) -> float:
+        """Updates sent per second"""
+        return self.sent / self.duration if self.duration else 0.0
+
+    def latency(self, quantile: float) -> Optional[float]:
+        """Returns a quantile (0.5 for the median) of the latency, in seconds"""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+    def as_dict(self) -> dict:
+        return {
+            "objects": self.objects,
+            "connected": self.connected,
+            "duration": self.duration,
+            "sent": self.sent,
+            "received": self.received,
+            "throughput": self.throughput,
+            "connect_seconds": self.connect_seconds,
+            "latency": {
+                "p50": self.latency(0.5),
+                "p95": self.latency(0.95),
+                "p99": self.latency(0.99),
+                "max": max(self.latencies, default=None),
+            },
+        }
+
+
+def make_load_config(objects: int, ws_url: str, api_url: str = "") -> ConfigParser:
+    """Builds the configuration of the simulated objects (`load-0`, `load-1`, ...)"""
+    config = ConfigParser()
+    config["DEFAULT"] = {"ws_url": ws_url, "api_url": api_url, "auth_token": "load-test"}
+    for i in range(objects):
+        config[f"load-{i}"] = {"obj_id": f"load-{i}"}
+    return config
+
+
+async def run_load(
+    ws_url: str,
+    api_url: str = "",
+    *,
+    objects: int = 100,
+    rate: float = 10.0,
+    duration: float = 10.0,
+    stagger: float = 0.0,
+    connect_timeout: float = 30.0,
+) -> LoadResult:
+    """
+    Connects the simulated objects, then makes each of them send `rate` updates per second for `duration` seconds
+
+    :param stagger: seconds between the connection of two objects
+    :param connect_timeout: seconds to wait for every object to connect, the test starts with the connected ones
+    """
+    hub = AliotHub.from_config(config=make_load_config(objects, ws_url, api_url), stagger=stagger)
+    started = perf_counter()
+    load = _Load(objects, rate, duration)
+    for obj in hub.objects.values():
+        load.simulate(obj)
+
+    hub_task = asyncio.get_running_loop().create_task(hub.arun(retry=False))
+    try:
+        await asyncio.wait_for(load.all_connected.wait(), connect_timeout)
+    except asyncio.TimeoutError:
+        pass
+    connect_seconds = perf_counter() - started
+
+    load.go.set()
+    await asyncio.sleep(duration)
+    # Lets the last updates come back
+    await asyncio.sleep(min(1.0, duration))
+    for obj in hub.objects.values():
+        await obj.stop()
+    await hub_task
+
+    return LoadResult(
+        objects, load.connected, duration, load.sent, len(load.latencies), connect_seconds, load.latencies
+    )
+
+
+class _Load:
+    """State shared by the simulated objects of a load test"""
+
+    def __init__(self, objects: int, rate: float, duration: float):
+        self.objects = objects
+        self.period = 1 / rate
+        self.duration = duration
+        self.all_connected = asyncio.Event()
+        self.go = asyncio.Event()
+        self.connected = 0
+        self.sent = 0
+        self.latencies: list[float] = []
+
+    def simulate(self, obj):
+        field_path = f"/doc/load/{obj.name}"
+
+        @obj.listen_doc([field_path])
+        def on_update(fields: dict):
+            self.latencies.append(perf_counter() - fields[field_path])
+
+        @obj.on_start()
+        async def start():
+            self.connected += 1
+            if self.connected == self.objects:
+                self.all_connected.set()
+            await self.go.wait()
+            start_time = next_time = perf_counter()
+            while obj.connected_to_alivecode and perf_counter() - start_time < self.duration:
+                await obj.update_doc({field_path: perf_counter()})
+                self.sent += 1
+                next_time += self.period
+                await asyncio.sleep(max(0.0, next_time - perf_counter()))
+
+
+def load_test(ws_url: Optional[str] = None, api_url: str = "", **kwargs) -> LoadResult:
+    """Runs `run_load` in a new event loop, against a local MockAliveServer if `ws_url` is None"""
+    if ws_url is not None:
+        return asyncio.run(run_load(ws_url, api_url, **kwargs))
+
+    from aliot.mock_server import MockAliveServer
+
+    with MockAliveServer(record=False) as server:
+        return asyncio.run(run_load(server.ws_url, server.api_url, **kwargs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the aliot objects")
+    parser.add_argument("--objects", type=int, default=100, help="number of simulated objects")
+    parser.add_argument("--rate", type=float, default=10.0, help="updates per second of each object")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of sending")
+    parser.add_argument("--stagger", type=float, default=0.0, help="seconds between two connections")
+    parser.add_argument("--ws-url", default=None, help="gateway to load (a local mock server if not set)")
+    parser.add_argument("--api-url", default="")
+    parser.add_argument("--json", default=None, help="also write the results to this file")
+    args = parser.parse_args()
+
+    from aliot.logger import configure_logging
+
+    # The connection of every object would flood the console
+    configure_logging(logging.WARNING)
+    result = load_test(
+        args.ws_url,
+        args.api_url,
+        objects=args.objects,
+        rate=args.rate,
+        duration=args.duration,
+        stagger=args.stagger,
+    )
+    results = result.as_dict()
+    print(f"connected    {result.connected}/{result.objects} in {result.connect_seconds:.2f} s")
+    print(f"sent         {result.sent} updates ({result.throughput:.0f}/s)")
+    print(f"received     {result.received} updates")
+    for name, value in results["latency"].items():
+        print(f"latency {name:<4} {'-' if value is None else f'{value * 1000:.2f} ms'}")
+    if args.json is not None:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""
+Benchmarks of the hot paths of the objects, with results comparable across versions.
+
+Run with `aliot bench` (or `python -m aliot.benchmarks.suite`). `--output results.json` saves the results and
+`--compare baseline.json` reports the benchmarks slower than in the baseline, so a regression can fail a CI job.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import platform
+import statistics
+from configparser import ConfigParser
+from contextlib import contextmanager
+from dataclasses import field, make_dataclass
+from datetime import datetime
+from threading import Event, Thread
+from time import perf_counter
+from timeit import Timer
+from typing import Callable, Iterable, Iterator, Optional
+
+from aliot import __version__
+from aliot.benchmarks.codecs import make_update_doc_payloads
+from aliot.constants import ALIVE_IOT_EVENT
+from aliot.logger import logger
+from aliot.state import AliotObjState
+
+# * name -> function running the benchmark, called with `quick` #
+BENCHMARKS: dict[str, Callable[[bool], dict]] = {}
+
+
+def benchmark(name: str):
+    def inner(func: Callable[[bool], dict]):
+        BENCHMARKS[name] = func
+        return func
+
+    return inner
+
+
+def _measure(func: Callable[[], object], number: int, repeat: int, quick: bool) -> dict:
+    """Returns the best and the median time of a call of `func`, in microseconds"""
+    if quick:
+        number, repeat = max(1, number // 10), 3
+    times = [total / number * 1e6 for total in Timer(func).repeat(repeat=repeat, number=number)]
+    return {"unit": "us", "best": min(times), "median": statistics.median(times), "number": number, "repeat": repeat}
+
+
+def _make_obj(**options: str):
+    from aliot.aliot_obj import AliotObj
+
+    config = ConfigParser()
+    config["DEFAULT"] = {"ws_url": "ws://127.0.0.1:9", "api_url": "http://127.0.0.1:9/api", **options}
+    config["bench"] = {"obj_id": "bench", "auth_token": "bench"}
+    return AliotObj("bench", config=config)
+
+
+class _NullWebSocketApp:
+    """Connects right away and discards the frames, so only the work of the object is measured"""
+
+    def __init__(self, url, on_open=None, on_message=None, on_error=None, on_close=None):
+        self.on_open = on_open
+        self.on_message = on_message
+
+    def run_forever(self, **kwargs):
+        self.on_open(self)
+
+    def send(self, data, opcode=None):
+        pass
+
+
+def _connect(obj) -> _NullWebSocketApp:
+    apps = []
+    obj._websocket_app = lambda *args, **kwargs: apps.append(_NullWebSocketApp(*args, **kwargs)) or apps[-1]
+    obj.run(retry=False)
+    return apps[-1]
+
+
+# ################################# Benchmarks ################################# #
+
+
+@benchmark("send_event")
+def bench_send_event(quick: bool) -> dict:
+    """Encoding and sending an update_doc (the socket discards the frame)"""
+    obj = _make_obj()
+    _connect(obj)
+    fields = make_update_doc_payloads(1)[0]["data"]["fields"]
+    return _measure(lambda: obj.update_doc(fields), 2000, 5, quick)
+
+
+@benchmark("on_message")
+def bench_on_message(quick: bool) -> dict:
+    """Decoding a receive_listen and dispatching it to the listener of its fields"""
+    obj = _make_obj()
+    fields = make_update_doc_payloads(1)[0]["data"]["fields"]
+    obj.listen_doc(list(fields), callback=lambda changed: None)
+    app = _connect(obj)
+    message = json.dumps({"event": ALIVE_IOT_EVENT.RECEIVE_LISTEN.value, "data": {"fields": fields}})
+    return _measure(lambda: app.on_message(app, message), 2000, 5, quick)
+
+
+@benchmark("execute_listen")
+def bench_execute_listen(quick: bool) -> dict:
+    """Routing a receive_listen of 100 changed fields to 1000 listeners (900 on exact fields, 100 on wildcards)"""
+    obj = _make_obj()
+    for i in range(900):
+        obj.listen_doc([f"/doc/sensors/{i}"], callback=lambda changed: None)
+    for i in range(100):
+        obj.listen_doc([f"/doc/groups/{i}/*"], callback=lambda changed: None)
+    fields = {f"/doc/sensors/{i * 9}": i for i in range(50)}
+    fields.update({f"/doc/groups/{i * 2}/value": i for i in range(50)})
+    app = _connect(obj)
+    message = json.dumps({"event": ALIVE_IOT_EVENT.RECEIVE_LISTEN.value, "data": {"fields": fields}})
+    return _measure(lambda: app.on_message(app, message), 500, 5, quick)
+
+
+@benchmark("as_doc")
+def bench_as_doc(quick: bool) -> dict:
+    """Building the document of a dataclass state with 200 fields and 10 flattened nested states"""
+    nested_cls = make_dataclass(
+        "NestedState", [(f"value_{i}", float, field(default=0.0)) for i in range(5)], bases=(AliotObjState,)
+    )
+    fields = [(f"field_{i}", int, field(default=i)) for i in range(200)]
+    fields += [
+        (f"nested_{i}", AliotObjState, field(default_factory=nested_cls, metadata={"flatten": True}))
+        for i in range(10)
+    ]
+    state = make_dataclass("LargeState", fields, bases=(AliotObjState,))()
+    return _measure(lambda: state.as_doc(), 500, 5, quick)
+
+
+@benchmark("reconnect")
+def bench_reconnect(quick: bool) -> dict:
+    """
+    Time an AliotObj takes to be connected to ALIVEcode again once its connection was closed by a restart of a local
+    mock server: from its on_end to its next on_start (retry delay, handshake, authentication and subscriptions)
+    """
+    try:
+        from aliot.mock_server import MockAliveServer
+    except ImportError as e:  # pragma: no cover - optional dependency
+        return {"skipped": repr(e)}
+
+    reconnections = 3 if quick else 20
+    closed, opened = [], []
+    connected = Event()
+    with MockAliveServer(record=False) as server:
+        obj = _make_obj(
+            ws_url=server.ws_url, api_url=server.api_url, reconnect_delay="0.001", ping_interval="1", ping_timeout="0.2"
+        )
+        obj.on_end(callback=lambda: closed.append(perf_counter()))
+        obj.on_start(callback=lambda: (opened.append(perf_counter()), connected.set()))
+        thread = Thread(target=obj.run, daemon=True)
+        thread.start()
+        if not connected.wait(5):
+            return {"skipped": "the object could not connect to the mock server"}
+
+        times = []
+        for _ in range(reconnections):
+            connected.clear()
+            server.disconnect()
+            if not connected.wait(5):
+                break
+            times.append((opened[-1] - closed[-1]) * 1e3)
+        obj.stop()
+        thread.join(5)
+
+    if not times:
+        return {"skipped": "the object did not reconnect"}
+    return {"unit": "ms", "best": min(times), "median": statistics.median(times), "number": 1, "repeat": len(times)}
+
+
+# ################################# Running and comparing ################################# #
+
+
+@contextmanager
+def _quiet() -> Iterator[None]:
+    # The objects log every connection, which would bury the results
+    level = logger.level
+    logger.setLevel(logging.ERROR)
+    try:
+        yield
+    finally:
+        logger.setLevel(level)
+
+
+def run_benchmarks(names: Optional[Iterable[str]] = None, *, quick: bool = False) -> dict:
+    """Runs the benchmarks (every one if `names` is None) and returns their results with the environment"""
+    names = list(BENCHMARKS) if names is None else list(names)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise ValueError(f"Unknown benchmarks {unknown!r}, expected some of {list(BENCHMARKS)!r}")
+
+    with _quiet():
+        results = {name: BENCHMARKS[name](quick) for name in names}
+    return {
+        "aliot": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "quick": quick,
+        "benchmarks": results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.1) -> list[dict]:
+    """
+    Compares the best times of the benchmarks run in both results
+
+    :param threshold: relative slowdown above which a benchmark is reported as a regression (0.1 for 10%)
+    """
+    rows = []
+    for name, result in current["benchmarks"].items():
+        before = baseline.get("benchmarks", {}).get(name)
+        if before is None or "best" not in before or "best" not in result or before["unit"] != result["unit"]:
+            continue
+        change = result["best"] / before["best"] - 1 if before["best"] else 0.0
+        rows.append(
+            {
+                "name": name,
+                "unit": result["unit"],
+                "baseline": before["best"],
+                "current": result["best"],
+                "change": change,
+                "regression": change > threshold,
+            }
+        )
+    return rows
+
+
+def format_results(results: dict, comparison: Optional[list[dict]] = None) -> str:
+    changes = {row["name"]: row for row in comparison or ()}
+    lines = [f"aliot {results['aliot']}, python {results['python']}"]
+    lines.append(f"{'benchmark':<16}{'best':>14}{'median':>14}{'vs baseline':>14}")
+    for name, result in results["benchmarks"].items():
+        if "skipped" in result:
+            lines.append(f"{name:<16}skipped: {result['skipped']}")
+            continue
+        unit = result["unit"]
+        line = f"{name:<16}{result['best']:>11.2f} {unit}{result['median']:>11.2f} {unit}"
+        row = changes.get(name)
+        if row is not None:
+            line += f"{row['change']:>+14.1%}" + ("  REGRESSION" if row["regression"] else "")
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def run_suite(
+    names: Optional[Iterable[str]] = None,
+    *,
+    quick: bool = False,
+    output: Optional[str] = None,
+    baseline: Optional[str] = None,
+    threshold: float = 0.1,
+    echo: Callable[[str], None] = print,
+) -> int:
+    """
+    Runs the benchmarks, prints their results with `echo` (compared with the json results in `baseline`, if given)
+    and writes them to the json file `output`. Returns the exit code: 1 if a benchmark is slower than in the
+    baseline, 2 if a benchmark is unknown, 0 otherwise
+    """
+    try:
+        results = run_benchmarks(names, quick=quick)
+    except ValueError as e:
+        echo(str(e))
+        return 2
+
+    comparison = None
+    if baseline is not None:
+        with open(baseline, encoding="utf-8") as file:
+            comparison = compare(json.load(file), results, threshold)
+    echo(format_results(results, comparison))
+
+    if output is not None:
+        with open(output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+        echo(f"Results written to {output!r}")
+
+    regressions = [row["name"] for row in comparison or () if row["regression"]]
+    if regressions:
+        echo(f"Slower than the baseline: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the hot paths of aliot")
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run, among {', '.join(BENCHMARKS)} (all by default)")
+    parser.add_argument("--quick", action="store_true", help="fewer iterations, for a smoke test")
+    parser.add_argument("--output", default=None, help="write the results to this json file")
+    parser.add_argument("--compare", default=None, help="json results of a previous run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1, help="slowdown reported as a regression")
+    args = parser.parse_args()
+    raise SystemExit(
+        run_suite(
+            args.names or None,
+            quick=args.quick,
+            output=args.output,
+            baseline=args.compare,
+            threshold=args.threshold,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
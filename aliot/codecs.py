@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+from typing import Callable
+
+from aliot.decoder import Decoder, DefaultDecoder, MsgPackDecoder, CborDecoder
+from aliot.encoder import Encoder, DefaultEncoder, MsgPackEncoder, CborEncoder
+from aliot.logger import log_warning
+
+__codecs: dict[str, tuple[Callable[[], Encoder], Callable[[], Decoder]]] = {
+    "json": (DefaultEncoder, DefaultDecoder),
+    "msgpack": (MsgPackEncoder, MsgPackDecoder),
+    "cbor": (CborEncoder, CborDecoder),
+}
+
+
+def register_codec(name: str, encoder: Callable[[], Encoder], decoder: Callable[[], Decoder]):
+    """Registers a codec that can be negotiated with the server"""
+    __codecs[name] = (encoder, decoder)
+
+
+def get_codec(name: str) -> tuple[Encoder, Decoder]:
+    """Returns a new encoder and a new decoder for the codec `name`"""
+    if name not in __codecs:
+        raise ValueError(f"Unknown codec {name!r}")
+    encoder, decoder = __codecs[name]
+    return encoder(), decoder()
+
+
+def available_codecs(names: list[str]) -> list[str]:
+    """Filters `names` down to the codecs whose dependencies are installed, keeping the order"""
+    available = []
+    for name in names:
+        try:
+            get_codec(name)
+        except (ValueError, ImportError):
+            continue
+        available.append(name)
+    return available
+
+
+def parse_codecs(value: str) -> list[str]:
+    """
+    Parses the comma separated `codecs` config value into the list of codecs to offer to the server,
+    in order of preference. Json is always offered last, as the fallback
+    """
+    offered = [name.strip() for name in value.split(",") if name.strip()]
+    codecs = available_codecs(offered)
+    for name in offered:
+        if name not in codecs:
+            log_warning("The codec %r is unknown or its package is not installed", name)
+    if codecs and "json" not in codecs:
+        codecs.append("json")
+    return codecs
@@ -75,5 +75,7 @@ class ALIVE_IOT_EVENT(Enum):
     GET_DOC = "get_doc"
     # * Get the field of a document of a project #
     GET_FIELD = "get_field"
+    # * Get several fields of a document of a project #
+    GET_FIELDS = "get_fields"
     # * Upload an image  #
     UPLOAD_IMAGE="upload_image"
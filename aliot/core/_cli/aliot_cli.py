@@ -127,3 +127,19 @@ def objects(name: str):
 @click.argument("name", default=None)
 def update():
     """Update aliot with the latest version"""
+
+
+@main.command()
+@click.argument("names", nargs=-1)
+@click.option("--quick", is_flag=True, default=False, help="Fewer iterations, for a smoke test")
+@click.option("--output", "-o", default=None, help="Write the results to this json file")
+@click.option("--compare", "baseline", default=None, type=click.Path(exists=True, dir_okay=False),
+              help="Json results of a previous run to compare with")
+@click.option("--threshold", default=0.1, show_default=True, help="Slowdown reported as a regression (0.1 is 10%)")
+def bench(names: tuple, quick: bool, output: Optional[str], baseline: Optional[str], threshold: float):
+    """Run the benchmarks of the hot paths of aliot (all of them if no NAMES are given)"""
+    from aliot.benchmarks.suite import run_suite
+
+    sys.exit(
+        run_suite(names or None, quick=quick, output=output, baseline=baseline, threshold=threshold, echo=click.echo)
+    )
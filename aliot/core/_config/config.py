@@ -1,6 +1,6 @@
 import os.path
 from configparser import ConfigParser
-from typing import Optional
+from typing import Optional, Callable, Any
 
 from aliot.core._config.constants import DEFAULT_CONFIG_FILE_PATH
 
@@ -43,6 +43,20 @@ def get_config(config_file_path: str = DEFAULT_CONFIG_FILE_PATH) -> ConfigParser
     return __config
 
 
+def get_obj_config_value(config: ConfigParser, obj_name: str, key: str, fallback: Any = None,
+                         cast: Optional[Callable[[str], Any]] = None):
+    value = config.get(obj_name, key, fallback=None) or config.defaults().get(key)
+    if value is None:
+        return fallback
+    return cast(value.strip()) if cast is not None else value
+
+
+def to_bool(value: str) -> bool:
+    if value.lower() not in ConfigParser.BOOLEAN_STATES:
+        raise ValueError(f"Not a boolean: {value!r}")
+    return ConfigParser.BOOLEAN_STATES[value.lower()]
+
+
 def make_config_section(obj_name: str):
     return {
         "obj_id": f"Paste the id of {obj_name} from ALIVEcode here :)",
@@ -2,6 +2,10 @@ def minimal_template(obj_name: str, path: str):
     variable = obj_name.replace('-', '_')
     return f"""# Documentation: https://alivecode.ca/docs/aliot
 from aliot.aliot_obj import AliotObj
+from aliot.logger import configure_logging
+
+# Affichage des messages d'aliot dans la console
+configure_logging()
 
 # Création de l'objet à partir du fichier de configuration
 {variable} = AliotObj("{obj_name}")
@@ -17,6 +21,10 @@ def normal_template(obj_name: str, path: str):
     variable = obj_name.replace('-', '_')
     return f"""# Documentation: https://alivecode.ca/docs/aliot
 from aliot.aliot_obj import AliotObj
+from aliot.logger import configure_logging
+
+# Affichage des messages d'aliot dans la console
+configure_logging()
 
 # Création de l'objet à partir du fichier de configuration
 {variable} = AliotObj("{obj_name}")
@@ -53,8 +61,12 @@ class {capitalized}State(AliotObjState):
 
     return f"""# Documentation: https://alivecode.ca/docs/aliot
 from aliot.aliot_obj import AliotObj
+from aliot.logger import configure_logging
 from {variable}_state import {capitalized}State
 
+# Affichage des messages d'aliot dans la console
+configure_logging()
+
 # Création de l'objet à partir du fichier de configuration
 {variable} = AliotObj("{obj_name}")
 
@@ -1,18 +1,72 @@
 import json
 from abc import ABC, abstractmethod
-from typing import Any
+from typing import Any, Optional, Union
+
+from aliot.json_backend import JsonBackend, get_json_backend
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - depends on the installed extras
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # pragma: no cover - depends on the installed extras
+    cbor2 = None
 
 
 class Decoder(ABC):
+    # * Name of the codec, as negotiated with the server #
+    name: str = ""
+
     @abstractmethod
-    def decode(self, value: str) -> Any:
-        """ Decode value from the string sent by the server """
+    def decode(self, value: Union[str, bytes]) -> Any:
+        """ Decode value from the string (or bytes) sent by the server """
         ...
 
 
 class DefaultDecoder(Decoder):
+    name = "json"
+
+    def __init__(self, backend: Optional[str] = None):
+        """
+        :param backend: json library to use ("json", "orjson" or "ujson"). By default, the fastest one installed
+        """
+        self.__backend: JsonBackend = get_json_backend(backend)
+        # Bound straight to the backend, to save a call on the hot path
+        self.decode = self.__backend.loads
+
+    @property
+    def backend(self) -> str:
+        return self.__backend.name
+
+    def decode(self, value: Union[str, bytes]):
+        return self.__backend.loads(value)
+
+
+class MsgPackDecoder(Decoder):
+    name = "msgpack"
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError("MsgPackDecoder requires the 'msgpack' package (pip install aliot-py[msgpack])")
+
+    def decode(self, value: Union[str, bytes]):
+        # Text frames are always json
+        if isinstance(value, str):
+            return json.loads(value)
+        return msgpack.unpackb(value, raw=False)
+
+
+class CborDecoder(Decoder):
+    name = "cbor"
+
     def __init__(self):
-        pass
+        if cbor2 is None:
+            raise ImportError("CborDecoder requires the 'cbor2' package (pip install aliot-py[cbor])")
 
-    def decode(self, value: str):
-        return json.loads(value)
+    def decode(self, value: Union[str, bytes]):
+        # Text frames are always json
+        if isinstance(value, str):
+            return json.loads(value)
+        return cbor2.loads(value)
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+from threading import Lock, Timer
+from typing import Callable, Optional
+
+
+class DocBatcher:
+    """
+    Merges the fields of successive `update_doc` calls (last write wins per field)
+    and flushes them as a single update once the time window has elapsed or once
+    `max_fields` distinct fields are pending.
+    """
+
+    def __init__(self, flush: Callable[[dict], None], window: float, max_fields: int = 0):
+        if window <= 0:
+            raise ValueError("The window of a DocBatcher must be greater than 0")
+        self.__flush = flush
+        self.__window = window
+        self.__max_fields = max_fields
+        self.__pending: dict = {}
+        self.__lock = Lock()
+        # Keeps the batches in order when the timer and a full batch flush at the same time
+        self.__send_lock = Lock()
+        self.__timer: Optional[Timer] = None
+        self.__merged = 0
+        self.__flushed = 0
+
+    # ################################# Properties ################################# #
+
+    @property
+    def window(self) -> float:
+        return self.__window
+
+    @property
+    def max_fields(self) -> int:
+        return self.__max_fields
+
+    @property
+    def pending(self) -> dict:
+        """Returns a copy of the fields waiting to be flushed"""
+        with self.__lock:
+            return self.__pending.copy()
+
+    @property
+    def merged(self) -> int:
+        """Number of update_doc calls merged into the batches"""
+        return self.__merged
+
+    @property
+    def flushed(self) -> int:
+        """Number of batches flushed"""
+        return self.__flushed
+
+    # ################################# Public methods ################################# #
+
+    def add(self, fields: dict):
+        with self.__lock:
+            self.__pending.update(fields)
+            self.__merged += 1
+            full = 0 < self.__max_fields <= len(self.__pending)
+            if not full and self.__timer is None:
+                self.__timer = Timer(self.__window, self.flush)
+                self.__timer.daemon = True
+                self.__timer.start()
+
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Sends the pending fields right away"""
+        with self.__send_lock:
+            with self.__lock:
+                batch = self.__take()
+            if batch:
+                self.__flushed += 1
+                self.__flush(batch)
+
+    def clear(self):
+        """Discards the pending fields"""
+        with self.__lock:
+            self.__take()
+
+    # ################################# Private methods ################################# #
+
+    def __take(self) -> dict:
+        # Must be called with the lock held
+        if self.__timer is not None:
+            self.__timer.cancel()
+            self.__timer = None
+        batch, self.__pending = self.__pending, {}
+        return batch
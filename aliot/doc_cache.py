@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Optional
+
+# * Returned by DocCache.get when a field is not in the cache #
+MISSING = object()
+
+
+class DocCache:
+    """
+    Local copy of document fields.
+
+    Fields read with `get_doc` expire after `ttl` seconds. Fields the object listens to are kept without expiry,
+    because the server pushes every change made to them (the cache must be cleared when the connection is lost,
+    since changes may have been missed while disconnected).
+
+    Every change of the cache increases its `version`. A value fetched with the version read before the request is
+    ignored if the field changed since, so a slow reply never overwrites a newer value pushed by the server.
+    """
+
+    def __init__(self, ttl: float):
+        if ttl <= 0:
+            raise ValueError("The ttl of a DocCache must be greater than 0")
+        self.__ttl = ttl
+        self.__entries: dict[str, tuple[Any, Optional[float]]] = {}
+        self.__version = 0
+        # * field -> version of its last change, the fields not listed last changed at the last clear #
+        self.__changed: dict[str, int] = {}
+        self.__cleared = 0
+        self.__lock = Lock()
+        self.__hits = 0
+        self.__misses = 0
+
+    # ################################# Properties ################################# #
+
+    @property
+    def ttl(self) -> float:
+        return self.__ttl
+
+    @property
+    def version(self) -> int:
+        """Read it before fetching a field and pass it to `put`"""
+        return self.__version
+
+    @property
+    def hits(self) -> int:
+        return self.__hits
+
+    @property
+    def misses(self) -> int:
+        return self.__misses
+
+    # ################################# Public methods ################################# #
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __contains__(self, field: str) -> bool:
+        return self.get(field, count=False) is not MISSING
+
+    def get(self, field: str, count: bool = True):
+        """Returns the cached value of the field, or MISSING if it isn't cached or has expired"""
+        with self.__lock:
+            entry = self.__entries.get(field)
+            if entry is not None and entry[1] is not None and entry[1] <= monotonic():
+                del self.__entries[field]
+                entry = None
+            if count:
+                if entry is None:
+                    self.__misses += 1
+                else:
+                    self.__hits += 1
+            return MISSING if entry is None else entry[0]
+
+    def put(self, field: str, value, *, expires: bool = True, version: Optional[int] = None) -> bool:
+        """
+        Stores a fetched value. Returns False if it was ignored because the field changed after `version`
+
+        :param expires: if False, the value is kept until it is replaced or the cache is cleared
+        :param version: the `version` of the cache when the value was requested
+        """
+        with self.__lock:
+            if version is not None and self.__changed.get(field, self.__cleared) > version:
+                return False
+            self.__entries[field] = (value, monotonic() + self.__ttl if expires else None)
+            self.__changed[field] = self.__next_version()
+            return True
+
+    def update(self, fields: dict):
+        """Stores the values pushed by the server for the fields the object listens to"""
+        with self.__lock:
+            version = self.__next_version()
+            for field, value in fields.items():
+                self.__entries[field] = (value, None)
+                self.__changed[field] = version
+
+    def invalidate(self, *fields: str):
+        with self.__lock:
+            version = self.__next_version()
+            for field in fields:
+                self.__entries.pop(field, None)
+                self.__changed[field] = version
+
+    def invalidate_pushed(self, keep: Callable[[str], bool]):
+        """Removes the fields kept without expiry for which `keep` returns False (the fields no longer listened to)"""
+        with self.__lock:
+            version = self.__next_version()
+            for field in [field for field, (_, expires) in self.__entries.items() if expires is None]:
+                if not keep(field):
+                    del self.__entries[field]
+                    self.__changed[field] = version
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__changed.clear()
+            self.__cleared = self.__next_version()
+
+    # ################################# Private methods ################################# #
+
+    def __next_version(self) -> int:
+        # Must be called with the lock held
+        self.__version += 1
+        return self.__version
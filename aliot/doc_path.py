@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+from typing import Any, Iterable
+
+
+def get_field(document: Any, field: str) -> Any:
+    """
+    Returns the value of a field path (`/doc/sensors/0/value`) in a document, as the server would for `get_field`,
+    or None if the path doesn't exist in it
+    """
+    value = document
+    for key in field.strip("/").split("/"):
+        if isinstance(value, dict):
+            value = value.get(key)
+        elif isinstance(value, list) and key.isdigit() and int(key) < len(value):
+            value = value[int(key)]
+        else:
+            return None
+    return value
+
+
+def project(document: Any, fields: Iterable[str]) -> dict:
+    """Returns the value of every field path in a document, keyed by path"""
+    return {field: get_field(document, field) for field in fields}
+
+
+def set_field(document: dict, field: str, value: Any):
+    """Sets the value of a field path in a document, creating the missing dicts on the way"""
+    *parents, key = field.strip("/").split("/")
+    for parent in parents:
+        child = document.get(parent)
+        if not isinstance(child, dict):
+            child = document[parent] = {}
+        document = child
+    document[key] = value
@@ -1,17 +1,82 @@
-import json
 from abc import ABC, abstractmethod
+from typing import Optional, Union
+
+from aliot.json_backend import JsonBackend, get_json_backend
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - depends on the installed extras
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # pragma: no cover - depends on the installed extras
+    cbor2 = None
 
 
 class Encoder(ABC):
+    # * Name of the codec, as negotiated with the server #
+    name: str = ""
+    # * If True, the encoded values are sent in binary websocket frames #
+    binary: bool = False
+
     @abstractmethod
-    def encode(self, value) -> str:
-        """ Encode value to a string before sending it to server """
+    def encode(self, value) -> Union[str, bytes]:
+        """ Encode value to a string (or to bytes for binary encoders) before sending it to server """
         ...
 
+    def encode_bytes(self, value) -> bytes:
+        """ Encode value to utf-8 bytes, ready to be written in a websocket frame """
+        encoded = self.encode(value)
+        return encoded if isinstance(encoded, bytes) else encoded.encode()
+
 
 class DefaultEncoder(Encoder):
-    def __init__(self):
-        pass
+    name = "json"
+
+    def __init__(self, backend: Optional[str] = None):
+        """
+        :param backend: json library to use ("json", "orjson" or "ujson"). By default, the fastest one installed
+        """
+        self.__backend: JsonBackend = get_json_backend(backend)
+        # Bound straight to the backend, to save a call on the hot path
+        self.encode = self.__backend.dumps
+        self.encode_bytes = self.__backend.dumps_bytes
+
+    @property
+    def backend(self) -> str:
+        return self.__backend.name
 
     def encode(self, value) -> str:
-        return json.dumps(value, default=str)
+        return self.__backend.dumps(value)
+
+    def encode_bytes(self, value) -> bytes:
+        return self.__backend.dumps_bytes(value)
+
+
+class MsgPackEncoder(Encoder):
+    name = "msgpack"
+    binary = True
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError("MsgPackEncoder requires the 'msgpack' package (pip install aliot-py[msgpack])")
+
+    def encode(self, value) -> bytes:
+        return msgpack.packb(value, default=str, use_bin_type=True)
+
+
+class CborEncoder(Encoder):
+    name = "cbor"
+    binary = True
+
+    def __init__(self):
+        if cbor2 is None:
+            raise ImportError("CborEncoder requires the 'cbor2' package (pip install aliot-py[cbor])")
+
+    def encode(self, value) -> bytes:
+        return cbor2.dumps(value, default=self.__encode_as_str)
+
+    @staticmethod
+    def __encode_as_str(encoder, value):
+        encoder.encode(str(value))
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import CancelledError, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Callable, Hashable, Optional
+
+
+class _Lane:
+    """Handlers waiting for, or running under, the same key"""
+
+    __slots__ = ("limit", "running", "pending")
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.running = 0
+        self.pending: deque = deque()
+
+
+class HandlerPool:
+    """
+    Runs handlers outside of the receive thread.
+
+    Handlers submitted under the same key start in submission order, and at most `limit`
+    of them run at the same time (1 by default, which makes them run one after the other).
+    CPU-bound handlers can be sent to a process pool, in which case the handler and its
+    arguments must be picklable (a module-level function, for example).
+
+    A handler is run by the job the thread pool executes, and the worker then runs the next handlers of its key
+    that are ready, so a busy key is drained without going back to the executor for every call.
+    """
+
+    def __init__(self, max_workers: int = 4, process_workers: int = 0, default_limit: int = 1):
+        if max_workers <= 0:
+            raise ValueError("The max_workers of a HandlerPool must be greater than 0")
+        self.__threads = ThreadPoolExecutor(max_workers, thread_name_prefix="aliot-handler")
+        self.__process_workers = process_workers
+        self.__processes: Optional[ProcessPoolExecutor] = None
+        self.__default_limit = default_limit
+        self.__lanes: dict[Hashable, _Lane] = {}
+        self.__limits: dict[Hashable, int] = {}
+        self.__lock = Lock()
+
+    # ################################# Properties ################################# #
+
+    @property
+    def pending(self) -> int:
+        """Number of handlers waiting for their turn"""
+        with self.__lock:
+            return sum(len(lane.pending) for lane in self.__lanes.values())
+
+    @property
+    def running(self) -> int:
+        with self.__lock:
+            return sum(lane.running for lane in self.__lanes.values())
+
+    # ################################# Public methods ################################# #
+
+    def set_limit(self, key: Hashable, limit: int):
+        """Sets how many handlers of `key` may run at the same time"""
+        if limit <= 0:
+            raise ValueError("The concurrency limit must be greater than 0")
+        with self.__lock:
+            self.__limits[key] = limit
+            if key in self.__lanes:
+                self.__lanes[key].limit = limit
+
+    def submit(self, key: Hashable, fn: Callable[..., Any], *args, cpu_bound: bool = False) -> Future:
+        future = Future()
+        with self.__lock:
+            lane = self.__lanes.get(key)
+            if lane is None:
+                lane = self.__lanes[key] = _Lane(self.__limits.get(key, self.__default_limit))
+            lane.pending.append((fn, args, cpu_bound, future))
+            ready = self.__take_ready(lane)
+        self.__start(key, ready)
+        return future
+
+    def shutdown(self, wait: bool = True):
+        with self.__lock:
+            for lane in self.__lanes.values():
+                for *_, future in lane.pending:
+                    future.cancel()
+                lane.pending.clear()
+        self.__threads.shutdown(wait)
+        if self.__processes is not None:
+            self.__processes.shutdown(wait)
+
+    # ################################# Private methods ################################# #
+
+    def __process_pool(self) -> Executor:
+        if self.__processes is None:
+            self.__processes = ProcessPoolExecutor(self.__process_workers)
+        return self.__processes
+
+    @staticmethod
+    def __take_ready(lane: _Lane) -> list:
+        # Must be called with the lock held
+        ready = []
+        while lane.pending and lane.running < lane.limit:
+            ready.append(lane.pending.popleft())
+            lane.running += 1
+        return ready
+
+    def __in_process(self, item: tuple) -> bool:
+        return item[2] and self.__process_workers > 0
+
+    def __start(self, key: Hashable, ready: list):
+        for item in ready:
+            fn, args, _, future = item
+            try:
+                if not self.__in_process(item):
+                    # The worker runs the handler itself, and the next ones of the lane while they are ready
+                    self.__threads.submit(self.__run, key, item)
+                    continue
+                if not future.set_running_or_notify_cancel():
+                    self.__start(key, self.__finished(key))
+                    continue
+                inner = self.__process_pool().submit(fn, *args)
+            except Exception as e:
+                future.set_exception(e)
+                self.__start(key, self.__finished(key))
+                continue
+            inner.add_done_callback(lambda f, key=key, future=future: self.__on_done(key, future, f))
+
+    def __run(self, key: Hashable, item: Optional[tuple]):
+        # Runs on a worker thread
+        while item is not None:
+            fn, args, _, future = item
+            if future.set_running_or_notify_cancel():
+                try:
+                    result = fn(*args)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+            ready = self.__finished(key)
+            item = None
+            if ready and not self.__in_process(ready[0]):
+                item, ready = ready[0], ready[1:]
+            self.__start(key, ready)
+
+    def __on_done(self, key: Hashable, future: Future, inner: Future):
+        if inner.cancelled():
+            future.set_exception(CancelledError())
+        elif inner.exception() is not None:
+            future.set_exception(inner.exception())
+        else:
+            future.set_result(inner.result())
+        self.__start(key, self.__finished(key))
+
+    def __finished(self, key: Hashable) -> list:
+        """Frees the slot of a handler of `key` and returns the handlers of the lane that can start"""
+        with self.__lock:
+            lane = self.__lanes[key]
+            lane.running -= 1
+            ready = self.__take_ready(lane)
+            if not ready and not lane.running and not lane.pending and key not in self.__limits:
+                del self.__lanes[key]
+        return ready
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+from threading import local
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class HttpSession(requests.Session):
+    """
+    Session used for the REST calls of an object. The connections to the api are kept alive and pooled,
+    so polling a field or uploading images at a steady rate doesn't pay a new TCP and TLS handshake every time.
+    Failed connections are retried with an exponential backoff, and so are the 502/503/504 responses and the read
+    errors of the idempotent requests: the idempotent methods, and the POSTs made with `idempotent=True` (the
+    requests that only read the document). The other POSTs are only retried when they could not reach the server.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 10,
+        timeout: Optional[float] = 10.0,
+        retries: int = 3,
+        backoff: float = 0.5,
+    ):
+        super().__init__()
+        self.pool_size = pool_size
+        self.timeout = timeout
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(502, 503, 504),
+            # The default methods: an update or an upload received by the server must not be sent twice
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        # Every method is retried, only used for the requests made with idempotent=True
+        self.__idempotent_adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry.new(allowed_methods=False)
+        )
+        # * Set while the current thread makes an idempotent request #
+        self.__local = local()
+
+    def request(self, method, url, *, idempotent: bool = False, **kwargs):
+        """
+        :param idempotent: the request can be sent twice safely, it is retried on 502/503/504 responses and read
+            errors whatever its method
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        if not idempotent:
+            return super().request(method, url, **kwargs)
+        self.__local.idempotent = True
+        try:
+            return super().request(method, url, **kwargs)
+        finally:
+            self.__local.idempotent = False
+
+    def get_adapter(self, url):
+        if getattr(self.__local, "idempotent", False) and url.lower().startswith(("https://", "http://")):
+            return self.__idempotent_adapter
+        return super().get_adapter(url)
+
+    def close(self):
+        super().close()
+        self.__idempotent_adapter.close()
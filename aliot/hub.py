@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import asyncio
+from configparser import ConfigParser
+from enum import Enum, unique
+from typing import Iterable, Optional, Union
+
+from aliot.async_aliot_obj import AsyncAliotObj
+from aliot.core._config.config import get_config
+from aliot.logger import log_err
+
+
+@unique
+class ConnectionState(Enum):
+    # * Not started yet, or waiting before retrying to connect #
+    DISCONNECTED = "disconnected"
+    # * The websocket is open, the object is authenticating and subscribing its listeners #
+    CONNECTING = "connecting"
+    # * The object is connected to ALIVEcode #
+    CONNECTED = "connected"
+    # * The object stopped and won't try to reconnect #
+    STOPPED = "stopped"
+
+
+class AliotHub:
+    """
+    Runs many objects in a single process and a single thread, on one shared event loop.
+    Memory and thread usage scale with the traffic instead of with the number of objects.
+
+    ```py
+    hub = AliotHub.from_config()
+
+    @hub["sensor-1"].on_start()
+    async def start():
+        ...
+
+    hub.run()
+    ```
+    """
+
+    def __init__(self, objects: Iterable[AsyncAliotObj] = (), *, stagger: float = 0):
+        """
+        :param stagger: seconds to wait between the start of two objects, to avoid opening every connection at once
+        """
+        self.__objects: dict[str, AsyncAliotObj] = {}
+        self.__tasks: dict[str, asyncio.Task] = {}
+        self.__stagger = stagger
+        # * Set by stop(), the objects waiting for their turn to start are not started #
+        self.__stop_event: Optional[asyncio.Event] = None
+        for obj in objects:
+            self.add(obj)
+
+    @classmethod
+    def from_config(
+        cls, names: Optional[Iterable[str]] = None, *, stagger: float = 0, config: Optional[ConfigParser] = None
+    ) -> AliotHub:
+        """
+        Creates a hub with an object for every section of the config that has an obj_id (or for `names`)
+
+        :param config: the configuration of the objects (the config.ini if None)
+        """
+        config = get_config() if config is None else config
+        if names is None:
+            names = [section for section in config.sections() if config.has_option(section, "obj_id")]
+        return cls((AsyncAliotObj(name, config=config) for name in names), stagger=stagger)
+
+    # ################################# Properties ################################# #
+
+    @property
+    def objects(self) -> dict[str, AsyncAliotObj]:
+        """Returns a copy of the objects dict"""
+        return self.__objects.copy()
+
+    @property
+    def states(self) -> dict[str, ConnectionState]:
+        return {name: self.state(name) for name in self.__objects}
+
+    # ################################# Public methods ################################# #
+
+    def __getitem__(self, name: str) -> AsyncAliotObj:
+        return self.__objects[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.__objects
+
+    def __len__(self) -> int:
+        return len(self.__objects)
+
+    def add(self, obj: Union[AsyncAliotObj, str]) -> AsyncAliotObj:
+        if isinstance(obj, str):
+            obj = AsyncAliotObj(obj)
+        if obj.name in self.__objects:
+            raise ValueError(f"An object named {obj.name!r} is already in the hub")
+        self.__objects[obj.name] = obj
+        return obj
+
+    def state(self, name: str) -> ConnectionState:
+        obj = self.__objects[name]
+        task = self.__tasks.get(name)
+        if task is not None and task.done():
+            return ConnectionState.STOPPED
+        if obj.connected_to_alivecode:
+            return ConnectionState.CONNECTED
+        if obj.connected:
+            return ConnectionState.CONNECTING
+        return ConnectionState.DISCONNECTED
+
+    def run(self, *, log: bool = False, retry=True, retry_time=None):
+        """Blocking entry point, runs `arun()` in a new event loop"""
+        try:
+            asyncio.run(self.arun(log=log, retry=retry, retry_time=retry_time))
+        except KeyboardInterrupt:
+            pass
+
+    async def arun(self, *, log: bool = False, retry=True, retry_time=None):
+        """Runs every object of the hub until they all stop. An object that crashes does not stop the others"""
+        self.__stop_event = asyncio.Event()
+        for name, obj in self.__objects.items():
+            if self.__stop_event.is_set():
+                break
+            self.__tasks[name] = asyncio.get_running_loop().create_task(
+                self.__run_obj(obj, log=log, retry=retry, retry_time=retry_time)
+            )
+            if self.__stagger > 0:
+                try:
+                    await asyncio.wait_for(self.__stop_event.wait(), self.__stagger)
+                except asyncio.TimeoutError:
+                    pass
+        await asyncio.gather(*self.__tasks.values())
+
+    async def stop(self):
+        if self.__stop_event is not None:
+            self.__stop_event.set()
+        await asyncio.gather(*(obj.stop() for obj in self.__objects.values()))
+
+    # ################################# Private methods ################################# #
+
+    @staticmethod
+    async def __run_obj(obj: AsyncAliotObj, **kwargs):
+        try:
+            await obj.arun(**kwargs)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log_err("The object %r stopped because of an error: %r", obj.name, e)
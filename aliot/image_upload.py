@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import os
+from collections import deque
+from concurrent.futures import Future
+from threading import Condition, Thread
+from typing import Any, BinaryIO, Callable, Iterator, Optional, Union
+from uuid import uuid4
+
+ImageBody = Union[bytes, bytearray, memoryview, BinaryIO]
+
+
+class MultipartStream:
+    """
+    multipart/form-data body streamed in chunks, so an image is sent without being copied into a single request body.
+
+    Bytes-like bodies (bytes, bytearray, memoryview, numpy arrays, ...) are sliced through a memoryview, file-like
+    bodies are read `chunk_size` bytes at a time from their current position. The stream knows its length, so
+    requests sends it with a Content-Length instead of a chunked transfer encoding.
+    """
+
+    def __init__(
+        self,
+        fields: dict,
+        file_field: str,
+        filename: str,
+        content_type: str,
+        body: ImageBody,
+        chunk_size: int = 64 * 1024,
+    ):
+        boundary = uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        self.__chunk_size = chunk_size
+
+        head = [
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+            for name, value in fields.items()
+            if value is not None
+        ]
+        head.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        )
+        self.__head = "".join(head).encode()
+        self.__tail = f"\r\n--{boundary}--\r\n".encode()
+
+        if hasattr(body, "read"):
+            self.__file: Optional[BinaryIO] = body
+            self.__view: Optional[memoryview] = None
+            self.__start = body.tell() if body.seekable() else None
+            body_size = self.__file_size(body)
+        else:
+            self.__file = None
+            self.__view = memoryview(body).cast("B")
+            self.__start = None
+            body_size = self.__view.nbytes
+        self.__len = len(self.__head) + body_size + len(self.__tail)
+
+    def __len__(self) -> int:
+        return self.__len
+
+    def __iter__(self) -> Iterator[Union[bytes, memoryview]]:
+        yield self.__head
+        if self.__view is not None:
+            for start in range(0, self.__view.nbytes, self.__chunk_size):
+                yield self.__view[start : start + self.__chunk_size]
+        else:
+            if self.__start is not None:
+                # The body may be sent again when a request is retried
+                self.__file.seek(self.__start)
+            while True:
+                chunk = self.__file.read(self.__chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        yield self.__tail
+
+    @staticmethod
+    def __file_size(file: BinaryIO) -> int:
+        try:
+            return os.fstat(file.fileno()).st_size - file.tell()
+        except (AttributeError, OSError, ValueError):
+            position = file.tell()
+            size = file.seek(0, os.SEEK_END) - position
+            file.seek(position)
+            return size
+
+
+class ImageUploader:
+    """
+    Uploads images in the background, one at a time, so a capture loop never waits on the network.
+
+    At most `maxsize` images wait to be uploaded. When a new image arrives and the queue is full, the oldest
+    waiting image is stale: it is dropped and its future is cancelled. The buffer of an image must not be
+    modified until its future is done, since it is streamed without being copied.
+    """
+
+    def __init__(self, upload: Callable[[ImageBody, str, str], Any], maxsize: int = 2):
+        if maxsize <= 0:
+            raise ValueError("The maxsize of an ImageUploader must be greater than 0")
+        self.__upload = upload
+        self.__maxsize = maxsize
+        self.__items: deque[tuple[Future, ImageBody, str, str]] = deque()
+        self.__cond = Condition()
+        self.__worker: Optional[Thread] = None
+        self.__running = False
+        self.__uploaded = 0
+        self.__dropped = 0
+
+    # ################################# Properties ################################# #
+
+    @property
+    def pending(self) -> int:
+        return len(self.__items)
+
+    @property
+    def uploaded(self) -> int:
+        return self.__uploaded
+
+    @property
+    def dropped(self) -> int:
+        """Number of stale images dropped before being uploaded"""
+        return self.__dropped
+
+    # ################################# Public methods ################################# #
+
+    def submit(self, body: ImageBody, filename: str, content_type: str) -> Future:
+        """Queues an image and returns a future resolved with the response of the upload"""
+        future = Future()
+        with self.__cond:
+            if not self.__running:
+                self.__running = True
+                self.__worker = Thread(target=self.__run, name="aliot-uploader", daemon=True)
+                self.__worker.start()
+            if len(self.__items) >= self.__maxsize:
+                self.__items.popleft()[0].cancel()
+                self.__dropped += 1
+            self.__items.append((future, body, filename, content_type))
+            self.__cond.notify()
+        return future
+
+    def stop(self, wait: bool = False):
+        """Cancels the waiting images and stops the upload thread once the current upload is done"""
+        with self.__cond:
+            self.__running = False
+            while self.__items:
+                self.__items.popleft()[0].cancel()
+            self.__cond.notify_all()
+            worker = self.__worker
+        if wait and worker is not None:
+            worker.join()
+
+    # ################################# Private methods ################################# #
+
+    def __run(self):
+        while True:
+            with self.__cond:
+                while self.__running and not self.__items:
+                    self.__cond.wait()
+                if not self.__running:
+                    return
+                future, body, filename, content_type = self.__items.popleft()
+
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self.__upload(body, filename, content_type))
+                self.__uploaded += 1
+            except Exception as e:
+                future.set_exception(e)
@@ -0,0 +1,133 @@
+"""
+Json libraries the default codec can use. The fastest installed one is picked unless a backend is forced,
+either with the `json_backend` config value or when creating the encoder/decoder.
+
+Every backend produces the same json documents as `json.dumps(value, default=str)` (values that are not
+json serializable are converted with `str`); only the whitespace between the tokens may differ. Values the
+accelerated libraries cannot handle (integers over 64 bits, for example) fall back to the standard library.
+orjson writes NaN and infinities as `null`, so the documents holding one are written by the standard library too,
+as `NaN` and `Infinity`. The only known differences are enums, which orjson serializes by value, and decimals,
+which ujson serializes as numbers.
+"""
+from __future__ import annotations
+
+import json
+import math
+from typing import Any, Callable, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the installed extras
+    orjson = None
+
+try:
+    import ujson
+except ImportError:  # pragma: no cover - depends on the installed extras
+    ujson = None
+
+# * Backends tried, in order, when none is forced #
+PREFERRED_BACKENDS = ("orjson", "ujson", "json")
+
+
+class JsonBackend:
+    def __init__(
+        self,
+        name: str,
+        dumps: Callable[[Any], str],
+        dumps_bytes: Callable[[Any], bytes],
+        loads: Callable[[Union[str, bytes]], Any],
+    ):
+        self.name = name
+        self.dumps = dumps
+        self.dumps_bytes = dumps_bytes
+        self.loads = loads
+
+    def __repr__(self):
+        return f"JsonBackend({self.name!r})"
+
+
+def _std_dumps(value) -> str:
+    return json.dumps(value, default=str)
+
+
+def _std_dumps_bytes(value) -> bytes:
+    return json.dumps(value, default=str).encode()
+
+
+def _has_non_finite(value) -> bool:
+    if isinstance(value, float):
+        return not math.isfinite(value)
+    if isinstance(value, dict):
+        return any(_has_non_finite(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return any(_has_non_finite(item) for item in value)
+    return False
+
+
+def _make_std_backend() -> JsonBackend:
+    return JsonBackend("json", _std_dumps, _std_dumps_bytes, json.loads)
+
+
+def _make_orjson_backend() -> JsonBackend:
+    # Dataclasses and datetimes are serialized natively by orjson, let them go through `default=str` like json does
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_DATETIME
+    orjson_dumps = orjson.dumps
+
+    def dumps_bytes(value) -> bytes:
+        try:
+            encoded = orjson_dumps(value, default=str, option=options)
+        except orjson.JSONEncodeError:
+            return _std_dumps_bytes(value)
+        # NaN and infinities become null, only the documents holding a null are searched for them
+        if b"null" in encoded and _has_non_finite(value):
+            return _std_dumps_bytes(value)
+        return encoded
+
+    def dumps(value) -> str:
+        return dumps_bytes(value).decode()
+
+    return JsonBackend("orjson", dumps, dumps_bytes, orjson.loads)
+
+
+def _make_ujson_backend() -> JsonBackend:
+    ujson_dumps = ujson.dumps
+
+    def dumps(value) -> str:
+        try:
+            return ujson_dumps(value, default=str)
+        except (TypeError, OverflowError):
+            return _std_dumps(value)
+
+    def dumps_bytes(value) -> bytes:
+        return dumps(value).encode()
+
+    return JsonBackend("ujson", dumps, dumps_bytes, ujson.loads)
+
+
+__factories: dict[str, Callable[[], JsonBackend]] = {
+    "json": _make_std_backend,
+    "orjson": _make_orjson_backend,
+    "ujson": _make_ujson_backend,
+}
+__modules = {"json": json, "orjson": orjson, "ujson": ujson}
+__backends: dict[str, JsonBackend] = {}
+
+
+def is_available(name: str) -> bool:
+    return __modules.get(name) is not None
+
+
+def get_json_backend(name: Optional[str] = None) -> JsonBackend:
+    """
+    Returns the json backend `name` ("json", "orjson" or "ujson"), or the fastest installed one if
+    `name` is None or "auto"
+    """
+    if name is None or name == "auto":
+        name = next(backend for backend in PREFERRED_BACKENDS if is_available(backend))
+    if name not in __factories:
+        raise ValueError(f"Unknown json backend {name!r}, expected one of {', '.join(__factories)} or auto")
+    if not is_available(name):
+        raise ImportError(f"The json backend {name!r} is not installed")
+    if name not in __backends:
+        __backends[name] = __factories[name]()
+    return __backends[name]
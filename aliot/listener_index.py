@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+from threading import Lock
+from typing import Any, Callable, Iterable
+
+WILDCARD = "*"
+
+
+class ListenerIndex:
+    """
+    Inverted index from document field paths to the listeners interested in them.
+
+    A listener subscribes to exact paths (`/doc/temperature`) or to every path under a prefix,
+    by ending its path with a wildcard (`/doc/sensors/*`). Routing an incoming field costs one
+    dict lookup per level of the path, no matter how many listeners are registered.
+    Listeners can be added and removed from any thread while messages are routed.
+
+    The index only routes the fields it receives: the wildcard paths are subscribed on the server as they are,
+    so they only work with a server that supports wildcard subscriptions.
+    """
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.__listeners: list[dict] = []
+        self.__exact: dict[str, list[dict]] = {}
+        self.__prefixes: dict[str, list[dict]] = {}
+
+    # ################################# Properties ################################# #
+
+    @property
+    def listeners(self) -> list[dict]:
+        """Returns a copy of the listeners list"""
+        with self.__lock:
+            return self.__listeners.copy()
+
+    @property
+    def fields(self) -> list[str]:
+        """Returns the sorted list of every subscribed path (wildcard paths included)"""
+        with self.__lock:
+            return sorted(
+                {*self.__exact, *(f"{prefix}{WILDCARD}" for prefix in self.__prefixes)}
+            )
+
+    # ################################# Public methods ################################# #
+
+    def __len__(self) -> int:
+        return len(self.__listeners)
+
+    def add(self, fields: Iterable[str], func: Callable[[dict], Any]) -> dict:
+        listener = {"func": func, "fields": list(fields)}
+        with self.__lock:
+            self.__listeners.append(listener)
+            for field in listener["fields"]:
+                table, key = self.__table_of(field)
+                table.setdefault(key, []).append(listener)
+        return listener
+
+    def remove(self, listener: dict) -> bool:
+        """Removes a listener. Returns False if it was not registered"""
+        with self.__lock:
+            if not any(l is listener for l in self.__listeners):
+                return False
+            # Compared by identity: two listeners with the same function and fields are different subscriptions
+            self.__listeners = [l for l in self.__listeners if l is not listener]
+            for field in listener["fields"]:
+                table, key = self.__table_of(field)
+                listeners = table.get(key)
+                if listeners is None:
+                    continue
+                listeners[:] = [l for l in listeners if l is not listener]
+                if not listeners:
+                    del table[key]
+            return True
+
+    def subscribes(self, field: str) -> bool:
+        """Returns True if a listener is interested in the field"""
+        with self.__lock:
+            return next(self.__listeners_of(field), None) is not None
+
+    def match(self, fields: dict) -> list[tuple[dict, dict]]:
+        """
+        Returns the listeners interested in the received fields, in registration order,
+        each paired with the fields it subscribed to
+        """
+        matched: dict[int, tuple[dict, dict]] = {}
+        with self.__lock:
+            for field, value in fields.items():
+                for listener in self.__listeners_of(field):
+                    entry = matched.get(id(listener))
+                    if entry is None:
+                        matched[id(listener)] = entry = (listener, {})
+                    entry[1][field] = value
+            if len(matched) <= 1:
+                return list(matched.values())
+            order = {id(listener): i for i, listener in enumerate(self.__listeners)}
+        return sorted(matched.values(), key=lambda entry: order[id(entry[0])])
+
+    # ################################# Private methods ################################# #
+
+    # Must be called with the lock held
+    def __table_of(self, field: str) -> tuple[dict[str, list[dict]], str]:
+        if field.endswith(WILDCARD):
+            return self.__prefixes, field[: -len(WILDCARD)]
+        return self.__exact, field
+
+    def __listeners_of(self, field: str):
+        yield from self.__exact.get(field, ())
+        if not self.__prefixes:
+            return
+        end = field.rfind("/")
+        while end >= 0:
+            yield from self.__prefixes.get(field[: end + 1], ())
+            end = field.rfind("/", 0, end)
+
+
+class Subscription:
+    """Handle of a listener registered with `subscribe`, used to unsubscribe it"""
+
+    def __init__(self, listener: dict, unsubscribe: Callable[["Subscription"], bool]):
+        self.listener = listener
+        self.__unsubscribe = unsubscribe
+
+    @property
+    def fields(self) -> list[str]:
+        return list(self.listener["fields"])
+
+    def unsubscribe(self) -> bool:
+        """Removes the listener. Returns False if it was already removed"""
+        return self.__unsubscribe(self)
+
+    def __repr__(self):
+        return f"Subscription({self.listener['fields']!r})"
@@ -0,0 +1,186 @@
+"""
+Output of the library, through the standard `logging` module.
+
+The events of the objects (connections, retries, errors) are logged on the `aliot` logger. The messages sent and
+received are logged at the DEBUG level on `aliot.frames` (when `run(log=True)`), and the calls of the actions on
+`aliot.actions`. The arguments of every record are only formatted if a handler emits it.
+
+The records go wherever the application sends them. Until the application configures logging (handlers on the root
+logger or a call to `configure_logging`), they are printed on the console the way the CLI prints its messages.
+`configure_logging` prints them on the console too, and can change the level, sample the high-rate loggers and move
+the printing to a background thread.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from threading import Lock
+from typing import Optional, Union
+
+logger = logging.getLogger("aliot")
+if logger.level == logging.NOTSET:
+    logger.setLevel(logging.INFO)
+# * Records logged for every message, the ones worth sampling #
+frames_logger = logging.getLogger("aliot.frames")
+actions_logger = logging.getLogger("aliot.actions")
+
+# * kind -> (kaomoji, color) #
+_STYLES = {
+    "success": ("\\(°ω°\\)", "green"),
+    "error": ("(・_・ ?)", "red"),
+    "failure": ("(’-_-)", "orange1"),
+    "warning": ("(ㆆ_ㆆ)", "yellow"),
+    "info": ("(^ ▽ ^)", "cyan"),
+}
+
+_formatter = logging.Formatter()
+_lock = Lock()
+_handler: Optional[logging.Handler] = None
+_listener: Optional[QueueListener] = None
+# * Points the records at the caller of the helpers below, stacklevel is only supported since Python 3.8 #
+_CALLER = {"stacklevel": 3} if sys.version_info >= (3, 8) else {}
+
+
+class ConsoleHandler(logging.Handler):
+    """
+    Prints the records with the style of the CLI: `[<title> <kaomoji>] <message>`. Records logged without
+    the helpers of this module are printed as is (in grey for DEBUG)
+    """
+
+    def __init__(self, level=logging.NOTSET):
+        super().__init__(level)
+        # rich is only imported once something is printed
+        from rich.console import Console
+
+        self.__console = Console()
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            message = record.getMessage()
+            kind = getattr(record, "aliot_kind", None)
+            if kind is None and record.levelno >= logging.WARNING:
+                kind = "error" if record.levelno >= logging.ERROR else "warning"
+            if kind is not None:
+                kaomoji, color = _STYLES[kind]
+                title = getattr(record, "aliot_title", None) or kind.capitalize()
+                message = f"[{title} {kaomoji}] {message}"
+            else:
+                color = "grey70" if record.levelno < logging.INFO else None
+            if record.exc_info:
+                message += "\n" + _formatter.formatException(record.exc_info)
+            self.__console.print(message, style=color, markup=False)
+        except Exception:
+            self.handleError(record)
+
+
+class _FallbackHandler(logging.Handler):
+    """Prints the records on the console as long as the application did not configure logging"""
+
+    def __init__(self):
+        super().__init__()
+        self.__console: Optional[ConsoleHandler] = None
+
+    def emit(self, record: logging.LogRecord):
+        if _handler is not None or logging.getLogger().handlers:
+            return
+        if self.__console is None:
+            self.__console = ConsoleHandler()
+        self.__console.handle(record)
+
+
+class SampleFilter(logging.Filter):
+    """Lets through one record out of `every` for each message (the format string, before its arguments)"""
+
+    def __init__(self, every: int):
+        super().__init__()
+        if every < 1:
+            raise ValueError("A SampleFilter must let through at least one record out of 1")
+        self.every = every
+        self.__counts: dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        count = self.__counts.get(record.msg, 0)
+        self.__counts[record.msg] = count + 1
+        return count % self.every == 0
+
+
+def configure_logging(
+    level: Union[int, str, None] = None,
+    *,
+    handler: Optional[logging.Handler] = None,
+    sample_every: int = 1,
+    queue: bool = False,
+):
+    """
+    Configures the output of the library. The records of `aliot` are then only emitted by `handler`, they no longer
+    propagate to the handlers of the root logger
+
+    :param level: level of the `aliot` logger (`logging.DEBUG` shows the messages sent and received)
+    :param handler: where the records go (printed on the console if None)
+    :param sample_every: only log one out of that many records of `aliot.frames` and `aliot.actions`
+    :param queue: emit the records from a background thread, so logging never waits on the console
+    """
+    global _handler, _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+        if _handler is not None:
+            logger.removeHandler(_handler)
+
+        handler = handler or ConsoleHandler()
+        if queue:
+            records = SimpleQueue()
+            _listener = QueueListener(records, handler, respect_handler_level=True)
+            _listener.start()
+            handler = QueueHandler(records)
+        _handler = handler
+        logger.addHandler(handler)
+        logger.propagate = False
+        if level is not None:
+            logger.setLevel(level)
+        elif logger.level == logging.NOTSET:
+            logger.setLevel(logging.INFO)
+
+        for high_rate_logger in (frames_logger, actions_logger):
+            for sample_filter in [f for f in high_rate_logger.filters if isinstance(f, SampleFilter)]:
+                high_rate_logger.removeFilter(sample_filter)
+            if sample_every > 1:
+                high_rate_logger.addFilter(SampleFilter(sample_every))
+
+
+logger.addHandler(_FallbackHandler())
+
+
+@atexit.register
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def _log(level: int, kind: str, msg: str, args: tuple, title: Optional[str]):
+    if logger.isEnabledFor(level):
+        logger.log(level, msg, *args, extra={"aliot_kind": kind, "aliot_title": title}, **_CALLER)
+
+
+def log_success(msg: str = "", *args, title: str = "Success"):
+    _log(logging.INFO, "success", msg, args, title)
+
+
+def log_err(msg: str = "", *args, title: str = "Error"):
+    _log(logging.ERROR, "error", msg, args, title)
+
+
+def log_fail(msg: str = "", *args, title: str = "Failure"):
+    _log(logging.WARNING, "failure", msg, args, title)
+
+
+def log_warning(msg: str = "", *args, title: str = "Warning"):
+    _log(logging.WARNING, "warning", msg, args, title)
+
+
+def log_info(msg: str = "", *args, title: str = "Info"):
+    _log(logging.INFO, "info", msg, args, title)
@@ -0,0 +1,321 @@
+"""
+Metrics of the objects: counters, gauges and latency histograms, readable from the code or exposed in the
+Prometheus text format on a local HTTP endpoint.
+
+The objects record their metrics in `REGISTRY` when the `metrics` config value is enabled, each metric labelled
+with the name of the object. Setting `metrics_port` also serves `REGISTRY` on `http://127.0.0.1:<port>/metrics`.
+"""
+from __future__ import annotations
+
+import math
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import perf_counter
+from typing import Callable, Iterator, Optional
+
+# * Upper bounds (in seconds) of the buckets of the latency histograms #
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _CounterValue:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self.lock:
+            self.value += amount
+
+    def get(self) -> float:
+        return self.value
+
+
+class _GaugeValue:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]):
+        """Reads the value from `function` every time the gauge is collected"""
+        self.function = function
+
+    def get(self) -> float:
+        return self.value if self.function is None else self.function()
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "count", "lock")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start)
+
+    def get(self) -> dict:
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative, buckets = 0, {}
+        for bound, bucket_count in zip((*self.bounds, float("inf")), counts):
+            cumulative += bucket_count
+            buckets[bound] = cumulative
+        return {"count": count, "sum": total, "buckets": buckets}
+
+
+class Metric:
+    """A family of values of the same metric, one per combination of label values"""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.__values: dict[tuple, object] = {}
+        self.__lock = Lock()
+
+    def labels(self, *values):
+        """Returns the value of the metric for these label values (in the order of the label names)"""
+        key = tuple(str(value) for value in values)
+        try:
+            return self.__values[key]
+        except KeyError:
+            pass
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"The metric {self.name!r} expects the labels {self.labelnames!r}")
+        with self.__lock:
+            return self.__values.setdefault(key, self._new_value())
+
+    def samples(self) -> dict[tuple, object]:
+        """Returns the current value of every combination of label values"""
+        with self.__lock:
+            values = dict(self.__values)
+        return {key: value.get() for key, value in values.items()}
+
+    def _new_value(self):
+        raise NotImplementedError()
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _new_value(self):
+        return _CounterValue()
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def _new_value(self):
+        return _GaugeValue()
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_value(self):
+        return _HistogramValue(self.buckets)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.__metrics: dict[str, Metric] = {}
+        self.__lock = Lock()
+
+    # ################################# Public methods ################################# #
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self.__get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self.__get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(
+        self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.__get_or_create(Histogram, name, documentation, labelnames, buckets)
+
+    def get(self, name: str, **labels):
+        """
+        Returns the current value of a metric for the given labels: a number for counters and gauges,
+        a dict with the count, the sum and the cumulative buckets for histograms. None if it was never recorded.
+        """
+        metric = self.__metrics.get(name)
+        if metric is None:
+            return None
+        key = tuple(str(labels.get(label)) for label in metric.labelnames)
+        return metric.samples().get(key)
+
+    def collect(self) -> list[Metric]:
+        with self.__lock:
+            return list(self.__metrics.values())
+
+    def to_prometheus(self) -> str:
+        """Returns every metric in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.collect():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for key, value in metric.samples().items():
+                labels = list(zip(metric.labelnames, key))
+                if metric.type != "histogram":
+                    lines.append(f"{metric.name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                for bound, count in value["buckets"].items():
+                    le = _format_value(bound)
+                    lines.append(f"{metric.name}_bucket{_format_labels([*labels, ('le', le)])} {count}")
+                lines.append(f"{metric.name}_sum{_format_labels(labels)} {_format_value(value['sum'])}")
+                lines.append(f"{metric.name}_count{_format_labels(labels)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Serves the metrics on http://host:port/metrics from a background thread"""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        Thread(target=server.serve_forever, name="aliot-metrics", daemon=True).start()
+        return server
+
+    # ################################# Private methods ################################# #
+
+    def __get_or_create(self, cls, name: str, documentation: str, labelnames: tuple, *args):
+        with self.__lock:
+            metric = self.__metrics.get(name)
+            if metric is None:
+                metric = self.__metrics[name] = cls(name, documentation, labelnames, *args)
+            elif type(metric) is not cls or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"The metric {name!r} is already registered with another type or other labels")
+            return metric
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: list) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    if math.isinf(value):
+        # The spelling of the Prometheus text format, Python writes inf
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(value) if value != int(value) else str(int(value))
+
+
+REGISTRY = MetricsRegistry()
+__servers: dict[int, ThreadingHTTPServer] = {}
+__servers_lock = Lock()
+
+
+def start_http_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serves `REGISTRY` on the port, once per port no matter how many objects ask for it"""
+    with __servers_lock:
+        if port not in __servers:
+            __servers[port] = REGISTRY.serve(port, host)
+        return __servers[port]
+
+
+class ObjMetrics:
+    """The instruments of one object, recorded in `REGISTRY` with the name of the object as label"""
+
+    def __init__(self, object_name: str, registry: MetricsRegistry = REGISTRY):
+        self.__object = object_name
+        self.__registry = registry
+        labels = ("object",)
+        self.__sent = registry.counter("aliot_messages_sent_total", "Messages sent, by event", (*labels, "event"))
+        self.__sent_bytes = registry.counter("aliot_sent_bytes_total", "Bytes of the messages sent", labels)
+        self.__received = registry.counter(
+            "aliot_messages_received_total", "Messages received, by event", (*labels, "event")
+        )
+        self.__received_bytes = registry.counter("aliot_received_bytes_total", "Bytes of the messages received", labels)
+        self.encode = registry.histogram("aliot_encode_seconds", "Time spent encoding messages", labels).labels(
+            object_name
+        )
+        self.decode = registry.histogram("aliot_decode_seconds", "Time spent decoding messages", labels).labels(
+            object_name
+        )
+        self.__handlers = registry.histogram(
+            "aliot_handler_seconds", "Execution time of the handlers (action:<id>, listener, broadcast)",
+            (*labels, "handler"),
+        )
+        self.__reconnects = registry.counter("aliot_reconnects_total", "Connection attempts after the first", labels)
+        self.__http = registry.histogram(
+            "aliot_http_request_seconds", "Latency of the REST calls, by endpoint", (*labels, "endpoint")
+        )
+        self.__http_errors = registry.counter(
+            "aliot_http_errors_total", "REST calls answered with an error status, by endpoint", (*labels, "endpoint")
+        )
+
+    def sent(self, event: str, size: int):
+        self.__sent.labels(self.__object, event).inc()
+        self.__sent_bytes.labels(self.__object).inc(size)
+
+    def received(self, event: str, size: int):
+        self.__received.labels(self.__object, event).inc()
+        self.__received_bytes.labels(self.__object).inc(size)
+
+    def handler(self, handler: str) -> _HistogramValue:
+        return self.__handlers.labels(self.__object, handler)
+
+    def reconnected(self):
+        self.__reconnects.labels(self.__object).inc()
+
+    def http_response(self, endpoint: str, seconds: float, status: int):
+        self.__http.labels(self.__object, endpoint).observe(seconds)
+        if status >= 400:
+            self.__http_errors.labels(self.__object, endpoint).inc()
+
+    def gauge(self, name: str, documentation: str, function: Callable[[], float]):
+        """Registers a gauge of the object read from `function` when the metrics are collected"""
+        self.__registry.gauge(name, documentation, ("object",)).labels(self.__object).set_function(function)
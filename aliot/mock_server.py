@@ -0,0 +1,489 @@
+"""
+Local stand-in for ALIVEcode, to run and test objects without the real servers.
+
+`MockAliveServer` serves the iot gateway (the websocket events of `ALIVE_IOT_EVENT`) and the REST routes used by the
+objects (`get_doc`, `get_field`, `get_fields`, `upload_image`) from background threads. Every object id and token is
+accepted unless `tokens` is given, and the objects share a single project document.
+
+```py
+with MockAliveServer() as server:
+    my_iot = AliotObj("my-object")
+    my_iot.ws_url, my_iot.api_url = server.ws_url, server.api_url
+    ...
+    server.wait_for("update_doc")
+    assert server.document == {"doc": {"temperature": 21}}
+```
+
+Run `python -m aliot.mock_server` to start one on fixed ports and point the `ws_url` and `api_url` of your
+config.ini to it. It needs the `async` extra (`pip install aliot-py[async]`).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import copy
+import json
+from collections import Counter
+from dataclasses import dataclass
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Condition, Event, Lock, Thread
+from typing import Any, Optional
+from urllib.parse import parse_qs
+from uuid import uuid4
+
+from aliot.constants import ALIVE_IOT_EVENT
+from aliot.doc_path import get_field, project, set_field
+from aliot.listener_index import WILDCARD
+
+try:
+    import websockets
+except ImportError:  # pragma: no cover - optional dependency
+    websockets = None
+
+
+@dataclass(frozen=True)
+class UploadedImage:
+    object_id: Optional[str]
+    filename: Optional[str]
+    content_type: Optional[str]
+    data: bytes
+
+
+class _Connection:
+    __slots__ = ("ws", "object_id", "session_id", "fields")
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.object_id: Optional[str] = None
+        self.session_id: Optional[str] = None
+        self.fields: set[str] = set()
+
+
+class MockAliveServer:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        ws_port: int = 0,
+        http_port: int = 0,
+        *,
+        document: Optional[dict] = None,
+        tokens: Optional[dict[str, str]] = None,
+        resume_sessions: bool = True,
+        record: bool = True,
+    ):
+        """
+        :param ws_port: port of the gateway, and `http_port` the port of the REST routes (0 picks a free port)
+        :param document: initial content of the project document
+        :param tokens: object id -> accepted token. Every object is accepted if None
+        :param resume_sessions: resume the session of an object that reconnects with a known session id
+        :param record: keep every received message in `received` (only the counts are kept if False)
+        """
+        self.__host = host
+        self.__ws_port = ws_port
+        self.__http_port = http_port
+        self.__document: dict = copy.deepcopy(document) if document is not None else {}
+        self.__document_lock = Lock()
+        self.__tokens = tokens
+        self.__resume_sessions = resume_sessions
+        self.__record = record
+        self.__received: list[dict] = []
+        self.__counts: Counter = Counter()
+        self.__images: list[UploadedImage] = []
+        self.__activity = Condition()
+
+        # The state of the gateway is only touched from its event loop
+        self.__objects: dict[str, _Connection] = {}
+        self.__sessions: dict[str, set[str]] = {}
+        self.__exact: dict[str, set[_Connection]] = {}
+        self.__prefixes: dict[str, set[_Connection]] = {}
+        self.__pending_results: dict[str, _Connection] = {}
+        self.__handlers = {
+            ALIVE_IOT_EVENT.CONNECT_OBJECT.value: self.__connect_object,
+            ALIVE_IOT_EVENT.SUBSCRIBE_LISTENER.value: self.__subscribe_listener,
+            ALIVE_IOT_EVENT.UNSUBSCRIBE_LISTENER.value: self.__unsubscribe_listener,
+            ALIVE_IOT_EVENT.UPDATE_DOC.value: self.__update_doc,
+            ALIVE_IOT_EVENT.SEND_BROADCAST.value: self.__send_broadcast,
+            ALIVE_IOT_EVENT.SEND_ACTION.value: self.__send_action,
+            ALIVE_IOT_EVENT.SEND_ACTION_DONE.value: self.__action_done,
+        }
+
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+        self.__thread: Optional[Thread] = None
+        self.__http_server: Optional[ThreadingHTTPServer] = None
+
+    # ################################# Properties ################################# #
+
+    @property
+    def ws_url(self) -> str:
+        return f"ws://{self.__host}:{self.__ws_port}"
+
+    @property
+    def api_url(self) -> str:
+        return f"http://{self.__host}:{self.__http_port}/api"
+
+    @property
+    def document(self) -> dict:
+        """Returns a copy of the project document"""
+        with self.__document_lock:
+            return copy.deepcopy(self.__document)
+
+    @property
+    def connected_objects(self) -> list[str]:
+        return sorted(self.__objects)
+
+    @property
+    def counts(self) -> dict[str, int]:
+        """Returns the number of messages received, by event (the REST calls are counted by route)"""
+        with self.__activity:
+            return dict(self.__counts)
+
+    @property
+    def images(self) -> list[UploadedImage]:
+        with self.__activity:
+            return list(self.__images)
+
+    # ################################# Public methods ################################# #
+
+    def start(self) -> MockAliveServer:
+        if websockets is None:
+            raise ImportError(
+                "MockAliveServer requires the 'websockets' package. Install it with `pip install aliot-py[async]`"
+            )
+        ready = Event()
+        errors = []
+        self.__thread = Thread(target=self.__run_gateway, args=(ready, errors), name="aliot-mock-gateway", daemon=True)
+        self.__thread.start()
+        ready.wait()
+        if errors:
+            raise errors[0]
+
+        self.__http_server = ThreadingHTTPServer((self.__host, self.__http_port), self.__make_http_handler())
+        self.__http_server.daemon_threads = True
+        self.__http_port = self.__http_server.server_address[1]
+        Thread(target=self.__http_server.serve_forever, name="aliot-mock-api", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.__http_server is not None:
+            self.__http_server.shutdown()
+            self.__http_server.server_close()
+            self.__http_server = None
+        if self.__loop is not None:
+            self.__loop.call_soon_threadsafe(self.__loop.stop)
+            self.__thread.join()
+            self.__loop = None
+
+    def __enter__(self) -> MockAliveServer:
+        return self.start()
+
+    def __exit__(self, *_):
+        self.stop()
+
+    def received(self, event: Optional[str | ALIVE_IOT_EVENT] = None) -> list[dict]:
+        """
+        Returns the messages received (`{"object": <id>, "event": <event>, "data": <data>}`), only the ones of
+        `event` if given
+        """
+        event = event.value if isinstance(event, ALIVE_IOT_EVENT) else event
+        with self.__activity:
+            return [msg for msg in self.__received if event is None or msg["event"] == event]
+
+    def wait_for(self, event: str | ALIVE_IOT_EVENT, count: int = 1, timeout: float = 5.0) -> bool:
+        """Waits until `count` messages of `event` were received in total. Returns False on timeout"""
+        event = event.value if isinstance(event, ALIVE_IOT_EVENT) else event
+        with self.__activity:
+            return self.__activity.wait_for(lambda: self.__counts[event] >= count, timeout)
+
+    def ping(self, object_id: Optional[str] = None):
+        """Sends a `ping` to an object (to every object if None), which must answer with a `pong`"""
+        self.__call(self.__send_to_all(object_id, ALIVE_IOT_EVENT.PING, None))
+
+    def send_action(self, object_id: str, action_id: str, value: Any = None, request_id: Optional[str] = None):
+        """Asks an object to run one of its actions, like a watcher would"""
+        data = {"id": action_id, "value": value}
+        if request_id is not None:
+            data["requestId"] = request_id
+        self.__call(self.__send_to_all(object_id, ALIVE_IOT_EVENT.RECEIVE_ACTION, data))
+
+    def update_doc(self, fields: dict):
+        """Updates fields of the document, like a watcher would, and pushes them to the objects listening to them"""
+        self.__call(self.__update_doc(None, {"fields": fields}))
+
+    def disconnect(self, object_id: Optional[str] = None, code: int = 1001, reason: str = ""):
+        """
+        Closes the connection of an object (of every object if None). The default code is the one of a server
+        going away (a restart), after which the objects reconnect right away
+        """
+        self.__call(self.__disconnect(object_id, code, reason))
+
+    # ################################# Private methods ################################# #
+
+    def __call(self, coro):
+        if self.__loop is None:
+            coro.close()
+            raise RuntimeError("The MockAliveServer is not started")
+        return asyncio.run_coroutine_threadsafe(coro, self.__loop).result()
+
+    def __run_gateway(self, ready: Event, errors: list):
+        loop = self.__loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+        async def open_gateway():
+            # No compression, the gateway would spend most of a load test deflating the messages. The short close
+            # timeout keeps `stop` from waiting on clients that never finish the closing handshake
+            return await websockets.serve(
+                self.__handle, self.__host, self.__ws_port, compression=None, close_timeout=1
+            )
+
+        try:
+            gateway = loop.run_until_complete(open_gateway())
+        except Exception as e:
+            self.__loop = None
+            errors.append(e)
+            ready.set()
+            loop.close()
+            return
+        self.__ws_port = gateway.sockets[0].getsockname()[1]
+        ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            gateway.close()
+            loop.run_until_complete(gateway.wait_closed())
+            loop.close()
+
+    def __notify(self, object_id: Optional[str], event: str, data):
+        with self.__activity:
+            self.__counts[event] += 1
+            if self.__record:
+                self.__received.append({"object": object_id, "event": event, "data": data})
+            self.__activity.notify_all()
+
+    async def __handle(self, ws, *_):
+        conn = _Connection(ws)
+        try:
+            async for message in ws:
+                try:
+                    msg = json.loads(message)
+                    event, data = msg["event"], msg.get("data")
+                except (ValueError, KeyError, TypeError):
+                    continue
+                handler = self.__handlers.get(event)
+                if handler is not None:
+                    await handler(conn, data)
+                # Counted once handled, so a test waiting for an event sees its effects
+                self.__notify(conn.object_id, event, data)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            self.__drop(conn)
+
+    async def __send(self, conn: _Connection, event: ALIVE_IOT_EVENT, data):
+        try:
+            await conn.ws.send(json.dumps({"event": event.value, "data": data}))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def __send_to_all(self, object_id: Optional[str], event: ALIVE_IOT_EVENT, data):
+        if object_id is not None:
+            conns = [self.__objects[object_id]] if object_id in self.__objects else []
+        else:
+            conns = list(self.__objects.values())
+        for conn in conns:
+            await self.__send(conn, event, data)
+
+    async def __disconnect(self, object_id: Optional[str], code: int, reason: str):
+        conns = list(self.__objects.values()) if object_id is None else [self.__objects.get(object_id)]
+        for conn in conns:
+            if conn is not None:
+                # The closing handshake completes in the background, like on a server going down
+                asyncio.ensure_future(conn.ws.close(code, reason))
+
+    def __drop(self, conn: _Connection):
+        if conn.object_id is not None and self.__objects.get(conn.object_id) is conn:
+            del self.__objects[conn.object_id]
+        # The session keeps the fields, the object gets them back if it resumes it
+        self.__index(conn, set())
+        for request_id in [key for key, sender in self.__pending_results.items() if sender is conn]:
+            del self.__pending_results[request_id]
+
+    def __index(self, conn: _Connection, fields: set[str]):
+        """Makes `fields` the subscribed fields of the connection"""
+        for field in conn.fields - fields:
+            index = self.__prefixes if field.endswith(WILDCARD) else self.__exact
+            key = field[: -len(WILDCARD)] if field.endswith(WILDCARD) else field
+            index[key].discard(conn)
+            if not index[key]:
+                del index[key]
+        for field in fields - conn.fields:
+            if field.endswith(WILDCARD):
+                self.__prefixes.setdefault(field[: -len(WILDCARD)], set()).add(conn)
+            else:
+                self.__exact.setdefault(field, set()).add(conn)
+        conn.fields = set(fields)
+        if conn.session_id is not None:
+            self.__sessions[conn.session_id] = set(fields)
+
+    # ################################# Gateway events ################################# #
+
+    async def __connect_object(self, conn: _Connection, data):
+        data = data if isinstance(data, dict) else {}
+        object_id = data.get("id")
+        if object_id is None or (self.__tokens is not None and self.__tokens.get(object_id) != data.get("token")):
+            await self.__send(conn, ALIVE_IOT_EVENT.ERROR, "Forbidden. Invalid credentials.")
+            return
+        previous = self.__objects.get(object_id)
+        if previous is not None and previous is not conn:
+            # The object reconnected before its previous connection was detected as closed
+            self.__drop(previous)
+        conn.object_id = object_id
+        self.__objects[object_id] = conn
+
+        resume = data.get("resume") if isinstance(data.get("resume"), dict) else {}
+        session_id = resume.get("sessionId")
+        resumed = self.__resume_sessions and session_id in self.__sessions
+        if not resumed:
+            session_id = uuid4().hex
+            self.__sessions[session_id] = set()
+        conn.session_id = session_id
+        self.__index(conn, self.__sessions[session_id])
+        await self.__send(conn, ALIVE_IOT_EVENT.CONNECT_SUCCESS, {"sessionId": session_id, "resumed": resumed})
+
+    async def __subscribe_listener(self, conn: _Connection, data):
+        self.__index(conn, conn.fields | set(data.get("fields", ())))
+        await self.__send(conn, ALIVE_IOT_EVENT.SUBSCRIBE_LISTENER_SUCCESS, None)
+
+    async def __unsubscribe_listener(self, conn: _Connection, data):
+        self.__index(conn, conn.fields - set(data.get("fields", ())))
+        await self.__send(conn, ALIVE_IOT_EVENT.UNSUBSCRIBE_LISTENER_SUCCESS, None)
+
+    async def __update_doc(self, conn: Optional[_Connection], data):
+        fields: dict = data.get("fields", {})
+        with self.__document_lock:
+            for field, value in fields.items():
+                set_field(self.__document, field, value)
+
+        pushed: dict[_Connection, dict] = {}
+        for field, value in fields.items():
+            listeners = set(self.__exact.get(field, ()))
+            for prefix, conns in self.__prefixes.items():
+                if field.startswith(prefix):
+                    listeners |= conns
+            for listener in listeners:
+                pushed.setdefault(listener, {})[field] = value
+        for listener, listened in pushed.items():
+            await self.__send(listener, ALIVE_IOT_EVENT.RECEIVE_LISTEN, {"fields": listened})
+
+    async def __send_broadcast(self, conn: _Connection, data):
+        for other in list(self.__objects.values()):
+            if other is not conn:
+                await self.__send(other, ALIVE_IOT_EVENT.RECEIVE_BROADCAST, {"data": data.get("data")})
+
+    async def __send_action(self, conn: _Connection, data):
+        target = self.__objects.get(data.get("targetId"))
+        if target is None:
+            return
+        action = {"id": data.get("actionId"), "value": data.get("value")}
+        if data.get("requestId") is not None:
+            self.__pending_results[data["requestId"]] = conn
+            action["requestId"] = data["requestId"]
+        await self.__send(target, ALIVE_IOT_EVENT.RECEIVE_ACTION, action)
+
+    async def __action_done(self, conn: _Connection, data):
+        sender = self.__pending_results.pop(data.get("requestId"), None)
+        if sender is not None:
+            await self.__send(sender, ALIVE_IOT_EVENT.RECEIVE_ACTION_DONE, data)
+
+    # ################################# REST routes ################################# #
+
+    def __route(self, route: str, params: dict, files: dict) -> tuple[int, Any]:
+        object_id = params.get("id")
+        if route == ALIVE_IOT_EVENT.UPLOAD_IMAGE.value:
+            filename, content_type, data = files.get("file", (None, None, b""))
+            image = UploadedImage(object_id, filename, content_type, data)
+            with self.__activity:
+                self.__images.append(image)
+            self.__notify(object_id, route, {"id": object_id, "filename": filename})
+            return 201, None
+
+        with self.__document_lock:
+            if route == ALIVE_IOT_EVENT.GET_DOC.value:
+                result = copy.deepcopy(self.__document)
+            elif route == ALIVE_IOT_EVENT.GET_FIELD.value:
+                result = copy.deepcopy(get_field(self.__document, params.get("field", "")))
+            elif route == ALIVE_IOT_EVENT.GET_FIELDS.value:
+                result = copy.deepcopy(project(self.__document, params.get("fields", ())))
+            else:
+                return 404, None
+        self.__notify(object_id, route, params)
+        return 201, result
+
+    def __make_http_handler(self):
+        route = self.__route
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                path = self.path.split("?")[0].rstrip("/")
+                if "/iot/aliot/" not in path:
+                    self.send_error(404)
+                    return
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                try:
+                    params, files = _parse_body(self.headers.get("Content-Type", ""), body)
+                except ValueError:
+                    self.send_error(400)
+                    return
+                status, result = route(path.rsplit("/", 1)[1], params, files)
+                payload = b"" if result is None else json.dumps(result).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def _parse_body(content_type: str, body: bytes) -> tuple[dict, dict]:
+    """Returns the parameters of a request body and its files (name -> (filename, content type, data))"""
+    media_type = content_type.split(";")[0].strip().lower()
+    if media_type == "application/json":
+        return json.loads(body or b"{}"), {}
+    if media_type == "multipart/form-data":
+        message = BytesParser(policy=HTTP).parsebytes(b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body)
+        params, files = {}, {}
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            if part.get_filename() is not None:
+                files[name] = (part.get_filename(), part.get_content_type(), part.get_payload(decode=True))
+            else:
+                params[name] = part.get_payload(decode=True).decode()
+        return params, files
+    return {key: values[0] for key, values in parse_qs(body.decode()).items()}, {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs a local stand-in for ALIVEcode")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--ws-port", type=int, default=8881)
+    parser.add_argument("--http-port", type=int, default=8882)
+    args = parser.parse_args()
+
+    server = MockAliveServer(args.host, args.ws_port, args.http_port, record=False).start()
+    print(f"ws_url = {server.ws_url}")
+    print(f"api_url = {server.api_url}")
+    try:
+        Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+from threading import Lock
+from time import time
+from typing import Any, Optional
+
+from aliot.constants import ALIVE_IOT_EVENT
+
+# * Events kept while offline. The other ones (PONG, action results, ...) only make sense for the current connection #
+OFFLINE_EVENTS = frozenset(
+    {
+        ALIVE_IOT_EVENT.UPDATE_DOC.value,
+        ALIVE_IOT_EVENT.SEND_BROADCAST.value,
+        ALIVE_IOT_EVENT.SEND_ROUTE.value,
+        ALIVE_IOT_EVENT.UPDATE_COMPONENT.value,
+    }
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    event TEXT NOT NULL,
+    field TEXT UNIQUE,
+    data TEXT NOT NULL,
+    created REAL NOT NULL
+)
+"""
+
+
+class OfflineOutbox:
+    """
+    Disk-backed (SQLite) outbox keeping the events sent while the object is disconnected, so they can be
+    replayed once it reconnects.
+
+    The fields of `update_doc` events are stored one per row and only their latest value is kept, so a field
+    updated a thousand times while offline is replayed once. The outbox keeps at most `max_events` rows
+    (the oldest ones are dropped first) and, if `retention` is set, drops the rows older than `retention` seconds.
+    """
+
+    def __init__(self, path: str, max_events: int = 10_000, retention: Optional[float] = None):
+        if max_events <= 0:
+            raise ValueError("The max_events of an OfflineOutbox must be greater than 0")
+        self.__path = path
+        self.__max_events = max_events
+        self.__retention = retention
+        self.__lock = Lock()
+        self.__db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.__db.execute("PRAGMA journal_mode=WAL")
+        self.__db.execute(_SCHEMA)
+        self.__dropped = 0
+
+    # ################################# Properties ################################# #
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    @property
+    def dropped(self) -> int:
+        """Number of events dropped because the outbox was full or because they were too old"""
+        return self.__dropped
+
+    # ################################# Public methods ################################# #
+
+    def __len__(self) -> int:
+        with self.__lock:
+            return self.__db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    @staticmethod
+    def accepts(event: str) -> bool:
+        return event in OFFLINE_EVENTS
+
+    def append(self, event: str, data: Any):
+        now = time()
+        with self.__lock, self.__db:
+            self.__db.execute("BEGIN")
+            if event == ALIVE_IOT_EVENT.UPDATE_DOC.value:
+                # Replacing the row moves it to the end of the outbox, with the latest value
+                self.__db.executemany(
+                    "INSERT OR REPLACE INTO outbox (event, field, data, created) VALUES (?, ?, ?, ?)",
+                    [(event, field, self.__dumps(value), now) for field, value in data["fields"].items()],
+                )
+            else:
+                self.__db.execute(
+                    "INSERT INTO outbox (event, field, data, created) VALUES (?, NULL, ?, ?)",
+                    (event, self.__dumps(data), now),
+                )
+            self.__trim(now)
+
+    def drain(self) -> list[tuple[str, Any]]:
+        """
+        Removes every event from the outbox and returns them in the order they were sent.
+        Consecutive document fields are merged back into a single `update_doc` event.
+        """
+        with self.__lock, self.__db:
+            self.__db.execute("BEGIN")
+            self.__trim(time())
+            rows = self.__db.execute("SELECT event, field, data FROM outbox ORDER BY seq").fetchall()
+            self.__db.execute("DELETE FROM outbox")
+
+        events: list[tuple[str, Any]] = []
+        for event, field, data in rows:
+            value = json.loads(data)
+            if field is None:
+                events.append((event, value))
+            elif events and events[-1][0] == event:
+                events[-1][1]["fields"][field] = value
+            else:
+                events.append((event, {"fields": {field: value}}))
+        return events
+
+    def restore(self, events: list[tuple[str, Any]]):
+        """
+        Puts back events that were drained but could not be sent, in front of the events kept since.
+        The document fields updated since the drain keep their newer value.
+        """
+        if not events:
+            return
+        now = time()
+        rows = []
+        for event, data in events:
+            if event == ALIVE_IOT_EVENT.UPDATE_DOC.value:
+                rows.extend((event, field, self.__dumps(value)) for field, value in data["fields"].items())
+            else:
+                rows.append((event, None, self.__dumps(data)))
+        with self.__lock, self.__db:
+            self.__db.execute("BEGIN")
+            first = self.__db.execute("SELECT MIN(seq) FROM outbox").fetchone()[0]
+            first = 1 if first is None else first
+            self.__db.executemany(
+                "INSERT OR IGNORE INTO outbox (seq, event, field, data, created) VALUES (?, ?, ?, ?, ?)",
+                [(first - len(rows) + i, event, field, data, now) for i, (event, field, data) in enumerate(rows)],
+            )
+            self.__trim(now)
+
+    def clear(self):
+        with self.__lock:
+            self.__db.execute("DELETE FROM outbox")
+
+    def close(self):
+        with self.__lock:
+            self.__db.close()
+
+    # ################################# Private methods ################################# #
+
+    @staticmethod
+    def __dumps(value) -> str:
+        return json.dumps(value, default=str)
+
+    def __trim(self, now: float):
+        # Must be called with the lock held, inside a transaction
+        dropped = 0
+        if self.__retention is not None:
+            dropped += self.__db.execute(
+                "DELETE FROM outbox WHERE created < ?", (now - self.__retention,)
+            ).rowcount
+        count = self.__db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+        if count > self.__max_events:
+            dropped += self.__db.execute(
+                "DELETE FROM outbox WHERE seq IN (SELECT seq FROM outbox ORDER BY seq LIMIT ?)",
+                (count - self.__max_events,),
+            ).rowcount
+        self.__dropped += dropped
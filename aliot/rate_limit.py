@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+from threading import Lock
+from time import monotonic
+from typing import Callable, Optional
+
+
+class TokenBucket:
+    """
+    Lets through `rate` events per second on average, and bursts of up to `burst` events.
+
+    The bucket holds up to `burst` tokens and is refilled with `rate` tokens per second, every event takes one.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None, clock: Callable[[], float] = monotonic):
+        if rate <= 0:
+            raise ValueError("The rate of a TokenBucket must be greater than 0")
+        self.__rate = rate
+        self.__burst = max(1.0, rate if burst is None else burst)
+        self.__clock = clock
+        self.__tokens = self.__burst
+        self.__updated = clock()
+        self.__lock = Lock()
+
+    # ################################# Properties ################################# #
+
+    @property
+    def rate(self) -> float:
+        return self.__rate
+
+    @property
+    def burst(self) -> float:
+        return self.__burst
+
+    # ################################# Public methods ################################# #
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Takes the tokens if they are available. Returns False, without taking anything, otherwise"""
+        with self.__lock:
+            self.__refill()
+            if self.__tokens < tokens:
+                return False
+            self.__tokens -= tokens
+            return True
+
+    def delay(self, tokens: float = 1) -> float:
+        """Returns the seconds to wait until the tokens are available (0 if they already are)"""
+        with self.__lock:
+            self.__refill()
+            return max(0.0, (tokens - self.__tokens) / self.__rate)
+
+    def reserve(self, tokens: float = 1) -> float:
+        """
+        Takes the tokens right away, even if they are not available yet, and returns the seconds to wait before using
+        them. The events reserved one after the other are spaced by the rate, in the order of their reservation
+        """
+        with self.__lock:
+            self.__refill()
+            self.__tokens -= tokens
+            return max(0.0, -self.__tokens / self.__rate)
+
+    # ################################# Private methods ################################# #
+
+    def __refill(self):
+        now = self.__clock()
+        self.__tokens = min(self.__burst, self.__tokens + (now - self.__updated) * self.__rate)
+        self.__updated = now
+
+
+def parse_rate_limits(value: str) -> dict[str, TokenBucket]:
+    """
+    Parses the rate limits of the config, a comma separated list of `<event>:<rate>[/<burst>]`
+    (`update_doc:20/5, send_broadcast:2` for example)
+    """
+    limits = {}
+    for limit in filter(None, (part.strip() for part in value.split(","))):
+        event, _, spec = limit.partition(":")
+        rate, _, burst = spec.partition("/")
+        try:
+            limits[event.strip()] = TokenBucket(float(rate), float(burst) if burst.strip() else None)
+        except ValueError:
+            raise ValueError(f"Invalid rate limit {limit!r}, expected <event>:<rate>[/<burst>]") from None
+    return limits
@@ -0,0 +1,296 @@
+from __future__ import annotations
+
+from collections import deque
+from dataclasses import dataclass
+from enum import Enum, IntEnum, unique
+from itertools import count
+from threading import Condition, Thread
+from typing import Any, Callable, Optional
+
+from aliot.constants import ALIVE_IOT_EVENT
+from aliot.logger import log_err
+from aliot.rate_limit import TokenBucket
+
+
+@unique
+class BackPressurePolicy(Enum):
+    # * Wait for room in the queue (up to the block timeout, then drop the new message) #
+    BLOCK = "block"
+    # * Discard the oldest pending message to make room for the new one #
+    DROP_OLDEST = "drop_oldest"
+    # * Discard the new message #
+    DROP_NEWEST = "drop_newest"
+
+
+@unique
+class Priority(IntEnum):
+    # * Connection, heartbeat and subscriptions, sent before anything else #
+    CONTROL = 0
+    # * Actions and their results, awaited by another object #
+    RESULT = 1
+    # * Document updates, broadcasts and the rest of the telemetry #
+    BULK = 2
+
+
+# * event -> lane of the send queue, the events not listed are BULK #
+EVENT_PRIORITIES: dict[str, Priority] = {
+    ALIVE_IOT_EVENT.PONG.value: Priority.CONTROL,
+    ALIVE_IOT_EVENT.PING.value: Priority.CONTROL,
+    ALIVE_IOT_EVENT.CONNECT_OBJECT.value: Priority.CONTROL,
+    ALIVE_IOT_EVENT.SUBSCRIBE_LISTENER.value: Priority.CONTROL,
+    ALIVE_IOT_EVENT.UNSUBSCRIBE_LISTENER.value: Priority.CONTROL,
+    ALIVE_IOT_EVENT.SEND_ACTION_DONE.value: Priority.RESULT,
+    ALIVE_IOT_EVENT.SEND_ACTION.value: Priority.RESULT,
+}
+
+
+def event_priority(event: str) -> Priority:
+    return EVENT_PRIORITIES.get(event, Priority.BULK)
+
+
+_NOTHING = object()
+
+
+@dataclass(frozen=True)
+class SendQueueMetrics:
+    depth: int
+    max_depth: int
+    enqueued: int
+    sent: int
+    dropped: int
+    errors: int
+    # * Times the writer waited for a rate limit #
+    throttled: int = 0
+
+
+class SendQueue:
+    """
+    Bounded outbound queue drained by a single writer thread, so the websocket
+    is only ever written from one place and producers never wait on the network.
+
+    The items wait in one lane per `Priority`, the writer always sends the oldest item of the most urgent lane, so a
+    burst of telemetry never delays a pong or the result of an action. Within a lane, each event has its own queue:
+    the events with a rate limit wait there until their bucket has a token, while the older items of the other
+    events, in the same lane or not, are still sent.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1000,
+        policy: BackPressurePolicy = BackPressurePolicy.BLOCK,
+        block_timeout: Optional[float] = None,
+        rate_limits: Optional[dict[str, TokenBucket]] = None,
+    ):
+        if maxsize <= 0:
+            raise ValueError("The maxsize of a SendQueue must be greater than 0")
+        self.__maxsize = maxsize
+        self.__policy = policy
+        self.__block_timeout = block_timeout
+        self.__rate_limits = rate_limits or {}
+        # * One dict per priority: event -> deque of (seq, item), the seq keeps the order across the events #
+        self.__lanes: list[dict[Optional[str], deque]] = [{} for _ in Priority]
+        self.__seq = count()
+        self.__depth = 0
+        self.__cond = Condition()
+        self.__send: Optional[Callable[[Any], None]] = None
+        self.__writer: Optional[Thread] = None
+        self.__running = False
+        # * True while the writer sends an item it popped #
+        self.__writing = False
+        self.__max_depth = 0
+        self.__enqueued = 0
+        self.__sent = 0
+        self.__dropped = 0
+        self.__errors = 0
+        self.__throttled = 0
+
+    # ################################# Properties ################################# #
+
+    @property
+    def maxsize(self) -> int:
+        return self.__maxsize
+
+    @property
+    def policy(self) -> BackPressurePolicy:
+        return self.__policy
+
+    @property
+    def depth(self) -> int:
+        return self.__depth
+
+    @property
+    def running(self) -> bool:
+        return self.__running
+
+    @property
+    def metrics(self) -> SendQueueMetrics:
+        with self.__cond:
+            return SendQueueMetrics(
+                depth=self.__depth,
+                max_depth=self.__max_depth,
+                enqueued=self.__enqueued,
+                sent=self.__sent,
+                dropped=self.__dropped,
+                errors=self.__errors,
+                throttled=self.__throttled,
+            )
+
+    # ################################# Public methods ################################# #
+
+    def start(self, send: Callable[[Any], None]):
+        """Starts the writer thread, which calls `send` for every queued item"""
+        with self.__cond:
+            self.__send = send
+            if self.__running:
+                return
+            self.__running = True
+        self.__writer = Thread(target=self.__drain, name="aliot-writer", daemon=True)
+        self.__writer.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stops the writer thread. Items still in the queue are discarded"""
+        with self.__cond:
+            self.__running = False
+            self.__cond.notify_all()
+        if self.__writer is not None:
+            self.__writer.join(timeout)
+            self.__writer = None
+        self.clear()
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits until every pending item was sent (or the writer stopped).
+        Returns False if items are still pending after `timeout` seconds
+        """
+        with self.__cond:
+            return self.__cond.wait_for(
+                lambda: not (self.__depth or self.__writing) or not self.__running, timeout
+            )
+
+    def put(
+        self,
+        item,
+        priority: Priority = Priority.BULK,
+        event: Optional[str] = None,
+        *,
+        policy: Optional[BackPressurePolicy] = None,
+    ) -> bool:
+        """
+        Queues an item for the writer thread. Returns False if the item was dropped
+
+        When the queue is full, the oldest item of a less urgent lane makes room for the new one, whatever the policy.
+        The policy only applies when every pending item is at least as urgent as the new one
+
+        :param event: event of the item, to apply its rate limit
+        :param policy: overrides the policy of the queue for this item
+        """
+        if policy is None:
+            policy = self.__policy
+        with self.__cond:
+            if self.__depth >= self.__maxsize and not self.__evict_less_urgent(priority):
+                if policy is BackPressurePolicy.DROP_NEWEST:
+                    self.__dropped += 1
+                    return False
+                if policy is BackPressurePolicy.DROP_OLDEST:
+                    lane = self.__lanes[priority]
+                    if not lane:
+                        # Only more urgent items are pending
+                        self.__dropped += 1
+                        return False
+                    self.__take(lane, self.__oldest(lane))
+                    self.__dropped += 1
+                elif not self.__cond.wait_for(
+                    lambda: self.__depth < self.__maxsize or not self.__running,
+                    self.__block_timeout,
+                ) or self.__depth >= self.__maxsize:
+                    self.__dropped += 1
+                    return False
+
+            self.__lanes[priority].setdefault(event, deque()).append((next(self.__seq), item))
+            self.__depth += 1
+            self.__enqueued += 1
+            if self.__depth > self.__max_depth:
+                self.__max_depth = self.__depth
+            self.__cond.notify_all()
+            return True
+
+    def clear(self) -> list[tuple[Optional[str], Any]]:
+        """Discards every pending item and returns them as (event, item), in the order they would have been sent"""
+        with self.__cond:
+            pending = []
+            for lane in self.__lanes:
+                entries = sorted((seq, event, item) for event, items in lane.items() for seq, item in items)
+                pending.extend((event, item) for _, event, item in entries)
+            self.__dropped += self.__depth
+            for lane in self.__lanes:
+                lane.clear()
+            self.__depth = 0
+            self.__cond.notify_all()
+            return pending
+
+    # ################################# Private methods ################################# #
+
+    @staticmethod
+    def __oldest(lane: dict[Optional[str], deque]) -> Optional[str]:
+        """Returns the event of the oldest item of the lane"""
+        return min(lane, key=lambda event: lane[event][0][0])
+
+    def __take(self, lane: dict[Optional[str], deque], event: Optional[str]):
+        items = lane[event]
+        item = items.popleft()[1]
+        if not items:
+            del lane[event]
+        self.__depth -= 1
+        return item
+
+    def __evict_less_urgent(self, priority: Priority) -> bool:
+        for lane in reversed(self.__lanes[priority + 1 :]):
+            if lane:
+                self.__take(lane, self.__oldest(lane))
+                self.__dropped += 1
+                return True
+        return False
+
+    def __pop(self) -> tuple[Any, Optional[float]]:
+        """Pops the next item to send, or returns _NOTHING with the seconds until a rate limit lets an item through"""
+        wait = None
+        for lane in self.__lanes:
+            # The oldest item of each event, a limited event does not hold back the events queued after it
+            for event in sorted(lane, key=lambda e: lane[e][0][0]):
+                bucket = self.__rate_limits.get(event)
+                if bucket is not None and not bucket.try_acquire():
+                    delay = bucket.delay()
+                    wait = delay if wait is None else min(wait, delay)
+                    continue
+                return self.__take(lane, event), None
+        return _NOTHING, wait
+
+    def __drain(self):
+        while True:
+            with self.__cond:
+                self.__cond.wait_for(lambda: self.__depth or not self.__running)
+                if not self.__running:
+                    return
+                item, wait = self.__pop()
+                if item is _NOTHING:
+                    self.__throttled += 1
+                    # A new item in a free lane wakes the writer before the end of the wait
+                    self.__cond.wait(wait)
+                    continue
+                send = self.__send
+                self.__writing = True
+                self.__cond.notify_all()
+
+            try:
+                send(item)
+            except Exception as e:
+                with self.__cond:
+                    self.__errors += 1
+                    self.__writing = False
+                    self.__cond.notify_all()
+                log_err("While sending a queued message: %r", e)
+            else:
+                with self.__cond:
+                    self.__sent += 1
+                    self.__writing = False
+                    self.__cond.notify_all()
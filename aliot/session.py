@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+from enum import Enum, unique
+from typing import Iterable, Optional
+
+
+@unique
+class OnStartPolicy(Enum):
+    # * Run on_start again on every reconnection #
+    ALWAYS = "always"
+    # * Run on_start again on a reconnection only if the previous run has returned #
+    IF_STOPPED = "if_stopped"
+    # * Only run on_start on the first connection #
+    NEVER = "never"
+
+
+class Session:
+    """
+    State of an object kept across its connections: the session id given by the server and the fields the server
+    pushes to the object.
+
+    On a reconnection, the object sends them back as a resume hint in `connect_object`. A server that still knows
+    the session answers `connect_success` with `resumed: true` and the object only sends the subscriptions that
+    changed meanwhile. Otherwise, the object subscribes to every field again.
+    """
+
+    def __init__(self, on_start_policy: OnStartPolicy = OnStartPolicy.IF_STOPPED):
+        self.on_start_policy = on_start_policy
+        self.__id: Optional[str] = None
+        self.__subscribed: set[str] = set()
+        self.__started = False
+
+    # ################################# Properties ################################# #
+
+    @property
+    def id(self) -> Optional[str]:
+        return self.__id
+
+    @property
+    def subscribed(self) -> list[str]:
+        """Returns the sorted list of the fields the server was asked to push"""
+        return sorted(self.__subscribed)
+
+    # ################################# Public methods ################################# #
+
+    def resume_hint(self) -> Optional[dict]:
+        """Returns what to add to `connect_object` to resume the session, or None on the first connection"""
+        if self.__id is None and not self.__subscribed:
+            return None
+        return {"sessionId": self.__id, "fields": sorted(self.__subscribed)}
+
+    def accept(self, data) -> bool:
+        """Reads the session from the data of `connect_success`. Returns True if the server resumed the session"""
+        if not isinstance(data, dict):
+            data = {}
+        if data.get("sessionId") is not None:
+            self.__id = data["sessionId"]
+        resumed = bool(data.get("resumed")) and (self.__id is not None or bool(self.__subscribed))
+        if not resumed:
+            # A new session, the server pushes nothing until the object subscribes
+            self.__subscribed.clear()
+        return resumed
+
+    def update_subscriptions(self, fields: Iterable[str]) -> tuple[list[str], list[str]]:
+        """
+        Makes `fields` the subscribed fields and returns the fields to subscribe to and the fields to unsubscribe from
+        """
+        fields = set(fields)
+        added = sorted(fields - self.__subscribed)
+        removed = sorted(self.__subscribed - fields)
+        self.__subscribed = fields
+        return added, removed
+
+    def should_run_on_start(self, running: bool) -> bool:
+        """
+        Returns True if on_start must run for this connection
+
+        :param running: True if the previous run of on_start has not returned yet
+        """
+        if not self.__started:
+            self.__started = True
+            return True
+        if self.on_start_policy is OnStartPolicy.ALWAYS:
+            return True
+        if self.on_start_policy is OnStartPolicy.IF_STOPPED:
+            return not running
+        return False
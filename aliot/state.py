@@ -1,20 +1,226 @@
+from __future__ import annotations
+
 import json
-from dataclasses import fields, Field
+from dataclasses import fields, is_dataclass
+from operator import attrgetter
+from typing import Callable, Optional
+
+
+class _DocPlan:
+    """
+    What `as_doc` has to read for a class and a document name, computed on first use:
+    the included attributes, their keys in the document and the states to flatten
+    """
+
+    __slots__ = ("names", "keys", "getter", "flattened")
+
+    def __init__(self, names: tuple, document_name: str, flattened: tuple):
+        self.names = names
+        self.keys = tuple(f"/{document_name}/{name}" for name in names)
+        getter = attrgetter(*names) if names else None
+        # attrgetter returns the value itself instead of a tuple when it gets a single name
+        self.getter: Optional[Callable] = (lambda obj: (getter(obj),)) if len(names) == 1 else getter
+        self.flattened = tuple((name, f"{document_name}/{name}") for name in flattened)
+
+
+_plans: dict[tuple[type, str], Optional[_DocPlan]] = {}
+_attributes: dict[type, Optional[tuple]] = {}
+
+
+def _slot_names(cls: type) -> Optional[tuple]:
+    """Returns the attributes of a class whose instances only have slots, or None if they have a __dict__"""
+    names = []
+    for klass in reversed(cls.__mro__[:-1]):
+        if "__slots__" not in klass.__dict__:
+            return None
+        slots = klass.__dict__["__slots__"]
+        for name in (slots,) if isinstance(slots, str) else slots:
+            if name == "__dict__":
+                return None
+            # Private slots are stored under a mangled name and are never part of the document
+            if name != "__weakref__" and not name.startswith("__"):
+                names.append(name)
+    return tuple(names)
+
+
+def _attribute_names(cls: type) -> Optional[tuple]:
+    """Returns every attribute of the state class, or None if they can only be found in the __dict__"""
+    if cls not in _attributes:
+        if is_dataclass(cls):
+            _attributes[cls] = tuple(field.name for field in fields(cls))
+        else:
+            _attributes[cls] = _slot_names(cls)
+    return _attributes[cls]
+
+
+def _doc_plan(cls: type, document_name: str) -> Optional[_DocPlan]:
+    key = (cls, document_name)
+    try:
+        return _plans[key]
+    except KeyError:
+        pass
+
+    if is_dataclass(cls):
+        # the "as_doc" metadata excludes a field when False, the "flatten" metadata spreads a nested state
+        # over one document field per attribute
+        included = [field for field in fields(cls) if field.metadata.get("as_doc", True)]
+        plan = _DocPlan(
+            tuple(field.name for field in included if not field.metadata.get("flatten", False)),
+            document_name,
+            tuple(field.name for field in included if field.metadata.get("flatten", False)),
+        )
+    else:
+        names = _slot_names(cls)
+        plan = None if names is None else _DocPlan(names, document_name, ())
+
+    _plans[key] = plan
+    return plan
 
 
 class AliotObjState:
+    """
+    Base class of the state of an object, usually a dataclass.
+
+    Field metadata:
+    - `as_doc=False` leaves the field out of the document
+    - `flatten=True` on a field holding another state writes each of its attributes in its own document field
+      (`/document/motor/speed` instead of `/document/motor`)
+    """
+
+    # The change tracking lives in slots, so it never shows up in the fields or in the __dict__ of the state
+    # (__synced is only set once the changes were cleared, before that every field counts as changed)
+    __slots__ = ("__changes", "__parents", "__synced")
+
+    def __setattr__(self, name, value):
+        old = getattr(self, name, None)
+        object.__setattr__(self, name, value)
+        if isinstance(old, AliotObjState) and old is not value:
+            old.__unlink_parent(self, name)
+        if isinstance(value, AliotObjState):
+            value.__link_parent(self, name)
+        self.__mark_changed(name)
+
+    @property
+    def changed_fields(self) -> set:
+        """Returns the names of the fields assigned since the last sync (or since the creation of the state)"""
+        return set(self.__get_changes())
+
+    def mark_changed(self, *names: str):
+        """Marks fields as changed, for mutations that cannot be tracked (appending to a list field, for example)"""
+        for name in names:
+            self.__mark_changed(name)
+
+    def clear_changes(self):
+        """Forgets the changes of the state and of the states nested in it"""
+        self.__clear_changes(set())
+
     def as_doc(self, document_name="document"):
-        if not hasattr(self, "__dataclass_fields__"):
-            # if the child object is not a dataclass, we return the object as a dict formatted with the document name
-            return {f"/{document_name}/{key}": val for key, val in self.__dict__.items()}
+        plan = _doc_plan(type(self), document_name)
+        if plan is None:
+            # if the child object is neither a dataclass nor a slots class, we return the object as a dict formatted
+            # with the document name
+            prefix = f"/{document_name}/"
+            return {prefix + key: val for key, val in self.__dict__.items()}
+
+        doc = {}
+        if plan.getter is not None:
+            try:
+                doc = dict(zip(plan.keys, plan.getter(self)))
+            except AttributeError:
+                # slots that were never assigned are left out of the document
+                doc = {key: getattr(self, name) for key, name in zip(plan.keys, plan.names) if hasattr(self, name)}
+        for name, nested_document_name in plan.flattened:
+            value = getattr(self, name)
+            if isinstance(value, AliotObjState):
+                doc.update(value.as_doc(nested_document_name))
+            else:
+                doc[f"/{nested_document_name}"] = value
+        return doc
+
+    def as_doc_changes(self, document_name="document", clear: bool = True):
+        """
+        Same as `as_doc`, but only with the fields that changed since the last sync.
+        A change in a nested state marks the field holding it as changed. A state that was never synced returns
+        every field, its changes may not have been recorded (the fields of a frozen dataclass, for example)
 
-        def field_is_included(field: Field):
-            # returns True if the metadata does not contain "as_doc" or if it contains "as_doc" and it is True
-            return field.metadata.get("as_doc", True)
+        :param clear: if True, the changes are forgotten, the next call only returns the fields changed after it
+        """
+        changes = self.__get_changes()
+        plan = _doc_plan(type(self), document_name)
+        if not self.__is_synced():
+            doc = self.as_doc(document_name)
+        elif plan is None:
+            prefix = f"/{document_name}/"
+            doc = {prefix + key: val for key, val in self.__dict__.items() if key in changes}
+        else:
+            doc = {key: getattr(self, name) for key, name in zip(plan.keys, plan.names) if name in changes}
+            for name, nested_document_name in plan.flattened:
+                if name not in changes:
+                    continue
+                value = getattr(self, name)
+                if isinstance(value, AliotObjState):
+                    doc.update(value.as_doc_changes(nested_document_name, clear=False))
+                else:
+                    doc[f"/{nested_document_name}"] = value
 
-        # noinspection PyDataclass
-        return {f"/{document_name}/{field.name}": getattr(self, field.name) for field in fields(self) if
-                field_is_included(field)}
+        if clear:
+            self.clear_changes()
+        return doc
 
     def __str__(self):
-        return json.dumps(self.__dict__, indent=2)
+        names = _attribute_names(type(self))
+        if names is None or hasattr(self, "__dict__"):
+            return json.dumps(self.__dict__, indent=2)
+        return json.dumps({name: getattr(self, name) for name in names if hasattr(self, name)}, indent=2)
+
+    def __get_changes(self) -> set:
+        try:
+            return self.__changes
+        except AttributeError:
+            changes = set()
+            object.__setattr__(self, "_AliotObjState__changes", changes)
+            return changes
+
+    def __is_synced(self) -> bool:
+        try:
+            return self.__synced
+        except AttributeError:
+            return False
+
+    def __get_parents(self) -> list:
+        try:
+            return self.__parents
+        except AttributeError:
+            parents = []
+            object.__setattr__(self, "_AliotObjState__parents", parents)
+            return parents
+
+    def __mark_changed(self, name: str):
+        changes = self.__get_changes()
+        if name in changes:
+            # The parents already know, since they are cleared along with their nested states
+            return
+        changes.add(name)
+        for parent, parent_field in self.__get_parents():
+            parent.__mark_changed(parent_field)
+
+    def __link_parent(self, parent, name: str):
+        parents = self.__get_parents()
+        if not any(p is parent and n == name for p, n in parents):
+            parents.append((parent, name))
+
+    def __unlink_parent(self, parent, name: str):
+        parents = self.__get_parents()
+        parents[:] = [(p, n) for p, n in parents if not (p is parent and n == name)]
+
+    def __clear_changes(self, cleared: set):
+        if id(self) in cleared:
+            return
+        cleared.add(id(self))
+        self.__get_changes().clear()
+        object.__setattr__(self, "_AliotObjState__synced", True)
+        names = _attribute_names(type(self))
+        values = self.__dict__.values() if names is None else (getattr(self, name, None) for name in names)
+        for value in values:
+            if isinstance(value, AliotObjState):
+                value.__clear_changes(cleared)
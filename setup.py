@@ -34,6 +34,12 @@ if __name__ == "__main__":
             "requests~=2.27.1",
             "setuptools==62.1.0",
         ],
+        extras_require={
+            "async": ["websockets>=10.0"],
+            "msgpack": ["msgpack>=1.0"],
+            "cbor": ["cbor2>=5.4"],
+            "fast": ["orjson>=3.6"],
+        },
         setup_requires="setuptools",
         entry_points={"console_scripts": ["aliot = aliot.core._cli.aliot_cli:main"]},
     )
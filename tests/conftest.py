@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+from aliot.aliot_obj import AliotObj
+
+
+class FakeWebSocketApp:
+    """
+    Stands in for `websocket.WebSocketApp` through `AliotObj._websocket_app`: `run_forever` opens the connection and
+    returns right away, the test then plays the server with `receive` and `drop`
+    """
+
+    def __init__(self, url, on_open=None, on_message=None, on_error=None, on_close=None):
+        self.url = url
+        self.on_open = on_open
+        self.on_message = on_message
+        self.on_close = on_close
+        self.sent = []
+        self.closed = False
+
+    @property
+    def events(self) -> list:
+        """The events sent after connect_object"""
+        return [msg for msg in self.sent if msg["event"] != "connect_object"]
+
+    def run_forever(self, **kwargs):
+        self.on_open(self)
+
+    def send(self, data, opcode=None):
+        self.sent.append(json.loads(data))
+
+    def close(self, **kwargs):
+        self.drop(None)
+
+    def receive(self, event: str, data=None):
+        self.on_message(self, json.dumps({"event": event, "data": data}))
+
+    def drop(self, status_code=1006):
+        """Closes the connection as the server would"""
+        if not self.closed:
+            self.closed = True
+            self.on_close(self, status_code, None)
+
+
+@pytest.fixture
+def connect():
+    """Connects an AliotObj to a new FakeWebSocketApp, through `run`, and returns the fake"""
+
+    def connect(obj: AliotObj) -> FakeWebSocketApp:
+        apps = []
+
+        def make_app(*args, **kwargs):
+            apps.append(FakeWebSocketApp(*args, **kwargs))
+            return apps[-1]
+
+        obj._websocket_app = make_app
+        obj.run(retry=False)
+        return apps[-1]
+
+    return connect
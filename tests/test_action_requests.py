@@ -0,0 +1,43 @@
+import pytest
+
+from aliot.action_requests import ActionRequests, ActionTimeoutError
+from aliot.aliot_obj import AliotObj
+
+
+def test_results_timeouts_and_window():
+    requests = ActionRequests(max_in_flight=2, timeout=0.05)
+    first_id, first = requests.open()
+    second_id, second = requests.open(timeout=5)
+    assert requests.in_flight == 2
+
+    assert requests.resolve(second_id, 42) and second.result() == 42
+    assert not requests.resolve(second_id, 43)
+    with pytest.raises(ActionTimeoutError):
+        first.result(1)
+
+    # Both slots are free again, a third request waits until one is released
+    requests.open(timeout=5), requests.open(timeout=5)
+    _, third = requests.open(timeout=0.01)
+    assert isinstance(third.exception(), ActionTimeoutError)
+
+    requests.fail_all(ConnectionError())
+    assert requests.in_flight == 0
+
+
+def test_send_action_is_resolved_by_its_request_id(connect):
+    obj = AliotObj("test")
+    ws = connect(obj)
+
+    future = obj.send_action("other", "double", {"x": 2}, expect_result=True)
+    request_id = ws.sent[-1]["data"]["requestId"]
+    ws.receive("receive_action_done", {"requestId": request_id, "value": 4})
+    assert future.result(1) == 4
+
+    # The receiving side sends the request id back with the result
+    obj.on_action_recv("double", callback=lambda value: value["x"] * 2, log_reception=False)
+    ws.receive("receive_action", {"id": "double", "value": {"x": 3}, "requestId": "abc"})
+    assert ws.sent[-1] == {"event": "action_done", "data": {"actionId": "double", "value": 6, "requestId": "abc"}}
+
+    pending = obj.send_action("other", "double", {"x": 2}, expect_result=True)
+    ws.drop()
+    assert isinstance(pending.exception(1), ConnectionError)
@@ -1,5 +1,65 @@
+import json
+from configparser import ConfigParser
+from types import SimpleNamespace
+
+import pytest
+
 from aliot import __version__
+from aliot.aliot_obj import AliotObj
 
 
 def test_version():
     assert __version__ == '0.2.3'
+
+
+def test_custom_event_handler(connect):
+    obj = AliotObj("test")
+    received = []
+
+    @obj.on_event("my_event")
+    def my_event(data):
+        received.append(data)
+
+    with pytest.raises(ValueError):
+        obj.on_event("ping", callback=print)
+
+    ws = connect(obj)
+    ws.receive("my_event", {"a": 1})
+    ws.receive("unknown_event")
+    assert received == [{"a": 1}]
+
+
+def test_get_fields_falls_back_to_the_document():
+    obj = AliotObj("test")
+    calls = []
+
+    def post(url, data=None, json=None, **kwargs):
+        calls.append(url.rsplit("/", 1)[-1])
+        if url.endswith("get_fields"):
+            return SimpleNamespace(status_code=404, text="")
+        return SimpleNamespace(status_code=201, text=document)
+
+    document = json.dumps({"doc": {"a": 1, "sensors": [{"value": 2}]}})
+    obj.http_session.post = post
+
+    assert obj.get_fields(["/doc/a", "/doc/sensors/0/value", "/doc/missing"]) == {
+        "/doc/a": 1,
+        "/doc/sensors/0/value": 2,
+        "/doc/missing": None,
+    }
+    assert obj.get_fields(["/doc/a"]) == {"/doc/a": 1}
+    # The server has no get_fields endpoint, it is only tried once
+    assert calls == ["get_fields", "get_doc", "get_doc"]
+
+
+def test_ping_timeout_must_be_smaller_than_the_interval():
+    config = ConfigParser()
+    config["obj"] = {"obj_id": "id", "auth_token": "token", "ping_interval": "5", "ping_timeout": "5"}
+    with pytest.raises(ValueError, match="must be smaller than its ping_interval"):
+        AliotObj("obj", config=config)
+
+    config["obj"]["ping_interval"] = "0"
+    AliotObj("obj", config=config)
+    config["obj"]["ping_timeout"] = "-1"
+    with pytest.raises(ValueError, match="must not be negative"):
+        AliotObj("obj", config=config)
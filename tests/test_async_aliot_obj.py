@@ -0,0 +1,228 @@
+import asyncio
+import json
+from configparser import ConfigParser
+
+import pytest
+
+websockets = pytest.importorskip("websockets")
+
+from aliot import hub
+from aliot.async_aliot_obj import AsyncAliotObj
+
+
+async def _serve(received: list):
+    """Minimal stand-in for the ALIVEcode iot gateway"""
+
+    async def handler(ws, *_):
+        async for message in ws:
+            msg = json.loads(message)
+            received.append(msg)
+            if msg["event"] == "connect_object":
+                await ws.send(json.dumps({"event": "connect_success", "data": None}))
+            elif msg["event"] == "subscribe_listener":
+                await ws.send(json.dumps({"event": "subscribe_listener_success", "data": None}))
+                await ws.send(json.dumps({"event": "ping", "data": None}))
+                await ws.send(json.dumps({"event": "receive_action", "data": {"id": "double", "value": 21}}))
+                await ws.send(json.dumps({"event": "receive_listen", "data": {"fields": {"/doc/a": 1, "/doc/b": 2}}}))
+            elif msg["event"] == "action_done":
+                await ws.close()
+
+    return await websockets.serve(handler, "127.0.0.1", 0)
+
+
+def test_async_obj_connects_and_dispatches():
+    received = []
+    listened = []
+
+    async def main():
+        server = await _serve(received)
+        port = server.sockets[0].getsockname()[1]
+
+        obj = AsyncAliotObj("test")
+        obj.ws_url = f"ws://127.0.0.1:{port}"
+
+        @obj.on_action_recv("double", log_reception=False)
+        async def double(value):
+            return value * 2
+
+        @obj.listen_doc(["/doc/a"])
+        def on_a(fields):
+            listened.append(fields)
+
+        await asyncio.wait_for(obj.arun(retry=False), 10)
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(main())
+
+    events = [msg["event"] for msg in received]
+    assert events[:2] == ["connect_object", "subscribe_listener"]
+    assert "pong" in events
+    assert {"event": "action_done", "data": {"actionId": "double", "value": 42}} in received
+    assert listened == [{"/doc/a": 1}]
+
+
+def test_hub_runs_many_objects_on_one_loop():
+    received = []
+    config = ConfigParser()
+    for i in range(20):
+        config[f"obj-{i}"] = {"obj_id": f"id-{i}", "auth_token": "token"}
+
+    async def main():
+        server = await _serve(received)
+        port = server.sockets[0].getsockname()[1]
+
+        aliot_hub = hub.AliotHub.from_config(config=config)
+        assert len(aliot_hub) == 20
+        for obj in aliot_hub.objects.values():
+            obj.ws_url = f"ws://127.0.0.1:{port}"
+
+        run = asyncio.get_running_loop().create_task(aliot_hub.arun(retry=False))
+        for _ in range(100):
+            await asyncio.sleep(0.05)
+            if all(state is hub.ConnectionState.CONNECTED for state in aliot_hub.states.values()):
+                break
+        assert set(aliot_hub.states.values()) == {hub.ConnectionState.CONNECTED}
+
+        await aliot_hub.stop()
+        await asyncio.wait_for(run, 10)
+        assert set(aliot_hub.states.values()) == {hub.ConnectionState.STOPPED}
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(main())
+
+    assert sorted(msg["data"]["id"] for msg in received if msg["event"] == "connect_object") == sorted(
+        f"id-{i}" for i in range(20)
+    )
+
+
+def test_codec_negotiation_switches_to_binary_frames():
+    msgpack = pytest.importorskip("msgpack")
+    config = ConfigParser()
+    config["obj"] = {"obj_id": "id", "auth_token": "token", "codecs": "msgpack"}
+    received = []
+
+    async def handler(ws, *_):
+        connect = json.loads(await ws.recv())
+        received.append(connect)
+        await ws.send(json.dumps({"event": "connect_success", "data": {"codec": "msgpack"}}))
+        await ws.send(msgpack.packb({"event": "receive_action", "data": {"id": "echo", "value": [1, 2]}}))
+        action_done = await ws.recv()
+        received.append(action_done)
+        await ws.close()
+
+    async def main():
+        server = await websockets.serve(handler, "127.0.0.1", 0)
+        obj = AsyncAliotObj("obj", config=config)
+        obj.ws_url = f"ws://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+        obj.on_action_recv("echo", callback=lambda value: value, log_reception=False)
+        await asyncio.wait_for(obj.arun(retry=False), 10)
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(main())
+
+    connect, action_done = received
+    assert connect["data"]["codecs"] == ["msgpack", "json"]
+    assert isinstance(action_done, bytes)
+    assert msgpack.unpackb(action_done) == {"event": "action_done", "data": {"actionId": "echo", "value": [1, 2]}}
+
+
+def test_send_action_awaits_its_result():
+    async def handler(ws, *_):
+        async for message in ws:
+            msg = json.loads(message)
+            if msg["event"] == "connect_object":
+                await ws.send(json.dumps({"event": "connect_success", "data": None}))
+            elif msg["event"] == "send_action":
+                # The gateway relays the action to the target, which answers with the request id
+                result = {"requestId": msg["data"]["requestId"], "value": msg["data"]["value"]["x"] * 2}
+                await ws.send(json.dumps({"event": "receive_action_done", "data": result}))
+
+    results = []
+
+    async def main():
+        server = await websockets.serve(handler, "127.0.0.1", 0)
+        obj = AsyncAliotObj("test")
+        obj.ws_url = f"ws://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+
+        @obj.on_start()
+        async def start():
+            futures = [await obj.send_action("other", "double", {"x": x}, expect_result=True) for x in range(5)]
+            results.extend(await asyncio.gather(*futures))
+            await obj.stop()
+
+        await asyncio.wait_for(obj.arun(retry=False), 10)
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(main())
+    assert results == [0, 2, 4, 6, 8]
+
+
+def test_stop_waits_for_the_events_being_sent():
+    config = ConfigParser()
+    config["obj"] = {"obj_id": "id", "auth_token": "token", "rate_limits": "send_broadcast:20/1"}
+    received = []
+
+    async def handler(ws, *_):
+        async for message in ws:
+            msg = json.loads(message)
+            received.append(msg)
+            if msg["event"] == "connect_object":
+                await ws.send(json.dumps({"event": "connect_success", "data": None}))
+
+    async def main():
+        server = await websockets.serve(handler, "127.0.0.1", 0)
+        obj = AsyncAliotObj("obj", config=config)
+        obj.ws_url = f"ws://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+
+        @obj.on_start()
+        async def start():
+            # The second and third broadcasts wait for their rate limit
+            for i in range(3):
+                asyncio.ensure_future(obj.send_broadcast({"i": i}))
+            await asyncio.sleep(0)
+            await obj.stop()
+
+        await asyncio.wait_for(obj.arun(retry=False), 10)
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(main())
+    assert [msg["data"]["data"]["i"] for msg in received if msg["event"] == "send_broadcast"] == [0, 1, 2]
+
+
+def test_hub_stop_ends_the_stagger():
+    config = ConfigParser()
+    for i in range(3):
+        # Nothing listens on the port, the objects wait before retrying
+        config[f"obj-{i}"] = {"obj_id": f"id-{i}", "auth_token": "token", "ws_url": "ws://127.0.0.1:9"}
+
+    async def main():
+        aliot_hub = hub.AliotHub.from_config(config=config, stagger=60)
+        run = asyncio.get_running_loop().create_task(aliot_hub.arun(retry_time=60))
+        await asyncio.sleep(0.2)
+        await aliot_hub.stop()
+        await asyncio.wait_for(run, 5)
+        return aliot_hub.states
+
+    states = asyncio.run(main())
+    assert states["obj-0"] is hub.ConnectionState.STOPPED
+    # Never started
+    assert states["obj-2"] is hub.ConnectionState.DISCONNECTED
+
+
+def test_stop_before_the_task_starts_is_kept():
+    config = ConfigParser()
+    config["obj"] = {"obj_id": "id", "auth_token": "token", "ws_url": "ws://127.0.0.1:9"}
+
+    async def main():
+        obj = AsyncAliotObj("obj", config=config)
+        run = asyncio.get_running_loop().create_task(obj.arun(retry_time=60))
+        await obj.stop()
+        await asyncio.wait_for(run, 5)
+        return obj
+
+    assert not asyncio.run(main()).connected
@@ -0,0 +1,51 @@
+from threading import Event, Thread
+from time import monotonic
+
+from aliot.aliot_obj import AliotObj
+from aliot.backoff import Backoff
+
+
+def test_delays_grow_up_to_the_cap_with_jitter():
+    low, high = Backoff(1, 10, rand=lambda: 0.0), Backoff(1, 10, rand=lambda: 1.0)
+    assert [low.next() for _ in range(6)] == [0.5, 1, 2, 4, 5, 5]
+    assert [high.next() for _ in range(6)] == [1, 2, 4, 8, 10, 10]
+
+    for _ in range(10_000):
+        high.next()
+    assert high.next() == 10
+
+
+def test_restart_is_fast_and_resets_the_attempts():
+    backoff = Backoff(2, 60, rand=lambda: 0.5)
+    for _ in range(5):
+        backoff.next()
+    assert backoff.restart() == 1
+    assert backoff.attempts == 0
+    assert backoff.next() == 1.5
+
+
+def test_stop_ends_the_wait_before_the_next_attempt():
+    attempts = []
+    tried = Event()
+
+    class RefusedApp:
+        def __init__(self, url, on_open=None, on_message=None, on_error=None, on_close=None):
+            self.on_close = on_close
+
+        def run_forever(self, **kwargs):
+            attempts.append(monotonic())
+            self.on_close(self, None, None)
+            tried.set()
+
+    obj = AliotObj("test")
+    obj._websocket_app = RefusedApp
+    runner = Thread(target=obj.run, kwargs={"retry_time": 60}, daemon=True)
+    runner.start()
+    assert tried.wait(5)
+
+    started = monotonic()
+    obj.stop()
+    runner.join(5)
+    assert not runner.is_alive()
+    assert monotonic() - started < 5
+    assert len(attempts) == 1
@@ -0,0 +1,41 @@
+import json
+
+import pytest
+
+from aliot.benchmarks.suite import compare, format_results, run_benchmarks, run_suite
+
+
+def test_benchmarks_run_and_report():
+    results = run_benchmarks(["send_event", "on_message", "execute_listen", "as_doc"], quick=True)
+    assert set(results["benchmarks"]) == {"send_event", "on_message", "execute_listen", "as_doc"}
+    assert all(result["best"] > 0 for result in results["benchmarks"].values())
+    assert "execute_listen" in format_results(results)
+
+    with pytest.raises(ValueError):
+        run_benchmarks(["unknown"])
+
+
+def test_compare_flags_the_regressions():
+    def results(**best):
+        return {"benchmarks": {name: {"unit": "us", "best": value} for name, value in best.items()}}
+
+    rows = compare(results(a=10.0, b=10.0, c=10.0), results(a=10.5, b=12.0, d=1.0), threshold=0.1)
+    assert [(row["name"], row["regression"]) for row in rows] == [("a", False), ("b", True)]
+    assert rows[1]["change"] == pytest.approx(0.2)
+
+
+def test_run_suite_exit_codes(tmp_path):
+    output = str(tmp_path / "results.json")
+    lines = []
+    assert run_suite(["as_doc"], quick=True, output=output, echo=lines.append) == 0
+    assert "as_doc" in lines[0]
+
+    with open(output, encoding="utf-8") as file:
+        results = json.load(file)
+    results["benchmarks"]["as_doc"]["best"] /= 1000
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(results, file)
+    assert run_suite(["as_doc"], quick=True, baseline=output, echo=lines.append) == 1
+    assert lines[-1] == "Slower than the baseline: as_doc"
+
+    assert run_suite(["unknown"], echo=lines.append) == 2
@@ -0,0 +1,37 @@
+from threading import Event
+
+from aliot.doc_batcher import DocBatcher
+
+
+def test_fields_are_merged_last_write_wins():
+    batches = []
+    batcher = DocBatcher(batches.append, window=60)
+    batcher.add({"/doc/temp": 1, "/doc/hum": 40})
+    batcher.add({"/doc/temp": 2})
+    batcher.add({"/doc/temp": 3, "/doc/light": True})
+    assert batches == []
+
+    batcher.flush()
+    assert batches == [{"/doc/temp": 3, "/doc/hum": 40, "/doc/light": True}]
+    assert batcher.merged == 3
+    assert batcher.flushed == 1
+
+
+def test_flushes_when_size_threshold_is_reached():
+    batches = []
+    batcher = DocBatcher(batches.append, window=60, max_fields=2)
+    batcher.add({"/doc/a": 1})
+    batcher.add({"/doc/a": 2})
+    assert batches == []
+    batcher.add({"/doc/b": 1})
+    assert batches == [{"/doc/a": 2, "/doc/b": 1}]
+    assert batcher.pending == {}
+
+
+def test_flushes_when_window_elapses():
+    flushed = Event()
+    batches = []
+    batcher = DocBatcher(lambda batch: (batches.append(batch), flushed.set()), window=0.01)
+    batcher.add({"/doc/a": 1})
+    assert flushed.wait(5)
+    assert batches == [{"/doc/a": 1}]
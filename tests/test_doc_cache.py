@@ -0,0 +1,45 @@
+import time
+
+from aliot.doc_cache import DocCache, MISSING
+
+
+def test_fields_expire_after_the_ttl():
+    cache = DocCache(0.05)
+    cache.put("/doc/a", 1)
+    assert cache.get("/doc/a") == 1
+    time.sleep(0.06)
+    assert cache.get("/doc/a") is MISSING
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_pushed_fields_never_expire_until_cleared():
+    cache = DocCache(0.01)
+    cache.put("/doc/a", 1, expires=False)
+    cache.update({"/doc/b": 2})
+    time.sleep(0.02)
+    assert cache.get("/doc/a") == 1 and cache.get("/doc/b") == 2
+
+    cache.invalidate("/doc/a")
+    assert "/doc/a" not in cache and "/doc/b" in cache
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_stale_replies_do_not_overwrite_newer_values():
+    cache = DocCache(60)
+    version = cache.version
+    # Pushed by the server while the get_doc request was in flight
+    cache.update({"/doc/a": 2})
+    assert not cache.put("/doc/a", 1, version=version)
+    assert cache.get("/doc/a") == 2
+
+    version = cache.version
+    cache.invalidate("/doc/b")
+    assert not cache.put("/doc/b", 1, version=version)
+    assert "/doc/b" not in cache
+
+    version = cache.version
+    cache.clear()
+    assert not cache.put("/doc/c", 1, version=version)
+    assert cache.put("/doc/c", 1, version=cache.version)
+    assert cache.get("/doc/c") == 1
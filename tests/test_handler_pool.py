@@ -0,0 +1,84 @@
+from threading import Event, Lock, current_thread
+from time import sleep
+
+from aliot.handler_pool import HandlerPool
+
+
+def square(value):
+    return value * value
+
+
+def test_handlers_of_a_key_run_in_order_one_at_a_time():
+    pool = HandlerPool(max_workers=8)
+    calls = []
+    running = []
+    lock = Lock()
+
+    def handler(i):
+        with lock:
+            running.append(i)
+            assert len(running) == 1
+        sleep(0.001)
+        calls.append(i)
+        with lock:
+            running.remove(i)
+
+    futures = [pool.submit("action", handler, i) for i in range(50)]
+    for future in futures:
+        future.result(5)
+    pool.shutdown()
+
+    assert calls == list(range(50))
+
+
+def test_concurrency_limit_allows_parallel_calls():
+    pool = HandlerPool(max_workers=4)
+    pool.set_limit("slow", 2)
+    both_started = Event()
+    started = []
+
+    def handler(i):
+        started.append(i)
+        if len(started) == 2:
+            both_started.set()
+        assert both_started.wait(5)
+
+    futures = [pool.submit("slow", handler, i) for i in range(2)]
+    for future in futures:
+        future.result(5)
+    pool.shutdown()
+
+
+def test_slow_key_does_not_block_other_keys():
+    pool = HandlerPool(max_workers=2)
+    release = Event()
+    slow = pool.submit("slow", release.wait, 5)
+    assert pool.submit("fast", square, 3).result(5) == 9
+    release.set()
+    assert slow.result(5)
+    pool.shutdown()
+
+
+def test_cpu_bound_handlers_run_in_processes():
+    pool = HandlerPool(max_workers=1, process_workers=1)
+    assert pool.submit("cpu", square, 12, cpu_bound=True).result(30) == 144
+    pool.shutdown()
+
+
+def test_a_key_is_drained_by_the_worker_running_it():
+    pool = HandlerPool(max_workers=4)
+    release = Event()
+    threads = []
+
+    def handler(i):
+        if i == 0:
+            assert release.wait(5)
+        threads.append(current_thread())
+
+    futures = [pool.submit("action", handler, i) for i in range(5)]
+    release.set()
+    for future in futures:
+        future.result(5)
+    pool.shutdown()
+
+    assert len(set(threads)) == 1
@@ -0,0 +1,103 @@
+import json
+import threading
+from configparser import ConfigParser
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, ReadTimeoutError
+
+from aliot.aliot_obj import AliotObj
+from aliot.http_session import HttpSession
+
+
+class RecordingAdapter(HTTPAdapter):
+    def __init__(self):
+        super().__init__()
+        self.timeouts = []
+
+    def send(self, request, **kwargs):
+        self.timeouts.append(kwargs["timeout"])
+        response = requests.Response()
+        response.status_code = 200
+        response.request = request
+        return response
+
+
+def test_mounted_adapter_retries():
+    session = HttpSession(pool_size=4, retries=5, backoff=0.25)
+    retry = session.get_adapter("https://alivecode.ca/api").max_retries
+
+    assert session.get_adapter("http://localhost") is session.get_adapter("https://alivecode.ca")
+    assert (retry.total, retry.backoff_factor) == (5, 0.25)
+    assert retry.is_retry("GET", 503)
+    assert not retry.is_retry("GET", 500)
+    # A POST the server answered is never sent again
+    assert not retry.is_retry("POST", 503)
+    with pytest.raises(ReadTimeoutError):
+        retry.increment("POST", "/api", error=ReadTimeoutError(None, "/api", "read timed out"))
+    # It is retried if it could not reach the server
+    assert retry.increment("POST", "/api", error=ConnectTimeoutError()).total == 4
+
+
+def test_timeout_is_applied_unless_given():
+    session = HttpSession(timeout=3.0)
+    adapter = RecordingAdapter()
+    session.mount("https://", adapter)
+
+    session.post("https://alivecode.ca/api")
+    session.post("https://alivecode.ca/api", timeout=30)
+
+    assert adapter.timeouts == [3.0, 30]
+
+
+@pytest.fixture
+def api():
+    """Local api answering the requests with the statuses of `api.statuses`, in order"""
+    paths = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            paths.append(self.path)
+            status = server.statuses.pop(0)
+            body = json.dumps({"a": 1}).encode() if status == 201 else b""
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    server.statuses = []
+    server.paths = paths
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _obj(api) -> AliotObj:
+    config = ConfigParser()
+    config["obj"] = {
+        "obj_id": "id",
+        "auth_token": "token",
+        "api_url": f"http://127.0.0.1:{api.server_port}",
+        "http_backoff": "0",
+    }
+    return AliotObj("obj", config=config)
+
+
+def test_reads_are_retried_on_503(api):
+    api.statuses = [503, 503, 201]
+    assert _obj(api).get_doc() == {"a": 1}
+    assert api.paths == ["/iot/aliot/get_doc"] * 3
+
+
+def test_uploads_are_not_retried_on_503(api):
+    api.statuses = [503]
+    assert _obj(api).upload_image(b"image").status_code == 503
+    assert api.paths == ["/iot/aliot/upload_image"]
@@ -0,0 +1,74 @@
+import io
+import threading
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import requests
+
+from aliot.image_upload import ImageUploader, MultipartStream
+
+
+def parse(stream: MultipartStream, body: bytes):
+    message = BytesParser().parsebytes(b"Content-Type: " + stream.content_type.encode() + b"\r\n\r\n" + body)
+    return {part.get_param("name", header="content-disposition"): part for part in message.get_payload()}
+
+
+def test_stream_from_memoryview_and_file():
+    image = bytes(range(256)) * 1000
+    for body in (memoryview(image), io.BytesIO(image)):
+        stream = MultipartStream({"id": "obj"}, "file", "frame.png", "image/png", body, chunk_size=4096)
+        data = b"".join(stream)
+        assert len(data) == len(stream)
+        # The stream can be sent again, when a request is retried
+        assert b"".join(stream) == data
+
+        parts = parse(stream, data)
+        assert parts["id"].get_payload() == "obj"
+        assert parts["file"].get_filename() == "frame.png"
+        assert parts["file"].get_content_type() == "image/png"
+        assert parts["file"].get_payload(decode=True) == image
+
+
+def test_stream_is_sent_with_a_content_length():
+    received = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            received["length"] = int(self.headers["Content-Length"])
+            received["body"] = self.rfile.read(received["length"])
+            self.send_response(201)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.handle_request, daemon=True).start()
+    stream = MultipartStream({"id": "obj"}, "file", "image.jpg", "image/jpeg", memoryview(b"\xff\xd8" * 100_000))
+    res = requests.post(
+        f"http://127.0.0.1:{server.server_port}/", data=stream, headers={"Content-Type": stream.content_type}
+    )
+    server.server_close()
+
+    assert res.status_code == 201
+    assert received["length"] == len(stream)
+    assert received["body"] == b"".join(stream)
+
+
+def test_stale_images_are_dropped():
+    release = threading.Event()
+    uploaded = []
+
+    def upload(body, filename, content_type):
+        release.wait(1)
+        uploaded.append(filename)
+        return filename
+
+    uploader = ImageUploader(upload, maxsize=1)
+    futures = [uploader.submit(b"", f"{i}.jpg", "image/jpeg") for i in range(5)]
+    release.set()
+
+    assert futures[-1].result(1) == "4.jpg"
+    assert sum(future.cancelled() for future in futures) == uploader.dropped
+    assert uploaded[-1] == "4.jpg" and len(uploaded) + uploader.dropped == 5
+    uploader.stop(wait=True)
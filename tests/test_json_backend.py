@@ -0,0 +1,54 @@
+import datetime
+import json
+from dataclasses import dataclass
+
+import pytest
+
+from aliot.json_backend import PREFERRED_BACKENDS, get_json_backend, is_available
+
+
+@dataclass
+class Point:
+    x: int
+    y: int
+
+
+VALUE = {
+    "event": "update_doc",
+    "data": {
+        "fields": {
+            "/doc/temp": 21.5,
+            "/doc/when": datetime.datetime(2022, 5, 4, 12, 30),
+            "/doc/point": Point(1, 2),
+            "/doc/big": 2 ** 70,
+            "/doc/name": "Hélène",
+            "/doc/list": [1, None, True],
+        },
+        1: "non str key",
+    },
+}
+
+
+@pytest.mark.parametrize("name", [name for name in PREFERRED_BACKENDS if is_available(name)])
+def test_backends_match_the_standard_library(name):
+    backend = get_json_backend(name)
+    expected = json.loads(json.dumps(VALUE, default=str))
+
+    assert json.loads(backend.dumps(VALUE)) == expected
+    assert json.loads(backend.dumps_bytes(VALUE)) == expected
+    assert backend.loads(json.dumps(expected).encode()) == expected
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        get_json_backend("yaml")
+
+
+@pytest.mark.parametrize("name", [name for name in PREFERRED_BACKENDS if is_available(name)])
+def test_non_finite_floats(name):
+    backend = get_json_backend(name)
+    value = [float("nan"), float("inf"), float("-inf")]
+
+    assert backend.dumps(value).replace(" ", "") == "[NaN,Infinity,-Infinity]"
+    expected = b'{"a":[NaN,Infinity,-Infinity],"b":null}'
+    assert backend.dumps_bytes({"a": value, "b": None}).replace(b" ", b"") == expected
@@ -0,0 +1,31 @@
+from aliot.listener_index import ListenerIndex
+
+
+def test_exact_and_wildcard_routing():
+    index = ListenerIndex()
+    temp = index.add(["/doc/temp"], print)
+    sensors = index.add(["/doc/sensors/*"], print)
+    everything = index.add(["/*"], print)
+
+    matched = index.match({"/doc/temp": 20, "/doc/sensors/a": 1, "/doc/sensors/b/c": 2, "/doc/other": 3})
+
+    assert matched == [
+        (temp, {"/doc/temp": 20}),
+        (sensors, {"/doc/sensors/a": 1, "/doc/sensors/b/c": 2}),
+        (everything, {"/doc/temp": 20, "/doc/sensors/a": 1, "/doc/sensors/b/c": 2, "/doc/other": 3}),
+    ]
+    assert index.fields == ["/*", "/doc/sensors/*", "/doc/temp"]
+
+
+def test_uninterested_listeners_are_skipped_and_removed():
+    index = ListenerIndex()
+    a = index.add(["/doc/a"], print)
+    b = index.add(["/doc/b", "/doc/a"], print)
+
+    assert index.match({"/doc/c": 1}) == []
+    assert index.match({"/doc/b": 1}) == [(b, {"/doc/b": 1})]
+
+    index.remove(b)
+    assert index.match({"/doc/a": 1, "/doc/b": 2}) == [(a, {"/doc/a": 1})]
+    assert index.fields == ["/doc/a"]
+    assert len(index) == 1
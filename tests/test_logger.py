@@ -0,0 +1,87 @@
+import logging
+
+import pytest
+
+import aliot.logger
+from aliot.aliot_obj import AliotObj
+from aliot.logger import SampleFilter, configure_logging, frames_logger, log_err, log_fail, logger
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class CountedRepr:
+    calls = 0
+
+    def __repr__(self):
+        CountedRepr.calls += 1
+        return "counted"
+
+
+@pytest.fixture
+def handler():
+    level, frames_level = logger.level, frames_logger.level
+    handler = ListHandler()
+    yield handler
+    configure_logging(level, handler=logging.NullHandler())
+    frames_logger.setLevel(frames_level)
+
+
+def test_records_are_formatted_only_when_emitted(handler):
+    configure_logging(logging.INFO, handler=handler)
+    frames_logger.debug("[Sending] %r", CountedRepr())
+    assert CountedRepr.calls == 0 and handler.records == []
+
+    log_fail(title="Connection closed")
+    assert handler.records[0].aliot_kind == "failure"
+    assert handler.records[0].aliot_title == "Connection closed"
+
+
+def test_high_rate_loggers_are_sampled(handler):
+    configure_logging(logging.DEBUG, handler=handler, sample_every=10)
+    for i in range(25):
+        frames_logger.debug("[Sending] %r", i)
+        logger.info("Not sampled %d", i)
+    assert [record.args for record in handler.records if record.name == "aliot.frames"] == [(0,), (10,), (20,)]
+    assert sum(record.name == "aliot" for record in handler.records) == 25
+
+    configure_logging(logging.DEBUG, handler=handler)
+    assert not any(isinstance(f, SampleFilter) for f in frames_logger.filters)
+
+
+def test_queue_handler_emits_from_a_background_thread(handler):
+    configure_logging(logging.INFO, handler=handler, queue=True)
+    logger.info("queued")
+    # Configuring again stops the listener once it has emitted the queued records
+    configure_logging(logging.INFO, handler=logging.NullHandler())
+    assert [record.getMessage() for record in handler.records] == ["queued"]
+
+
+def test_objects_leave_the_output_to_the_application(monkeypatch):
+    monkeypatch.setattr(logger, "propagate", True)
+    handlers = [h for h in logger.handlers if isinstance(h, aliot.logger._FallbackHandler)]
+    monkeypatch.setattr(logger, "handlers", list(handlers))
+    AliotObj("test")
+
+    assert logger.propagate
+    assert handlers and logger.handlers == handlers
+
+
+def test_records_are_printed_until_the_application_configures_logging(monkeypatch, capsys):
+    monkeypatch.setattr(aliot.logger, "_handler", None)
+    monkeypatch.setattr(logging.getLogger(), "handlers", [])
+    monkeypatch.setattr(frames_logger, "level", logging.DEBUG)
+    log_err("Forbidden. Invalid credentials.")
+    frames_logger.debug("[Sending] %r", "frame")
+    out = capsys.readouterr().out
+    assert "Forbidden. Invalid credentials." in out and "[Sending] 'frame'" in out
+
+    monkeypatch.setattr(logging.getLogger(), "handlers", [logging.NullHandler()])
+    log_err("Forbidden. Invalid credentials.")
+    assert capsys.readouterr().out == ""
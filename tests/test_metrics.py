@@ -0,0 +1,89 @@
+import time
+import urllib.request
+from configparser import ConfigParser
+
+from aliot import aliot_obj
+from aliot.metrics import REGISTRY, MetricsRegistry
+
+
+def test_prometheus_text_and_http_endpoint():
+    registry = MetricsRegistry()
+    registry.counter("sent_total", "Messages sent", ("event",)).labels("update_doc").inc(3)
+    registry.gauge("depth", "Queue depth").labels().set_function(lambda: 7)
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0)).labels()
+    latency.observe(0.05)
+    latency.observe(0.5)
+
+    assert registry.get("sent_total", event="update_doc") == 3
+    assert registry.get("latency_seconds")["buckets"] == {0.1: 1, 1.0: 2, float("inf"): 2}
+
+    text = registry.to_prometheus()
+    assert 'sent_total{event="update_doc"} 3' in text
+    assert "depth 7" in text
+    assert 'latency_seconds_bucket{le="+Inf"} 2' in text
+    assert "latency_seconds_sum 0.55" in text
+
+    server = registry.serve(0)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_port}/metrics") as res:
+            assert res.read().decode() == registry.to_prometheus()
+    finally:
+        server.shutdown()
+
+
+def test_obj_records_its_messages(connect):
+    config = ConfigParser()
+    config.read_dict({"metrics-obj": {"obj_id": "id", "auth_token": "token", "metrics": "true"}})
+
+    obj = aliot_obj.AliotObj("metrics-obj", config=config)
+    obj.on_action_recv("double", callback=lambda value: value * 2, log_reception=False)
+    ws = connect(obj)
+    ws.receive("receive_action", {"id": "double", "value": 2})
+
+    assert REGISTRY.get("aliot_messages_received_total", object="metrics-obj", event="receive_action") == 1
+    assert REGISTRY.get("aliot_messages_sent_total", object="metrics-obj", event="action_done") == 1
+    assert REGISTRY.get("aliot_handler_seconds", object="metrics-obj", handler="action:double")["count"] == 1
+    # connect_object and action_done
+    assert REGISTRY.get("aliot_encode_seconds", object="metrics-obj")["count"] == 2
+
+
+def test_non_finite_values_use_the_prometheus_spelling():
+    registry = MetricsRegistry()
+    registry.gauge("up", "Up").labels().set_function(lambda: float("inf"))
+    registry.gauge("down", "Down").labels().set_function(lambda: float("-inf"))
+    registry.histogram("latency_seconds", "Latency", buckets=(1.0, float("inf"))).labels().observe(2.0)
+
+    text = registry.to_prometheus()
+    assert "up +Inf" in text and "down -Inf" in text
+    assert 'latency_seconds_bucket{le="+Inf"} 1' in text
+    assert "inf" not in text.replace("+Inf", "").replace("-Inf", "")
+
+
+def test_messages_are_counted_once_written(connect):
+    config = ConfigParser()
+    config.read_dict(
+        {
+            "limited-obj": {
+                "obj_id": "id",
+                "auth_token": "token",
+                "metrics": "true",
+                "send_queue_size": "10",
+                "rate_limits": "send_broadcast:0.01",
+            }
+        }
+    )
+
+    obj = aliot_obj.AliotObj("limited-obj", config=config)
+    ws = connect(obj)
+    # The second broadcast waits for its rate limit
+    obj.send_broadcast({"i": 1})
+    obj.send_broadcast({"i": 2})
+    for _ in range(100):
+        if ws.events:
+            break
+        time.sleep(0.01)
+
+    assert len(ws.events) == 1
+    assert REGISTRY.get("aliot_messages_sent_total", object="limited-obj", event="send_broadcast") == 1
+    ws.drop()
+    obj.stop()
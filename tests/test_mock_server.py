@@ -0,0 +1,76 @@
+from configparser import ConfigParser
+from threading import Event, Thread
+
+import pytest
+
+pytest.importorskip("websockets")
+
+from aliot.aliot_obj import AliotObj
+from aliot.benchmarks.load import load_test
+from aliot.mock_server import MockAliveServer
+
+
+def _make_obj(server: MockAliveServer, name: str) -> AliotObj:
+    config = ConfigParser()
+    config["DEFAULT"] = {"ws_url": server.ws_url, "api_url": server.api_url, "http_retries": "0"}
+    # The receive thread only notices that the object stopped once its select times out
+    config["DEFAULT"].update({"ping_interval": "1", "ping_timeout": "0.2"})
+    config[name] = {"obj_id": f"{name}-id", "auth_token": "token"}
+    return AliotObj(name, config=config)
+
+
+def _run(obj: AliotObj) -> Thread:
+    thread = Thread(target=obj.run, kwargs={"retry_time": 0.05}, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_sync_obj_against_the_mock_server():
+    with MockAliveServer(document={"doc": {"a": 1}}) as server:
+        obj = _make_obj(server, "mock")
+        listened, doubled = [], Event()
+
+        @obj.listen_doc(["/doc/sensors/*"])
+        def on_sensors(fields):
+            listened.append(fields)
+
+        @obj.on_action_recv("double", log_reception=False)
+        def double(value):
+            doubled.set()
+            return value * 2
+
+        thread = _run(obj)
+        assert server.wait_for("subscribe_listener")
+        assert server.connected_objects == ["mock-id"]
+
+        obj.update_doc({"/doc/sensors/temp": 21, "/doc/b": 2})
+        assert server.wait_for("update_doc")
+        assert server.document == {"doc": {"a": 1, "b": 2, "sensors": {"temp": 21}}}
+
+        server.send_action("mock-id", "double", 21, request_id="r1")
+        assert server.wait_for("action_done") and doubled.is_set()
+        assert server.received("action_done")[0]["data"] == {"actionId": "double", "value": 42, "requestId": "r1"}
+
+        assert obj.get_doc("/doc/a") == 1
+        assert obj.get_fields(["/doc/a", "/doc/sensors/temp"]) == {"/doc/a": 1, "/doc/sensors/temp": 21}
+        assert obj.upload_image(b"\xff\xd8 jpeg", "frame.jpg").ok
+        assert server.images[0].data == b"\xff\xd8 jpeg" and server.images[0].object_id == "mock-id"
+
+        # A restart of the server: the object reconnects and resumes its session
+        server.disconnect()
+        assert server.wait_for("connect_object", 2)
+        assert server.received("connect_object")[1]["data"]["resume"]["fields"] == ["/doc/sensors/*"]
+        assert server.counts["subscribe_listener"] == 1
+
+        server.update_doc({"/doc/sensors/light": True})
+        obj.stop()
+        thread.join(5)
+
+    assert {"/doc/sensors/temp": 21} in listened
+
+
+def test_load_generator_round_trips_updates():
+    result = load_test(objects=20, rate=20, duration=0.5)
+    assert result.connected == 20
+    assert result.sent > 0 and result.received == result.sent
+    assert result.as_dict()["latency"]["p50"] is not None
@@ -0,0 +1,124 @@
+import time
+from configparser import ConfigParser
+
+from aliot.aliot_obj import AliotObj
+from aliot.offline_outbox import OfflineOutbox
+
+
+def test_fields_are_compacted_and_events_kept_in_order(tmp_path):
+    outbox = OfflineOutbox(str(tmp_path / "outbox.db"))
+    outbox.append("update_doc", {"fields": {"/doc/a": 1, "/doc/b": 1}})
+    outbox.append("update_doc", {"fields": {"/doc/a": 2}})
+    outbox.append("send_broadcast", {"data": {"hello": "world"}})
+    outbox.append("update_doc", {"fields": {"/doc/a": 3, "/doc/c": 1}})
+    assert len(outbox) == 4
+
+    assert outbox.drain() == [
+        ("update_doc", {"fields": {"/doc/b": 1}}),
+        ("send_broadcast", {"data": {"hello": "world"}}),
+        ("update_doc", {"fields": {"/doc/a": 3, "/doc/c": 1}}),
+    ]
+    assert len(outbox) == 0
+
+
+def test_outbox_survives_a_restart(tmp_path):
+    path = str(tmp_path / "outbox.db")
+    outbox = OfflineOutbox(path)
+    outbox.append("send_route", {"routePath": "/a", "data": {}})
+    outbox.close()
+
+    assert OfflineOutbox(path).drain() == [("send_route", {"routePath": "/a", "data": {}})]
+
+
+def test_outbox_is_bounded():
+    outbox = OfflineOutbox(":memory:", max_events=3)
+    for i in range(5):
+        outbox.append("send_broadcast", {"data": i})
+
+    assert [data["data"] for _, data in outbox.drain()] == [2, 3, 4]
+    assert outbox.dropped == 2
+
+
+def test_old_events_expire():
+    outbox = OfflineOutbox(":memory:", retention=-1)
+    outbox.append("send_broadcast", {"data": 1})
+    assert outbox.drain() == []
+
+
+def test_restored_events_go_before_the_newer_ones():
+    outbox = OfflineOutbox(":memory:")
+    outbox.append("update_doc", {"fields": {"/doc/a": 2}})
+    outbox.append("send_broadcast", {"data": 2})
+
+    outbox.restore([("update_doc", {"fields": {"/doc/a": 1, "/doc/b": 1}}), ("send_broadcast", {"data": 1})])
+
+    assert outbox.drain() == [
+        ("update_doc", {"fields": {"/doc/b": 1}}),
+        ("send_broadcast", {"data": 1}),
+        ("update_doc", {"fields": {"/doc/a": 2}}),
+        ("send_broadcast", {"data": 2}),
+    ]
+
+
+def _config(tmp_path, **options) -> ConfigParser:
+    config = ConfigParser()
+    config["obj"] = {
+        "obj_id": "id",
+        "auth_token": "token",
+        "offline_outbox": str(tmp_path / "outbox.db"),
+        **options,
+    }
+    return config
+
+
+def test_events_sent_before_the_replay_are_not_overwritten(tmp_path, connect):
+    obj = AliotObj("obj", config=_config(tmp_path))
+    obj.update_doc({"/doc/a": 1, "/doc/b": 1})
+
+    ws = connect(obj)
+    # Connected, but not accepted by the server yet
+    obj.update_doc({"/doc/a": 2})
+    assert ws.events == []
+
+    ws.receive("connect_success")
+    obj.update_doc({"/doc/a": 3})
+    assert ws.events == [
+        {"event": "update_doc", "data": {"fields": {"/doc/b": 1, "/doc/a": 2}}},
+        {"event": "update_doc", "data": {"fields": {"/doc/a": 3}}},
+    ]
+
+
+def test_queued_events_go_back_to_the_outbox_when_the_connection_closes(tmp_path, connect):
+    # The second update_doc waits for its rate limit in the send queue
+    obj = AliotObj("obj", config=_config(tmp_path, send_queue_size="10", rate_limits="update_doc:0.01"))
+    obj.update_doc({"/doc/a": 1})
+    ws = connect(obj)
+    ws.receive("connect_success")
+    obj.update_doc({"/doc/b": 1})
+    for _ in range(100):
+        if ws.events:
+            break
+        time.sleep(0.01)
+
+    ws.drop()
+    obj.update_doc({"/doc/b": 2, "/doc/c": 1})
+
+    assert ws.events == [{"event": "update_doc", "data": {"fields": {"/doc/a": 1}}}]
+    assert obj._offline_outbox.drain() == [("update_doc", {"fields": {"/doc/b": 2, "/doc/c": 1}})]
+    obj.stop()
+
+
+def test_replayed_events_wait_for_room_in_the_send_queue(tmp_path, connect):
+    obj = AliotObj("obj", config=_config(tmp_path, send_queue_size="2", send_queue_policy="drop_newest"))
+    for i in range(6):
+        obj.send_broadcast({"i": i})
+    ws = connect(obj)
+    ws.receive("connect_success")
+    for _ in range(100):
+        if len(ws.events) == 6:
+            break
+        time.sleep(0.01)
+
+    assert [msg["data"]["data"] for msg in ws.events] == [{"i": i} for i in range(6)]
+    assert len(obj._offline_outbox) == 0
+    obj.stop()
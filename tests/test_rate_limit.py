@@ -0,0 +1,41 @@
+import pytest
+
+from aliot.rate_limit import TokenBucket, parse_rate_limits
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_allows_bursts_then_the_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=10, burst=2, clock=clock)
+    assert bucket.try_acquire() and bucket.try_acquire()
+    assert not bucket.try_acquire()
+    assert bucket.delay() == pytest.approx(0.1)
+
+    clock.now = 0.1
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+
+    clock.now = 10.0
+    assert bucket.delay() == 0.0
+
+
+def test_reserve_spaces_the_events_by_the_rate():
+    bucket = TokenBucket(rate=10, burst=1, clock=FakeClock())
+    assert [bucket.reserve() for _ in range(3)] == pytest.approx([0.0, 0.1, 0.2])
+
+
+def test_parse_rate_limits():
+    limits = parse_rate_limits("update_doc:20/5, send_broadcast:2")
+    assert (limits["update_doc"].rate, limits["update_doc"].burst) == (20, 5)
+    assert (limits["send_broadcast"].rate, limits["send_broadcast"].burst) == (2, 2)
+    assert parse_rate_limits("") == {}
+
+    with pytest.raises(ValueError):
+        parse_rate_limits("update_doc")
@@ -0,0 +1,165 @@
+from configparser import ConfigParser
+from threading import Event
+from time import sleep
+
+import pytest
+
+from aliot.aliot_obj import AliotObj
+from aliot.rate_limit import TokenBucket
+from aliot.send_queue import SendQueue, BackPressurePolicy, Priority
+
+
+def test_writer_thread_sends_in_order():
+    sent = []
+    done = Event()
+
+    def send(item):
+        sent.append(item)
+        if len(sent) == 100:
+            done.set()
+
+    queue = SendQueue(maxsize=10)
+    queue.start(send)
+    for i in range(100):
+        assert queue.put(i)
+    assert done.wait(5)
+    queue.stop()
+
+    assert sent == list(range(100))
+    assert queue.metrics.sent == 100
+    assert queue.metrics.dropped == 0
+
+
+def test_drop_oldest_keeps_latest_items():
+    queue = SendQueue(maxsize=3, policy=BackPressurePolicy.DROP_OLDEST)
+    for i in range(5):
+        assert queue.put(i)
+
+    sent = []
+    done = Event()
+    queue.start(lambda item: (sent.append(item), len(sent) == 3 and done.set()))
+    assert done.wait(5)
+    queue.stop()
+
+    assert sent == [2, 3, 4]
+    assert queue.metrics.dropped == 2
+    assert queue.metrics.max_depth == 3
+
+
+def test_drop_newest_rejects_items_when_full():
+    queue = SendQueue(maxsize=2, policy=BackPressurePolicy.DROP_NEWEST)
+    assert queue.put("a")
+    assert queue.put("b")
+    assert not queue.put("c")
+    assert queue.depth == 2
+    assert queue.metrics.dropped == 1
+
+
+def test_block_times_out_when_full():
+    queue = SendQueue(maxsize=1, policy=BackPressurePolicy.BLOCK, block_timeout=0.05)
+    assert queue.put("a")
+    assert not queue.put("b")
+    assert queue.metrics.dropped == 1
+
+
+def test_writer_sends_the_most_urgent_lane_first():
+    queue = SendQueue(maxsize=10)
+    for i in range(3):
+        queue.put(f"doc-{i}", Priority.BULK)
+    queue.put("result", Priority.RESULT)
+    queue.put("pong", Priority.CONTROL)
+
+    sent = []
+    done = Event()
+    queue.start(lambda item: (sent.append(item), len(sent) == 5 and done.set()))
+    assert done.wait(5)
+    queue.stop()
+
+    assert sent == ["pong", "result", "doc-0", "doc-1", "doc-2"]
+
+
+def test_full_queue_drops_less_urgent_items_first():
+    queue = SendQueue(maxsize=2, policy=BackPressurePolicy.DROP_NEWEST)
+    assert queue.put("doc-0")
+    assert queue.put("doc-1")
+    assert queue.put("pong", Priority.CONTROL)
+    assert not queue.put("doc-2")
+    assert queue.depth == 2
+    assert queue.metrics.dropped == 2
+
+
+def test_rate_limited_events_do_not_hold_back_the_other_lanes():
+    queue = SendQueue(maxsize=100, rate_limits={"update_doc": TokenBucket(rate=5, burst=1)})
+    for i in range(3):
+        queue.put(f"doc-{i}", Priority.BULK, "update_doc")
+
+    sent = []
+    done = Event()
+    queue.start(lambda item: (sent.append(item), len(sent) == 4 and done.set()))
+    sleep(0.01)
+    queue.put("pong", Priority.CONTROL, "pong")
+    assert done.wait(5)
+    queue.stop()
+
+    assert sent == ["doc-0", "pong", "doc-1", "doc-2"]
+    assert queue.metrics.throttled > 0
+
+
+def test_join_waits_for_the_pending_items():
+    queue = SendQueue(maxsize=100, rate_limits={"update_doc": TokenBucket(rate=20, burst=1)})
+    sent = []
+    queue.start(sent.append)
+    for i in range(3):
+        queue.put(i, Priority.BULK, "update_doc")
+
+    assert queue.join(5)
+    assert sent == [0, 1, 2]
+    queue.put(3, Priority.BULK, "update_doc")
+    queue.put(4, Priority.BULK, "update_doc")
+    assert not queue.join(0)
+    queue.stop()
+
+
+def test_stop_sends_the_last_batch(connect):
+    config = ConfigParser()
+    config["obj"] = {
+        "obj_id": "id",
+        "auth_token": "token",
+        "send_queue_size": "10",
+        "update_doc_batch_window": "60",
+        "rate_limits": "update_doc:20/1",
+    }
+    obj = AliotObj("obj", config=config)
+    ws = connect(obj)
+    ws.receive("connect_success")
+    obj.update_doc({"/doc/a": 1})
+    obj.flush_doc()
+    obj.update_doc({"/doc/a": 2})
+
+    obj.stop()
+    assert ws.events == [
+        {"event": "update_doc", "data": {"fields": {"/doc/a": 1}}},
+        {"event": "update_doc", "data": {"fields": {"/doc/a": 2}}},
+    ]
+
+
+def test_rate_limited_event_does_not_hold_back_its_lane():
+    queue = SendQueue(maxsize=100, rate_limits={"update_doc": TokenBucket(rate=5, burst=1)})
+    queue.put("doc-0", Priority.BULK, "update_doc")
+    queue.put("doc-1", Priority.BULK, "update_doc")
+    queue.put("broadcast", Priority.BULK, "send_broadcast")
+
+    sent = []
+    done = Event()
+    queue.start(lambda item: (sent.append(item), len(sent) == 3 and done.set()))
+    assert done.wait(5)
+    queue.stop()
+
+    assert sent == ["doc-0", "broadcast", "doc-1"]
+
+
+def test_rate_limits_require_a_send_queue():
+    config = ConfigParser()
+    config["obj"] = {"obj_id": "id", "auth_token": "token", "rate_limits": "update_doc:20"}
+    with pytest.raises(ValueError, match="send_queue_size"):
+        AliotObj("obj", config=config)
@@ -0,0 +1,70 @@
+import time
+
+from aliot.aliot_obj import AliotObj
+from aliot.session import OnStartPolicy, Session
+
+
+def test_resumed_session_only_sends_the_changed_subscriptions():
+    session = Session()
+    assert session.resume_hint() is None
+    assert not session.accept({"sessionId": "abc"})
+    assert session.update_subscriptions(["/doc/a", "/doc/b"]) == (["/doc/a", "/doc/b"], [])
+
+    assert session.resume_hint() == {"sessionId": "abc", "fields": ["/doc/a", "/doc/b"]}
+    assert session.accept({"resumed": True})
+    assert session.update_subscriptions(["/doc/b", "/doc/c"]) == (["/doc/c"], ["/doc/a"])
+
+    # The server forgot the session: every field is subscribed again
+    assert not session.accept(None)
+    assert session.update_subscriptions(["/doc/b", "/doc/c"]) == (["/doc/b", "/doc/c"], [])
+
+
+def test_on_start_policies():
+    for policy, expected in (
+        (OnStartPolicy.ALWAYS, [True, True, True]),
+        (OnStartPolicy.IF_STOPPED, [True, False, True]),
+        (OnStartPolicy.NEVER, [True, False, False]),
+    ):
+        session = Session(policy)
+        assert [session.should_run_on_start(running) for running in (False, True, False)] == expected
+
+
+def test_reconnection_resumes_the_subscriptions(connect):
+    obj = AliotObj("test")
+    obj.listen_doc(["/doc/a"], callback=lambda fields: None)
+
+    ws = connect(obj)
+    ws.receive("connect_success", {"sessionId": "abc"})
+    assert ws.events == [{"event": "subscribe_listener", "data": {"fields": ["/doc/a"]}}]
+    ws.receive("subscribe_listener_success")
+    assert obj.connected_to_alivecode
+
+    # A listener added at runtime only sends its own fields
+    obj.listen_doc(["/doc/b"], callback=lambda fields: None)
+    time.sleep(0.2)
+    assert ws.sent[-1] == {"event": "subscribe_listener", "data": {"fields": ["/doc/b"]}}
+
+    ws.drop(1001)
+    ws = connect(obj)
+    assert ws.sent[0]["data"]["resume"] == {"sessionId": "abc", "fields": ["/doc/a", "/doc/b"]}
+    ws.receive("connect_success", {"resumed": True})
+    assert obj.connected_to_alivecode
+    assert ws.events == []
+
+
+def test_runtime_subscriptions_are_coalesced(connect):
+    obj = AliotObj("test")
+    ws = connect(obj)
+    ws.receive("connect_success")
+    assert obj.connected_to_alivecode
+
+    a = obj.subscribe(["/doc/a"], lambda fields: None)
+    b = obj.subscribe(["/doc/b"], lambda fields: None)
+    b.unsubscribe()
+    time.sleep(0.2)
+    assert ws.events == [{"event": "subscribe_listener", "data": {"fields": ["/doc/a"]}}]
+
+    assert a.unsubscribe() and not a.unsubscribe()
+    time.sleep(0.2)
+    assert ws.sent[-1] == {"event": "unsubscribe_listener", "data": {"fields": ["/doc/a"]}}
+    assert obj.listeners == []
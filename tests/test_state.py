@@ -0,0 +1,147 @@
+from dataclasses import dataclass, field
+
+import pytest
+
+from aliot.aliot_obj import AliotObj
+from aliot.codecs import available_codecs, get_codec
+from aliot.state import AliotObjState
+
+
+@dataclass
+class Motor(AliotObjState):
+    speed: int = 0
+    direction: str = "forward"
+
+
+@dataclass
+class Car(AliotObjState):
+    name: str = "car"
+    battery: float = 100.0
+    motor: Motor = field(default_factory=Motor)
+    secret: str = field(default="", metadata={"as_doc": False})
+
+
+def test_first_sync_sends_every_field():
+    car = Car()
+    assert car.as_doc_changes() == car.as_doc()
+    assert car.as_doc_changes() == {}
+
+
+@dataclass(frozen=True)
+class Reading(AliotObjState):
+    value: int = 1
+
+
+def test_first_sync_of_a_frozen_state_sends_every_field():
+    reading = Reading()
+    assert reading.as_doc_changes() == {"/document/value": 1}
+    assert reading.as_doc_changes() == {}
+
+
+def test_only_changed_fields_are_sent():
+    car = Car()
+    car.clear_changes()
+
+    car.battery = 99.5
+    car.secret = "hidden"
+    assert car.changed_fields == {"battery", "secret"}
+    assert car.as_doc_changes("doc") == {"/doc/battery": 99.5}
+    assert car.as_doc_changes("doc") == {}
+
+
+def test_nested_state_change_marks_the_parent_field():
+    car = Car()
+    car.clear_changes()
+
+    car.motor.speed = 10
+    assert car.as_doc_changes() == {"/document/motor": car.motor}
+
+    old_motor = car.motor
+    car.motor = Motor()
+    car.clear_changes()
+    old_motor.speed = 5
+    assert car.as_doc_changes() == {}
+
+
+def test_untracked_mutations_can_be_marked():
+    car = Car()
+    car.clear_changes()
+    car.mark_changed("name")
+    assert car.as_doc_changes(clear=False) == {"/document/name": "car"}
+    assert car.changed_fields == {"name"}
+
+
+@dataclass
+class FlatCar(AliotObjState):
+    name: str = "car"
+    motor: Motor = field(default_factory=Motor, metadata={"flatten": True})
+
+
+class SlotsState(AliotObjState):
+    __slots__ = ("temperature", "humidity")
+
+    def __init__(self):
+        self.temperature = 20
+
+
+def test_flattened_nested_state():
+    car = FlatCar()
+    assert car.as_doc("doc") == {"/doc/name": "car", "/doc/motor/speed": 0, "/doc/motor/direction": "forward"}
+    car.clear_changes()
+
+    car.motor.speed = 3
+    assert car.as_doc_changes("doc") == {"/doc/motor/speed": 3}
+
+
+def test_slots_state():
+    state = SlotsState()
+    assert state.as_doc() == {"/document/temperature": 20}
+    state.humidity = 40
+    assert state.as_doc() == {"/document/temperature": 20, "/document/humidity": 40}
+    assert state.as_doc_changes() == {"/document/temperature": 20, "/document/humidity": 40}
+    assert not hasattr(state, "__dict__")
+
+
+def test_plain_state_uses_its_dict():
+    class PlainState(AliotObjState):
+        def __init__(self):
+            self.a = 1
+
+    state = PlainState()
+    assert state.as_doc("d") == {"/d/a": 1}
+    assert state.as_doc_changes("d") == {"/d/a": 1}
+
+
+def test_sync_state_sends_only_the_changed_fields(connect):
+    obj = AliotObj("test")
+    ws = connect(obj)
+    ws.receive("connect_success")
+    car = FlatCar()
+
+    obj.sync_state(car, "doc")
+    car.motor.speed = 3
+    obj.sync_state(car, "doc")
+    obj.sync_state(car, "doc")
+
+    assert ws.events == [
+        {
+            "event": "update_doc",
+            "data": {"fields": {"/doc/name": "car", "/doc/motor/speed": 0, "/doc/motor/direction": "forward"}},
+        },
+        {"event": "update_doc", "data": {"fields": {"/doc/motor/speed": 3}}},
+    ]
+
+
+@pytest.mark.parametrize("codec", available_codecs(["json", "msgpack", "cbor"]))
+def test_changed_fields_round_trip_through_the_codecs(codec):
+    encoder, decoder = get_codec(codec)
+    car = FlatCar()
+    car.clear_changes()
+    car.name = "Hélène"
+    car.motor.speed = 3
+    message = {"event": "update_doc", "data": {"fields": car.as_doc_changes("doc")}}
+
+    assert decoder.decode(encoder.encode(message)) == {
+        "event": "update_doc",
+        "data": {"fields": {"/doc/name": "Hélène", "/doc/motor/speed": 3}},
+    }